@@ -0,0 +1,402 @@
+"""Local HTTP/JSON control API: lets other processes on the same host (a simulator, a dashboard, a test harness)
+drive a control unit, and a client that keeps a pool of keep-alive connections to it.
+
+    python api.py --user admin --port 8765
+
+    GET    /state                                   the car state
+    GET    /log?kind=&since=&until=&limit=&cursor=  a page of the car log, newest first
+    GET    /users?prefix=&limit=&cursor=            a page of the users
+    GET    /obstacles?type=&lane=&since=&until=&limit=&cursor=
+    GET    /vehicles?type=&direction=&lane=&faster_than=&slower_than=&limit=&cursor=
+    GET    /latency                                 the decision latency summaries
+    POST   /events    one event                     the result of the event
+    POST   /batch     a list of events              the results, in order
+    POST   /users     {"name", "surname", "username"}
+    DELETE /users/<username>
+
+Events are scenario records (see scenario.py): {"kind": "obstacle", "type": "Rock", "lane": 1} as seen by the LiDAR,
+{"kind": "vehicle", ...} as reported to the V2V module, {"kind": "sign", "code": 1} as recognised by the TSRS, or
+{"kind": "command", "command": "change_lane", "lane": 2}. Results are those of cli.py. Pages hold "items" and the
+"next" cursor; a page holds at most MAX_LIMIT items. Requests are handled on a thread each, and every request (a
+whole batch included) holds the session's lock while it reads or changes the car, so concurrent clients never lose
+an update. The server only listens on the loopback interface unless told otherwise.
+"""
+
+import argparse
+import http.client
+import json
+import queue
+import select
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import time
+from urllib.parse import parse_qsl, quote, unquote, urlencode, urlsplit
+
+from cli import BatchRunner
+from driverless_car import LANES, USER_DB_PATH, Session, User
+from history import page_limit
+from scenario import ScenarioError, to_event
+from userstore import UserStore
+
+DEFAULT_PORT = 8765
+MAX_LIMIT = 1000  # Largest page a listing returns, so a request can't read a whole history at once
+IDEMPOTENT = ('GET',)  # Methods a client may send again when it can't tell whether the server got them
+
+
+def _direction(value):
+    direction = value.upper()
+    if direction not in ('N', 'S'):
+        raise ValueError(f"Invalid direction: {value!r} (expected N or S)")
+    return direction
+
+
+def _limit(value):
+    return min(page_limit(int(value)), MAX_LIMIT)  # ValueError below 1
+
+
+def _lane(value):
+    lane = int(value)
+    if lane not in LANES:
+        raise ValueError(f"Invalid lane: {value!r} (expected one of {', '.join(map(str, LANES))})")
+    return lane
+
+
+# Query parameter -> converter, for the listing endpoints
+PARAMETERS = {'kind': str, 'prefix': str, 'type': str, 'direction': _direction, 'lane': _lane, 'limit': _limit,
+              'since': float, 'until': float, 'faster_than': float, 'slower_than': float}
+# Listing -> converter of its cursor: the users are paged by username, the others by record or entry number
+CURSORS = {'log': int, 'users': str, 'obstacles': int, 'vehicles': int}
+
+
+class APIError(Exception):
+    """An error answered with an HTTP status and a message."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _obstacle(obstacle):
+    return {'type': obstacle.type, 'lane': obstacle.lane, 'timestamp': obstacle.timestamp,
+            'position': obstacle.position}
+
+
+def _vehicle(vehicle):
+    return {'type': vehicle.type, 'direction': vehicle.direction, 'lane': vehicle.lane,
+            'velocity': vehicle.velocity, 'position': vehicle.position}
+
+
+def _user(user):
+    return {'name': user.name, 'surname': user.surname, 'username': user.username}
+
+
+class ControlService:
+    """The operations of the API on one session, each under the session's lock."""
+
+    def __init__(self, session):
+        self.session = session
+        self.runner = BatchRunner(session)
+        self.lock = threading.Lock()
+
+    def _event(self, record, index):
+        if not isinstance(record, dict):
+            raise ValueError(f"Event {index}: expected a JSON object")
+        if record.get('kind') == 'command':
+            lane = record.get('lane')
+            if lane is not None and (isinstance(lane, bool) or lane not in LANES):
+                raise ValueError(f"Event {index}: invalid lane {lane!r} (expected one of {', '.join(map(str, LANES))})")
+            return self.runner.command(f"{record.get('command')}{'' if lane is None else f' {lane}'}")
+        record.setdefault('time', time())
+        try:
+            event = to_event(record, index)
+        except ScenarioError as error:
+            raise ValueError(str(error).replace('Line', 'Event', 1)) from None
+        self.runner.engine.send(event)
+
+    def event(self, record, index=1):
+        with self.lock:
+            return self.runner.perform(lambda: self._event(record, index), event=index)
+
+    def batch(self, records):
+        if not isinstance(records, list):
+            raise APIError(400, "Expected a JSON list of events")
+        with self.lock:  # The batch is carried out as a whole, without other requests in between
+            return [self.runner.perform(lambda: self._event(record, index), event=index)
+                    for index, record in enumerate(records, start=1)]
+
+    def state(self):
+        with self.lock:
+            car = self.session.car
+            return {'status': self.session.control_unit.status, 'lane': car.lane, 'direction': car.direction,
+                    'velocity': car.velocity, 'position': car.position}
+
+    def log(self, kind=None, since=None, until=None, limit=50, cursor=None):
+        limit = page_limit(limit)
+        with self.lock:
+            entries = self.session.control_unit.log.query(kind, since, until, cursor, limit + 1)
+        items = [{'seq': entry.seq, 'time': entry.time, 'kind': entry.kind, 'message': entry.text}
+                 for entry in entries[:limit]]
+        return {'items': items, 'next': items[-1]['seq'] if len(entries) > limit else None}
+
+    def users(self, prefix='', limit=50, cursor=None):
+        with self.lock:
+            page = self.session.control_unit.users.page(prefix, cursor, limit)
+        return {'items': [_user(user) for user in page.items], 'next': page.next}
+
+    def obstacles(self, type=None, lane=None, since=None, until=None, limit=50, cursor=None):
+        with self.lock:
+            page = self.session.control_unit.obstacles.query(type, lane, since, until, limit, cursor)
+        return {'items': [_obstacle(obstacle) for obstacle in page.items], 'next': page.next}
+
+    def vehicles(self, type=None, direction=None, lane=None, faster_than=None, slower_than=None, limit=50,
+                 cursor=None):
+        with self.lock:
+            page = self.session.v2vcomms.vehicles.query(type, direction, lane, faster_than, slower_than, limit,
+                                                        cursor)
+        return {'items': [_vehicle(vehicle) for vehicle in page.items], 'next': page.next}
+
+    def latency(self):
+        latency = self.session.control_unit.latency
+        if latency is None:
+            return None
+        with self.lock:
+            return {kind: latency[kind].summary() for kind in ('obstacle', 'vehicle', 'sign')}
+
+    def add_user(self, record):
+        try:
+            name, surname, username = record['name'], record['surname'], record['username']
+        except (KeyError, TypeError):
+            raise APIError(400, "Expected name, surname and username") from None
+        with self.lock:
+            return self.runner.perform(lambda: self.session.control_unit.register_user(name, surname, username))
+
+    def delete_user(self, username):
+        with self.lock:
+            return self.runner.perform(lambda: self.session.control_unit.remove_user(username))
+
+
+class ControlRequestHandler(BaseHTTPRequestHandler):
+    """Maps the requests to the ControlService of the server."""
+
+    protocol_version = 'HTTP/1.1'  # Keeps the connections alive between requests
+    disable_nagle_algorithm = True  # The headers and the body are separate writes; don't wait for an ACK between
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            return json.loads(self.rfile.read(length) or b'null')
+        except json.JSONDecodeError as error:
+            raise APIError(400, f"Invalid JSON: {error}") from None
+
+    def _handle(self, route):
+        url = urlsplit(self.path)
+        parts = url.path.strip('/').split('/')
+        try:
+            self._reply(200, route(self.server.service, parts, dict(parse_qsl(url.query))))
+        except APIError as error:
+            self._reply(error.status, {'error': str(error)})
+        except (ValueError, TypeError) as error:
+            self._reply(400, {'error': str(error)})
+        except Exception as error:  # A bug, not a bad request: answered rather than dropping the connection
+            self._reply(500, {'error': f"Internal error: {type(error).__name__}: {error}"})
+
+    def _get(self, service, parts, query):
+        if parts == ['state']:
+            return service.state()
+        if parts == ['latency']:
+            return service.latency()
+        if len(parts) == 1 and parts[0] in CURSORS:
+            converters = dict(PARAMETERS, cursor=CURSORS[parts[0]])
+            unknown = set(query) - set(converters)
+            if unknown:
+                raise APIError(400, f"Unknown parameters: {', '.join(sorted(unknown))}")
+            return getattr(service, parts[0])(**{name: converters[name](value) for name, value in query.items()})
+        raise APIError(404, f"No such resource: {self.path}")
+
+    def _post(self, service, parts, query):
+        if parts == ['events']:
+            return service.event(self._body())
+        if parts == ['batch']:
+            return service.batch(self._body())
+        if parts == ['users']:
+            return service.add_user(self._body())
+        raise APIError(404, f"No such resource: {self.path}")
+
+    def _delete(self, service, parts, query):
+        if len(parts) == 2 and parts[0] == 'users':
+            return service.delete_user(unquote(parts[1]))
+        raise APIError(404, f"No such resource: {self.path}")
+
+    def do_GET(self):
+        self._handle(self._get)
+
+    def do_POST(self):
+        self._handle(self._post)
+
+    def do_DELETE(self):
+        self._handle(self._delete)
+
+    def log_message(self, format, *args):
+        pass  # No line per request on stderr
+
+
+class ControlServer(ThreadingHTTPServer):
+    """Serves the control API of a session on a thread per connection."""
+
+    daemon_threads = True
+
+    def __init__(self, session, host='127.0.0.1', port=DEFAULT_PORT):
+        super().__init__((host, port), ControlRequestHandler)
+        self.service = ControlService(session)
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        """Serves requests on a background thread. Returns the thread."""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class ControlClient:
+    """A client of the control API. It keeps up to pool_size keep-alive connections, so threads can share it and
+    requests don't pay for a new connection each."""
+
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, pool_size=4, timeout=10.0):
+        self.host, self.port, self.timeout = host, port, timeout
+        self._pool = queue.LifoQueue(pool_size)  # Idle connections, most recently used first
+
+    def _connection(self):
+        """Returns an idle connection and True, or a new connection and False. An idle connection the server has
+        closed (its socket reads as ready) is dropped."""
+        while True:
+            try:
+                connection = self._pool.get_nowait()
+            except queue.Empty:
+                return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout), False
+            if connection.sock is not None and not select.select([connection.sock], [], [], 0)[0]:
+                return connection, True
+            connection.close()
+
+    def _release(self, connection):
+        try:
+            self._pool.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def request(self, method, path, body=None):
+        """Sends a request and returns the decoded JSON answer. Raises APIError for an error status."""
+        data = None if body is None else json.dumps(body).encode()
+        headers = {'Content-Type': 'application/json'} if data is not None else {}
+        while True:
+            connection, reused = self._connection()
+            sent = False
+            try:
+                connection.request(method, path, data, headers)
+                sent = True
+                response = connection.getresponse()
+                answer = json.loads(response.read())
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                connection.close()
+                # An idle connection the server closed meanwhile is replaced, but a request that may have been
+                # carried out is only sent again if it changes nothing
+                if not reused or (sent and method not in IDEMPOTENT):
+                    raise
+                continue
+            except BaseException:
+                connection.close()
+                raise
+            self._release(connection)
+            if response.status != 200:
+                raise APIError(response.status, answer.get('error', response.reason))
+            return answer
+
+    def _get(self, resource, **parameters):
+        query = urlencode({name: value for name, value in parameters.items() if value is not None})
+        return self.request('GET', f'/{resource}' + (f'?{query}' if query else ''))
+
+    def state(self):
+        return self.request('GET', '/state')
+
+    def send(self, event):
+        """Sends one event (a scenario record) and returns its result."""
+        return self.request('POST', '/events', event)
+
+    def batch(self, events):
+        """Sends a list of events in one request and returns their results."""
+        return self.request('POST', '/batch', list(events))
+
+    def command(self, command, lane=None):
+        event = {'kind': 'command', 'command': command}
+        if lane is not None:
+            event['lane'] = lane
+        return self.send(event)
+
+    def log(self, **filters):
+        return self._get('log', **filters)
+
+    def users(self, **filters):
+        return self._get('users', **filters)
+
+    def obstacles(self, **filters):
+        return self._get('obstacles', **filters)
+
+    def vehicles(self, **filters):
+        return self._get('vehicles', **filters)
+
+    def latency(self):
+        return self.request('GET', '/latency')
+
+    def add_user(self, name, surname, username):
+        return self.request('POST', '/users', {'name': name, 'surname': surname, 'username': username})
+
+    def delete_user(self, username):
+        return self.request('DELETE', f'/users/{quote(username, safe="")}')
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serves the control API of a headless session.")
+    parser.add_argument('--user', required=True, help="username the session is logged in with")
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on (default: loopback only)")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--userdb', default=USER_DB_PATH, help="user database file")
+    args = parser.parse_args()
+
+    session = Session(userdb=UserStore(args.userdb, User), verbose=False)
+    if not session.control_unit.auth(args.user):
+        parser.exit(2, f"The user {args.user!r} is not authorized to use the system.\n")
+    server = ControlServer(session, args.host, args.port)
+    print(f"Serving the control API on http://{args.host}:{server.port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
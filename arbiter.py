@@ -0,0 +1,75 @@
+"""Serializes the updates of a car's state between threads.
+
+Sensors running on threads of their own hand their events to the control unit at any time, and every decision and
+driving command reads the car state and changes it. So the updates of a car are applied one at a time under the
+car's lock: none is lost and none sees another half done. An update that finds the car free is applied at once by
+its own thread. Updates that arrive while the car is busy wait in a heap, and as soon as the car is free they are
+applied in a fixed order, by priority (see PRIORITIES) and then by arrival, by whichever thread holds the lock. So
+when two sensors ask for a lane change at the same instant the obstacle is always dealt with first, whatever order
+the threads happen to be scheduled in, and the other request is decided on the lane the car has moved to.
+"""
+
+import threading
+from contextlib import contextmanager
+from heapq import heappop, heappush
+from itertools import count
+
+# Kind of update -> priority (lowest first) among the updates waiting for the car
+PRIORITIES = {'obstacle': 0, 'vehicle': 1, 'sign': 2, 'command': 3}
+
+
+class CarArbiter:
+    """The lock of one car's state and the updates waiting for it."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._heap_lock = threading.Lock()  # Only held to push or pop a waiting update
+        self._waiting = []  # [priority, arrival, function, args, result, error] entries
+        self._arrivals = count()
+        self.contended = 0  # Updates that found the car busy and had to wait
+
+    def submit(self, priority, function, *args):
+        """Applies function(*args) under the car's lock. Returns its result, or raises its exception, in the
+        calling thread."""
+        lock = self._lock
+        if lock.acquire(False):
+            try:
+                return function(*args)
+            finally:
+                if self._waiting:
+                    self._release()
+                else:
+                    lock.release()  # Anything queued after this check is applied by its own thread
+        with self._heap_lock:
+            entry = [priority, next(self._arrivals), function, args, None, None]
+            heappush(self._waiting, entry)
+            self.contended += 1
+        self._lock.acquire()
+        self._release()  # Applies the entry unless a thread that held the lock before has done it already
+        if entry[5] is not None:
+            raise entry[5]
+        return entry[4]
+
+    def _release(self):
+        """Applies the waiting updates in order, then frees the car."""
+        waiting = self._waiting
+        try:
+            while waiting:  # Only the lock holder pops, so the heap can't empty under it
+                with self._heap_lock:
+                    entry = heappop(waiting)
+                try:
+                    entry[4] = entry[2](*entry[3])
+                except Exception as error:  # Raised again in the thread that submitted the update
+                    entry[5] = error
+        finally:
+            self._lock.release()
+
+    @contextmanager
+    def exclusive(self):
+        """Holds the car for the body of a with statement, e.g. to read a consistent state. The updates that
+        arrive meanwhile are applied in order when it ends."""
+        self._lock.acquire()
+        try:
+            yield
+        finally:
+            self._release()
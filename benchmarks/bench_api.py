@@ -0,0 +1,87 @@
+"""Checks the control API against a server on localhost: concurrent clients must not lose car state updates, and
+batching must cut the per-event cost. Reports events per second for single-event requests and for batches, then
+checks that the listings reject a limit below 1 and cap a large one.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_api [--clients 8] [--requests 500] [--batch 100]
+"""
+
+import argparse
+import threading
+from time import perf_counter
+
+from api import MAX_LIMIT, APIError, ControlClient, ControlServer
+from driverless_car import Session
+
+EVENTS = [{'kind': 'obstacle', 'type': 'Rock', 'lane': 1}, {'kind': 'vehicle', 'type': 'Car', 'direction': 'S',
+                                                              'lane': 2, 'velocity': 90},
+          {'kind': 'sign', 'code': 5}, {'kind': 'command', 'command': 'accelerate'}]
+
+
+def concurrent(client, clients, requests, send):
+    """Runs send(client, i) `requests` times on each of `clients` threads sharing the client. Returns the time
+    taken."""
+    def work():
+        for i in range(requests):
+            send(client, i)
+    threads = [threading.Thread(target=work) for _ in range(clients)]
+    start = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return perf_counter() - start
+
+
+def check_limits(client):
+    """Asks every listing for pages of 0, -1 and a million items. Returns the failed checks: the first two must be
+    answered with a 400 and the last one with at most MAX_LIMIT items (exactly that many from the log, which holds
+    more, and a cursor)."""
+    failed = []
+    for listing in ('log', 'users', 'obstacles', 'vehicles'):
+        for limit in (0, -1):
+            try:
+                client.request('GET', f'/{listing}?limit={limit}')
+                failed.append(f"/{listing}?limit={limit} was answered")
+            except APIError as error:
+                if error.status != 400:
+                    failed.append(f"/{listing}?limit={limit}: status {error.status} instead of 400")
+        page = client.request('GET', f'/{listing}?limit=1000000')
+        if len(page['items']) > MAX_LIMIT or \
+                (listing == 'log' and (len(page['items']) != MAX_LIMIT or page['next'] is None)):
+            failed.append(f"/{listing}?limit=1000000: {len(page['items'])} items, next {page['next']}")
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=500, help="requests per client")
+    parser.add_argument('--batch', type=int, default=100, help="events per batch")
+    args = parser.parse_args()
+
+    server = ControlServer(Session(verbose=False), port=0)  # Any free port on the loopback interface
+    server.start()
+    with ControlClient(port=server.port, pool_size=args.clients) as client:
+        client.command('start')
+
+        # Lost updates: every accelerate adds 10 km/h, so the final speed tells whether any went missing
+        elapsed = concurrent(client, args.clients, args.requests, lambda client, i: client.command('accelerate'))
+        expected = 60 + 10 * args.clients * args.requests
+        velocity = client.state()['velocity']
+        print(f"{args.clients} clients x {args.requests} accelerate requests: speed {velocity} km/h, expected "
+              f"{expected} ({'no lost updates' if velocity == expected else 'UPDATES LOST'})")
+        single = args.clients * args.requests / elapsed
+
+        batch = [EVENTS[i % len(EVENTS)] for i in range(args.batch)]
+        batches = max(1, args.requests // 10)
+        elapsed = concurrent(client, args.clients, batches, lambda client, i: client.batch(batch))
+        batched = args.clients * batches * args.batch / elapsed
+        print(f"Single-event requests: {single:>10,.0f} events/s")
+        print(f"Batches of {args.batch:<4}:       {batched:>10,.0f} events/s  ({batched / single:.0f}x)")
+        failed = check_limits(client)
+        print("Page limits: " + ('; '.join(failed) or f"below 1 rejected, capped at {MAX_LIMIT}"))
+    server.stop()
+    if velocity != expected or failed:
+        raise SystemExit(1)
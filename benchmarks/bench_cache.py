@@ -0,0 +1,51 @@
+"""Measures events per second through a headless engine without and with the LRU decision cache, on a synthetic
+scenario of a million events where the same car states and events keep coming back.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_cache [--events 1000000] [--sizes 64 1024]
+"""
+
+import argparse
+import random
+from time import perf_counter
+
+from driverless_car import Car, ControlUnit, Obstacle, SimulationEngine, TrafficSign, User, Vehicle
+
+
+def synthetic_events(count, seed=1):
+    """Returns `count` events drawn from a fixed set of obstacles, vehicles and signs, so combinations repeat."""
+    rng = random.Random(seed)
+    pool = ([Obstacle(kind, lane, 0.0) for kind in ('Rock', 'Pedestrian') for lane in (1, 2, 3)]
+            + [Vehicle('Car', direction, lane, velocity) for direction in 'NS' for lane in (1, 2, 3)
+               for velocity in (40, 60, 80, 100, 120)]
+            + [TrafficSign(code, f'Sign {code}') for code in (1, 2, 4, 5)])
+    speed_ups = [TrafficSign(5, 'Minimum')] * 2  # Keeps the car moving after stop and slippery signs
+    return [rng.choice(pool) if i % 10 else rng.choice(speed_ups) for i in range(count)]
+
+
+def run(events, cache_size):
+    """Runs the events through a new headless engine. Returns events/s, the final state and the cache stats."""
+    control_unit = ControlUnit(User('John', 'Doe', 'admin'), Car('Car', 'N', 1), verbose=False,
+                               decision_cache=cache_size)
+    engine = SimulationEngine(control_unit)
+    engine.start()
+    start = perf_counter()
+    engine.run(events)
+    return len(events) / (perf_counter() - start), engine.state(), control_unit.cache_stats()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=1_000_000)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[64, 1024])
+    args = parser.parse_args()
+
+    events = synthetic_events(args.events)
+    baseline, state, _ = run(events, None)
+    print(f"No cache:          {baseline:>12,.0f} events/s")
+    for size in args.sizes:
+        rate, cached_state, stats = run(events, size)
+        print(f"Cache of {size:<6}    {rate:>12,.0f} events/s  ({rate / baseline:.2f}x)  "
+              f"hit rate {stats['hit_rate']:.1%}, {stats['evictions']:,} evictions, "
+              f"{'same' if cached_state == state else 'DIFFERENT'} final state")
@@ -0,0 +1,55 @@
+"""Streams a million car log entries and a million detected vehicles to CSV (and Parquet when pyarrow is installed)
+and reports rows per second and the peak memory allocated while exporting, which stays flat as the stores grow.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_export [--rows 1000000]
+"""
+
+import argparse
+import os
+import tempfile
+import tracemalloc
+from time import perf_counter
+
+from carlog import CarLog, Event
+from driverless_car import Car, ControlUnit, User, V2VComms, Vehicle
+
+
+def measure(export, path):
+    """Runs export(path) twice: timed, then traced (tracemalloc slows it down). Returns rows/s and the peak
+    memory allocated while exporting (MiB)."""
+    start = perf_counter()
+    count = export(path)
+    elapsed = perf_counter() - start
+    tracemalloc.start()
+    export(path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return count / elapsed, peak / 2 ** 20
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    control_unit = ControlUnit(User('John', 'Doe', 'admin'), Car('Car', 'N', 1), verbose=False,
+                               log=CarLog(capacity=args.rows))
+    comms = V2VComms()
+    for i in range(args.rows):
+        control_unit.update_log(Event.VEHICLE_LANE_CHANGED, 2, 'S', 2, 1)
+        comms.update_db(Vehicle('Car', 'NS'[i % 2], i % 3 + 1, 60 + i % 7 * 10, float(i)))
+
+    try:
+        import pyarrow  # noqa: F401
+        formats = ('csv', 'parquet')
+    except ImportError:
+        formats = ('csv',)
+    with tempfile.TemporaryDirectory() as directory:
+        for name, export in (('log', control_unit.export_log), ('vehicles', comms.export_vehicles)):
+            for extension in formats:
+                path = os.path.join(directory, f'{name}.{extension}')
+                rate, peak = measure(export, path)
+                print(f"{name:<9} {extension:<8} {rate:>12,.0f} rows/s  peak {peak:>6.1f} MiB  "
+                      f"file {os.path.getsize(path) / 2 ** 20:>6.1f} MiB")
@@ -0,0 +1,85 @@
+"""Checks the vectorized fleet against the scalar control unit and measures fleet throughput in car-ticks per second.
+
+The check runs with the rules of rules.json and with rules tuned as in a parameter sweep (see sweep.py), which the
+fleet must follow as the control unit does.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_fleet [--cars 1000000] [--ticks 20]
+"""
+
+import argparse
+from time import perf_counter
+
+import numpy as np
+
+from driverless_car import Car, ControlUnit, Obstacle, SimulationEngine, TrafficSign, User, Vehicle
+from fleet import DIRECTIONS, OBSTACLE, SIGN, VEHICLE, Fleet
+from sweep import tuned_rules
+
+
+def random_tick(rng, size):
+    """Returns the (kind, lane, direction, velocity, code) arrays of a tick where every car gets a random event."""
+    return (rng.integers(0, 4, size, dtype=np.int8), rng.integers(1, 4, size, dtype=np.int8),
+            rng.integers(0, 2, size, dtype=np.int8), rng.integers(0, 161, size).astype(np.float64),
+            rng.integers(1, 6, size, dtype=np.int8))
+
+
+def check_equivalence(cars=2000, ticks=50, seed=1, rules=None):
+    """Runs the same random events through the fleet and through one headless engine per car, both deciding with
+    the given rules (rules.json by default), and compares the resulting states. Returns the number of mismatching
+    cars."""
+    rng = np.random.default_rng(seed)
+    engines = [SimulationEngine(ControlUnit(User('John', 'Doe', 'admin'), Car('Car', 'N', 1), verbose=False,
+                                            rules=rules))
+               for _ in range(cars)]
+    for engine in engines:
+        engine.start()
+        car = engine.control_unit.car
+        car.lane, car.direction = int(rng.integers(1, 4)), DIRECTIONS[rng.integers(0, 2)]
+        car.velocity = int(rng.integers(0, 17)) * 10
+    fleet = Fleet.from_cars((engine.control_unit.car for engine in engines), rules)
+    for _ in range(ticks):
+        kind, lane, direction, velocity, code = random_tick(rng, cars)
+        fleet.step(kind, lane, direction, velocity, code)
+        for i, engine in enumerate(engines):
+            if kind[i] == OBSTACLE:
+                engine.send(Obstacle('Rock', int(lane[i]), 0))
+            elif kind[i] == VEHICLE:
+                engine.send(Vehicle('Car', DIRECTIONS[direction[i]], int(lane[i]), int(velocity[i])))
+            elif kind[i] == SIGN:
+                engine.send(TrafficSign(int(code[i])))
+    mismatches = 0
+    for i, engine in enumerate(engines):
+        _, lane, direction, velocity = engine.state()
+        car = fleet.car(i)
+        if (lane, direction, velocity) != (car.lane, car.direction, car.velocity):
+            mismatches += 1
+    return mismatches
+
+
+def bench_fleet(cars, ticks, seed=2):
+    """Returns the fleet throughput in car-ticks per second."""
+    rng = np.random.default_rng(seed)
+    fleet = Fleet(cars)
+    events = [random_tick(rng, cars) for _ in range(ticks)]
+    start = perf_counter()
+    for tick in events:
+        fleet.step(*tick)
+    return cars * ticks / (perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cars', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--ticks', type=int, default=20)
+    args = parser.parse_args()
+
+    mismatches = {'rules.json': check_equivalence(),
+                  'lane_split=70, slippery=0.2': check_equivalence(rules=tuned_rules(lane_split=70, slippery=0.2))}
+    for rules, count in mismatches.items():
+        print(f"Mismatches against the scalar control unit ({rules}): {count}")
+    for size in args.cars:
+        print(f"{size:>9} cars: {bench_fleet(size, args.ticks):>14,.0f} car-ticks/s")
+    if any(mismatches.values()):
+        raise SystemExit("The fleet and the scalar control unit disagree.")
@@ -0,0 +1,77 @@
+"""Compares events per second through a headless control unit with eager log formatting (the previous
+update_log, which built the message and the date string on every call) and with structured, lazily formatted
+log records. It first checks that a log filled past its capacity without a spill directory still returns its
+latest entries.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_log [--events 300000]
+"""
+
+import argparse
+from datetime import datetime
+from time import perf_counter
+
+from carlog import MESSAGES, TIME_FORMAT, CarLog, Event
+from driverless_car import Car, ControlUnit, Obstacle, SimulationEngine, TrafficSign, User, Vehicle
+
+
+class EagerLogControlUnit(ControlUnit):
+    """A control unit that logs the way update_log used to: formatted text and date string in a plain list."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._log = []
+
+    def update_log(self, code, *args):
+        self._log.append([MESSAGES[code][1].format(*args), datetime.now().strftime(TIME_FORMAT)])
+
+
+def check_retention(capacities=(1, 5, 16, 1000, 10_000)):
+    """Fills logs of the given capacities with three times as many entries as they hold, without a spill
+    directory. Returns the failed checks: the log must still hold at least 7/8 of its capacity (all of it for a
+    log of one entry), and those must be the latest entries, newest first."""
+    failed = []
+    for capacity in capacities:
+        log = CarLog(capacity=capacity)
+        total = 3 * capacity + 7
+        for speed in range(total):
+            log.append(Event.ACCELERATED, (speed,))
+        kept = [entry.args[0] for entry in log.query(limit=capacity)]
+        if len(kept) < max(1, capacity * 7 // 8) or kept != list(range(total - 1, total - 1 - len(kept), -1)):
+            failed.append(f"capacity {capacity}: kept {len(kept)} entries, newest {kept[:3]}")
+        elif len(log) != len(kept) or [entry.args[0] for entry in log] != kept:
+            failed.append(f"capacity {capacity}: len() and iteration disagree with query()")
+    return failed
+
+
+def mixed_events(count):
+    """Returns a repeating mix of obstacles, vehicles and traffic signs."""
+    pattern = [Obstacle('Rock', 1, 0.0), Vehicle('Car', 'S', 2, 90), TrafficSign(2, 'Speed Limit (90 km/H)'),
+               Obstacle('Pedestrian', 2, 0.0), Vehicle('Truck/Lorry', 'N', 1, 120), TrafficSign(5, 'Minimum')]
+    return [pattern[i % len(pattern)] for i in range(count)]
+
+
+def events_per_second(control_unit_class, events):
+    control_unit = control_unit_class(User('John', 'Doe', 'admin'), Car('Car', 'N', 1), verbose=False)
+    engine = SimulationEngine(control_unit)
+    engine.start()
+    start = perf_counter()
+    engine.run(events)
+    return len(events) / (perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=300_000)
+    args = parser.parse_args()
+
+    failed = check_retention()
+    print("Retention without a spill directory: " + ('; '.join(failed) or "latest entries kept"))
+    if failed:
+        raise SystemExit(1)
+    events = mixed_events(args.events)
+    before = events_per_second(EagerLogControlUnit, events)
+    after = events_per_second(ControlUnit, events)
+    print(f"Eager log (before):      {before:>12,.0f} events/s")
+    print(f"Structured log (after):  {after:>12,.0f} events/s  ({after / before:.1f}x)")
@@ -0,0 +1,103 @@
+"""Measures the memory taken per retained detection: a list of objects with a __dict__ (the previous layout), a list
+of the slotted Obstacle and Vehicle objects, and the columnar histories of history.py.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_memory [--records 200000]
+"""
+
+import argparse
+import random
+import tracemalloc
+
+from driverless_car import OBSTACLE_TYPES, VEHICLE_TYPES, Obstacle, TrafficSign, Vehicle
+from history import ObstacleHistory, VehicleHistory
+
+
+class DictObstacle:
+    """An obstacle laid out as before: attributes in a per-instance __dict__."""
+
+    def __init__(self, type, lane, timestamp, position=None):
+        self._type = type
+        self._lane = lane
+        self._timestamp = timestamp
+        self._position = position
+
+
+class DictVehicle:
+    """A vehicle laid out as before: attributes in a per-instance __dict__."""
+
+    def __init__(self, type, direction, lane, velocity=0, position=None):
+        self._type = type
+        self._velocity = velocity
+        self._direction = direction
+        self._lane = lane
+        self._position = position
+
+
+class DictTrafficSign:
+    """A traffic sign laid out as before: attributes in a per-instance __dict__."""
+
+    def __init__(self, type=None, desc=None):
+        self._type = type
+        self._desc = desc
+
+
+def measure(build):
+    """Returns the bytes allocated while building a container, and the container."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    container = build()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used, container
+
+
+def detections(count, seed=1):
+    """Returns the fields of `count` obstacles and vehicles, as the sensors report them."""
+    rng = random.Random(seed)
+    obstacles = [(rng.choice(list(OBSTACLE_TYPES.values())), rng.randint(1, 3), 1.7e9 + i * 0.01,
+                  rng.uniform(0, 5000)) for i in range(count)]
+    vehicles = [(rng.choice(list(VEHICLE_TYPES.values())), rng.choice('NS'), rng.randint(1, 3),
+                 rng.randrange(0, 161), rng.uniform(0, 5000)) for _ in range(count)]
+    return obstacles, vehicles
+
+
+def fresh(records):
+    """Yields the records with new float objects, as each detection owns its timestamp, velocity and position."""
+    for fields in records:
+        yield tuple(field * 1.0 if isinstance(field, float) else field for field in fields)
+
+
+def columnar(history, records, record_class):
+    for fields in fresh(records):
+        history.append(record_class(*fields))
+    return history
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=200_000)
+    args = parser.parse_args()
+
+    count = args.records
+    obstacles, vehicles = detections(count)
+    signs = [(i % 5 + 1, 'Stop') for i in range(count)]
+    layouts = [
+        ('Obstacle', [
+            ('__dict__ objects', lambda: [DictObstacle(*fields) for fields in fresh(obstacles)]),
+            ('__slots__ objects', lambda: [Obstacle(*fields) for fields in fresh(obstacles)]),
+            ('columnar history', lambda: columnar(ObstacleHistory(OBSTACLE_TYPES, Obstacle), obstacles, Obstacle))]),
+        ('Vehicle', [
+            ('__dict__ objects', lambda: [DictVehicle(*fields) for fields in fresh(vehicles)]),
+            ('__slots__ objects', lambda: [Vehicle(*fields) for fields in fresh(vehicles)]),
+            ('columnar history', lambda: columnar(VehicleHistory(VEHICLE_TYPES, Vehicle), vehicles, Vehicle))]),
+        ('TrafficSign', [
+            ('__dict__ objects', lambda: [DictTrafficSign(*fields) for fields in signs]),
+            ('__slots__ objects', lambda: [TrafficSign(*fields) for fields in signs])]),
+    ]
+    print(f"Bytes per record ({count:,} records, fields included, type names shared):")
+    for name, builds in layouts:
+        for layout, build in builds:
+            used, _ = measure(build)
+            print(f"  {name:<12} {layout:<18} {used / count:>7.1f}")
@@ -0,0 +1,223 @@
+"""Checks the rule table decisions against the nested if/else rules the control unit used before, and measures
+decisions per second with both.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_rules [--events 300000]
+"""
+
+import argparse
+import io
+from contextlib import redirect_stdout
+from itertools import product
+from time import perf_counter
+
+from carlog import Event
+from driverless_car import Car, ControlUnit, Obstacle, TrafficSign, User, Vehicle
+from rules import default_rules
+
+# Speeds on both sides of every threshold, including a speed the slippery road sign leaves
+SPEEDS = (0, 10, 42.0, 49, 49.99, 50, 50.5, 59, 60, 60.01, 61, 70, 79, 79.5, 80, 81, 90, 99, 100, 100.5, 101, 160)
+
+
+class TreeControlUnit(ControlUnit):
+    """A control unit deciding with the nested if/else rules that rules.json replaced."""
+
+    def eval_sign(self, sign):
+        """Evaluates the sign received from the TSRS and takes necessary actions."""
+        # Unpacking the object attributes to variables for easier processing
+        code = sign.type
+        desc = sign.desc
+
+        if code == 1:
+            if self._car.velocity <= 60:
+                self.notify(f"\nCar's speed is {self._car.velocity}. No action is taken.\n")
+                self.update_log(Event.SIGN_BELOW_LIMIT, desc)
+            else:
+                self._car.velocity = 60
+                self.notify("\nCar's speed is set to 60 km/h.\n")
+                self.update_log(Event.SIGN_LIMIT_60, desc)
+        elif code == 2:
+            if self._car.velocity <= 100:
+                self.notify(f"\nCar's speed is {self._car.velocity}. No action is taken.\n")
+                self.update_log(Event.SIGN_SPEED_KEPT, desc, self._car.velocity)
+            else:
+                self._car.velocity = 100
+                self.notify("\nCar's speed is set to 100 km/h.\n")
+                self.update_log(Event.SIGN_LIMIT_100, desc)
+        elif code == 3:
+            if self._car.velocity == 0:
+                self.notify("\nThe car has already been stopped. No action taken.\n")
+                self.update_log(Event.SIGN_ALREADY_STOPPED, desc)
+            else:
+                self._car.velocity = 0
+                self.notify("\nThe car has been stopped.\n")
+                self.update_log(Event.SIGN_STOPPED, desc)
+        elif code == 4:
+            if self._car.velocity == 0:
+                self.notify("\nThe car is not moving. No action is taken.\n")
+                self.update_log(Event.SIGN_NOT_MOVING, desc)
+            else:
+                self._car.velocity = self._car.velocity * 0.7
+                self.notify(
+                    f"\nDue to slippery road, the speed of the car is reduced 30%. The current speed of the car is {self._car.velocity}.\n")
+                self.update_log(Event.SIGN_SLIPPERY, desc, self._car.velocity)
+        elif code == 5:
+            if self._car.velocity >= 50:
+                self.notify(f"\nCar's speed is {self._car.velocity}. No action is taken.\n")
+                self.update_log(Event.SIGN_ABOVE_MINIMUM, desc, self._car.velocity)
+            else:
+                self._car.velocity = 50
+                self.notify("\nCar's speed is set to 60 km/h.\n")
+                self.update_log(Event.SIGN_MINIMUM, desc, self._car.velocity)
+
+        # No corner cases are included here, as the input is already checked for validity via try/except statements.
+
+    def eval_veh(self, veh):
+        """Evaluates the vehicle detected by V2V Communications module and takes the necessary action."""
+        # Compares the car's information against the vehicle detected
+        if veh.direction != self._car.direction:  # If the vehicle and the car detected travel in opposite directions
+            if veh.lane == self._car.lane:  # If they are approaching each other on the same lane
+                if self._car.lane == 1:
+                    self._car.lane = 2
+                    self.notify("\nThe car changed its lane from 1 to 2.\n")
+                    self.update_log(Event.VEHICLE_LANE_CHANGED, veh.lane, veh.direction, 1, 2)
+                elif self._car.lane == 2:
+                    if self._car.velocity < 80:  # If the velocity is less than 80, car changes its lane to the slowest one.
+                        self._car.lane = 1
+                        self.notify("\nThe car changed its lane from 2 to 1.\n")
+                        self.update_log(Event.VEHICLE_LANE_CHANGED, veh.lane, veh.direction, 2, 1)
+                    else:
+                        self._car.lane = 3
+                        self.notify("\nThe car changed its lane from 2 to 3.\n")
+                        self.update_log(Event.VEHICLE_LANE_CHANGED, veh.lane, veh.direction, 2, 3)
+                else:
+                    self._car.lane = 2
+                    self.notify("\nThe car changed its lane from 3 to 2.\n")
+                    self.update_log(Event.VEHICLE_LANE_CHANGED, veh.lane, veh.direction, 3, 2)
+            else:
+                self.notify("\nThe cars are on different lanes, no action has been taken.\n")
+                self.update_log(Event.VEHICLE_DIFFERENT_LANE, veh.lane, veh.direction)
+        else:
+            if veh.lane == self._car.lane:
+                if veh.velocity <= self._car.velocity:
+                    self.notify(
+                        "\nThe car is so slow to pose a threat.\n")  # It is on the same lane, but slower than our car.
+                    self.update_log(Event.VEHICLE_TOO_SLOW, veh.lane, veh.direction)
+                else:
+                    if self._car.lane == 1:
+                        self.notify(
+                            "\nThe car is already on the slowest lane and other car should change the lane. "
+                            "No actions are taken.\n")
+                        self.update_log(Event.VEHICLE_SLOWEST_LANE, veh.lane, veh.direction)
+                    elif self._car.lane == 2:
+                        self._car.lane = 1
+                        self.notify("\nThe car changed its lane from 2 to 1.\n")
+                        self.update_log(Event.VEHICLE_LANE_CHANGED, veh.lane, veh.direction, 2, 1)
+                    else:
+                        self._car.lane = 2
+                        self.notify("\nThe car changed its lane from 3 to 2.\n")
+                        self.update_log(Event.VEHICLE_LANE_CHANGED, veh.lane, veh.direction, 3, 2)
+            else:
+                self.notify("\nThe cars are on different lanes, no action has been taken.\n")
+                self.update_log(Event.VEHICLE_DIFFERENT_LANE, veh.lane, veh.direction)
+
+    def eval_obs(self, obstacle):
+        """Evaluates the obstacle detected by the LiDAR and takes the necessary action."""
+        self.add_obstacles(obstacle)  # Adds the obstacle to the obstacle list
+        if self._car.lane == obstacle.lane:
+            if self._car.lane == 1:
+                self._car.lane = 2
+                self.notify("\nThe car changed its lane from 1 to 2.\n")
+                self.update_log(Event.OBSTACLE_LANE_CHANGED, obstacle.type, obstacle.lane, 1, 2)
+            elif self._car.lane == 2:
+                if self._car.velocity < 80:  # If the velocity is less than 80, car changes its lane to the slowest one.
+                    self._car.lane = 1
+                    self.notify("\nThe car changed its lane from 2 to 1.\n")
+                    self.update_log(Event.OBSTACLE_LANE_CHANGED, obstacle.type, obstacle.lane, 2, 1)
+                else:
+                    self._car.lane = 3
+                    self.notify("\nThe car changed its lane from 2 to 3.\n")
+                    self.update_log(Event.OBSTACLE_LANE_CHANGED, obstacle.type, obstacle.lane, 2, 3)
+            else:
+                self._car.lane = 2
+                self.notify("\nThe car changed its lane from 3 to 2.\n")
+                self.update_log(Event.OBSTACLE_LANE_CHANGED, obstacle.type, obstacle.lane, 3, 2)
+        else:
+            self.notify(f"\nThe car is on lane {self._car.lane} and obstacle is on lane {obstacle.lane}. No action is taken.\n")
+            self.update_log(Event.OBSTACLE_DIFFERENT_LANE, obstacle.type, obstacle.lane)
+
+
+
+def events(speeds=SPEEDS):
+    """Returns every (car lane, car direction, car speed, event) combination the rules tell apart."""
+    found = []
+    for lane, direction, speed in product((1, 2, 3), 'NS', speeds):
+        for other_lane in (0, 1, 2, 3, 4):
+            found.append((lane, direction, speed, Obstacle('Rock', other_lane, 0.0)))
+            for other_direction, other_speed in product('NS', speeds):
+                found.append((lane, direction, speed, Vehicle('Car', other_direction, other_lane, other_speed)))
+        for code in range(7):
+            found.append((lane, direction, speed, TrafficSign(code, f'Sign {code}')))
+    return found
+
+
+def decide(control_unit_class, lane, direction, speed, event):
+    """Runs one event through a new control unit. Returns the car state, the log entries and the operator output."""
+    car = Car('Car', direction, lane, speed)
+    control_unit = control_unit_class(User('John', 'Doe', 'admin'), car)
+    output = io.StringIO()
+    with redirect_stdout(output):
+        {Obstacle: control_unit.eval_obs, Vehicle: control_unit.eval_veh,
+         TrafficSign: control_unit.eval_sign}[type(event)](event)
+    log = [(entry.code, entry.args) for entry in control_unit.log]
+    return (car.lane, car.velocity), log, output.getvalue()
+
+
+def check_equivalence():
+    """Compares the decisions of both control units on every combination. Returns the mismatches."""
+    mismatches = []
+    for combination in events():
+        before, after = decide(TreeControlUnit, *combination), decide(ControlUnit, *combination)
+        if before != after:
+            mismatches.append((combination, before, after))
+    return mismatches
+
+
+def decisions_per_second(control_unit_class, count, repeat=1):
+    """Runs a repeating mix of events through one headless control unit. Returns the best of `repeat` runs."""
+    combinations = events((35, 60, 75, 90, 110))
+    stream = [combinations[i % len(combinations)] for i in range(count)]
+    best = 0
+    for _ in range(repeat):
+        car = Car('Car', 'N', 1)
+        control_unit = control_unit_class(User('John', 'Doe', 'admin'), car, verbose=False)
+        handlers = {Obstacle: control_unit.eval_obs, Vehicle: control_unit.eval_veh,
+                    TrafficSign: control_unit.eval_sign}
+        start = perf_counter()
+        for lane, direction, speed, event in stream:
+            car.lane, car.direction, car.velocity = lane, direction, speed
+            handlers[type(event)](event)
+        best = max(best, count / (perf_counter() - start))
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=300_000)
+    parser.add_argument('--rounds', type=int, default=5, help="runs of each, taken in turns")
+    args = parser.parse_args()
+
+    table = default_rules()
+    print(f"Rule table: {len(table)} cells compiled from {table.source}")
+    mismatches = check_equivalence()
+    print(f"Equivalence: {len(events())} combinations, {len(mismatches)} mismatches")
+    for combination, before, after in mismatches[:10]:
+        print(f"  {combination}:\n    if/else: {before}\n    table:   {after}")
+
+    before = after = 0
+    for _ in range(args.rounds):  # In turns, so that a slow spell of the machine doesn't favour either
+        before = max(before, decisions_per_second(TreeControlUnit, args.events))
+        after = max(after, decisions_per_second(ControlUnit, args.events))
+    print(f"Nested if/else (before):  {before:>12,.0f} decisions/s")
+    print(f"Rule table (after):       {after:>12,.0f} decisions/s  ({after / before:.1f}x)")
@@ -0,0 +1,78 @@
+"""Compares the priority scheduler with first-in first-out dispatch under a mixed load: bursts of routine signs and
+commands with some hazards and a few critical obstacles and head-on vehicles in between. Reports the latency
+percentiles and missed deadlines of each class of event.
+
+Both policies decide the same events, submitted a burst at a time and dispatched until the queue is empty, so a
+burst stands for the backlog that builds up while the control unit is busy. The events of a burst arrive at the same
+instant, so the time taken to queue the burst is part of every latency.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_scheduler [--bursts 40] [--burst-size 1000] [--critical 0.05] [--hazard 0.15]
+"""
+
+import argparse
+import random
+from time import perf_counter_ns
+
+from driverless_car import Command, Obstacle, Session, TrafficSign, Vehicle
+from scheduler import CLASSES, EventScheduler
+
+
+def mixed_bursts(bursts, size, critical, hazard, seed=1):
+    """Returns bursts of events in which about `critical` and `hazard` of the events are of those classes for a
+    car travelling N on lane 1 and the rest are routine."""
+    rng = random.Random(seed)
+    result = []
+    for _ in range(bursts):
+        burst = []
+        for _ in range(size):
+            draw = rng.random()
+            if draw < critical:
+                burst.append(rng.choice((Obstacle('Pedestrian', rng.randint(1, 3), 0.0, rng.uniform(5, 200)),
+                                         Vehicle('Car', 'S', 1, rng.randint(60, 120), rng.uniform(5, 200)))))
+            elif draw < critical + hazard:
+                burst.append(rng.choice((Obstacle('Rock', rng.randint(2, 3), 0.0),
+                                         Vehicle('Van', rng.choice('NS'), rng.randint(2, 3), rng.randint(40, 140)))))
+            else:
+                burst.append(rng.choice((TrafficSign(rng.choice((2, 5))), Command('accelerate'),
+                                         Command('brake'))))
+        result.append(burst)
+    return result
+
+
+def run(policy, bursts):
+    """Submits and dispatches the bursts with a policy. Returns the scheduler."""
+    session = Session(verbose=False)
+    session.engine.start()
+    scheduler = EventScheduler(session.engine, policy)
+    car, clock = session.car, perf_counter_ns
+    for burst in bursts:
+        car.lane, car.direction = 1, 'N'  # Every burst is classified for the same car state
+        arrival = clock()
+        for event in burst:
+            scheduler.submit(event, arrival)
+        scheduler.dispatch()
+    return scheduler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bursts', type=int, default=40)
+    parser.add_argument('--burst-size', type=int, default=1000)
+    parser.add_argument('--critical', type=float, default=0.05, help="share of critical events")
+    parser.add_argument('--hazard', type=float, default=0.15, help="share of hazard events")
+    args = parser.parse_args()
+
+    bursts = mixed_bursts(args.bursts, args.burst_size, args.critical, args.hazard)
+    results = {policy: run(policy, bursts).stats() for policy in ('fifo', 'priority')}
+    print("{:<10} {:<10} {:>8} {:>10} {:>10} {:>10} {:>8}".format(
+        'POLICY', 'CLASS', 'EVENTS', 'P50 (ms)', 'P99 (ms)', 'MAX (ms)', 'MISSED'))
+    for policy, stats in results.items():
+        for kind in CLASSES:
+            summary = stats[kind]
+            print("{:<10} {:<10} {:>8,} {:>10.2f} {:>10.2f} {:>10.2f} {:>8,}".format(
+                policy, kind, summary['count'], summary['p50_us'] / 1000, summary['p99_us'] / 1000,
+                summary['max_us'] / 1000, summary['missed']))
+    if results['priority']['critical']['missed'] > results['fifo']['critical']['missed']:
+        raise SystemExit("The priority scheduler missed more critical deadlines than FIFO dispatch.")
@@ -0,0 +1,60 @@
+"""Measures how a parameter sweep scales with the number of worker processes, on synthetic scenarios.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_sweep [--scenarios 200] [--events 200] [--workers 1 2 4 8]
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+from time import perf_counter
+
+from sweep import grid, run_sweep
+
+
+def write_synthetic(path, events, seed):
+    """Writes a random drive of obstacles, vehicles, signs and speed commands with positions along the road."""
+    rng = random.Random(seed)
+    with open(path, 'w') as file:
+        for i in range(events):
+            time, position = i * 0.5, 20.0 + i * 8
+            kind = rng.choice(('obstacle', 'obstacle', 'vehicle', 'vehicle', 'sign', 'command'))
+            if kind == 'obstacle':
+                record = {'type': rng.choice(('Rock', 'Pedestrian')), 'lane': rng.randint(1, 3), 'position': position}
+            elif kind == 'vehicle':
+                record = {'type': 'Car', 'direction': rng.choice('NS'), 'lane': rng.randint(1, 3),
+                          'velocity': rng.randrange(40, 130, 10), 'position': position}
+            elif kind == 'sign':
+                record = {'code': rng.choice((1, 2, 4, 5))}
+            else:
+                record = {'command': rng.choice(('accelerate', 'accelerate', 'brake'))}
+            file.write(json.dumps({'time': time, 'kind': kind, **record}) + '\n')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenarios', type=int, default=200)
+    parser.add_argument('--events', type=int, default=200)
+    parser.add_argument('--workers', type=int, nargs='+', default=None)
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    counts = args.workers or sorted({1, 2, 4, cores} - {count for count in (2, 4) if count > cores})
+    param_sets = grid(lane_split=[70, 80, 90], slippery=[0.2, 0.3])
+    with tempfile.TemporaryDirectory() as directory:
+        scenarios = []
+        for seed in range(args.scenarios):
+            scenarios.append(os.path.join(directory, f'drive{seed}.jsonl'))
+            write_synthetic(scenarios[-1], args.events, seed)
+        runs = len(scenarios) * len(param_sets)
+        print(f"{runs:,} runs ({args.scenarios} scenarios x {len(param_sets)} parameter sets), {cores} cores")
+        baseline = None
+        for workers in counts:
+            start = perf_counter()
+            run_sweep(scenarios, param_sets, workers=workers)
+            rate = runs / (perf_counter() - start)
+            baseline = baseline or rate
+            print(f"  {workers:>3} workers: {rate:>8,.1f} runs/s  ({rate / baseline:.2f}x)")
@@ -0,0 +1,59 @@
+"""Measures what telemetry recording costs: events per second through a headless engine without and with a
+recorder, raw tick records per second, and the time to read a recording back as a NumPy array.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_telemetry [--events 300000] [--ticks 1000000]
+"""
+
+import argparse
+import os
+import tempfile
+from time import perf_counter
+
+from benchmarks.bench_log import mixed_events
+from driverless_car import OBSTACLE_TYPES, VEHICLE_TYPES, Car, ControlUnit, SimulationEngine, User
+from telemetry import RECORD_SIZE, TelemetryRecorder, read_telemetry
+
+
+def events_per_second(events, recorder=None):
+    control_unit = ControlUnit(User('John', 'Doe', 'admin'), Car('Car', 'N', 1), verbose=False, recorder=recorder)
+    engine = SimulationEngine(control_unit)
+    engine.start()
+    start = perf_counter()
+    engine.run(events)
+    return len(events) / (perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=300_000)
+    parser.add_argument('--ticks', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    events = mixed_events(args.events)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'drive.tel')
+        before = events_per_second(events)
+        with TelemetryRecorder(path, OBSTACLE_TYPES, VEHICLE_TYPES) as recorder:
+            after = events_per_second(events, recorder)
+        print(f"Without recorder:  {before:>12,.0f} events/s")
+        print(f"With recorder:     {after:>12,.0f} events/s  ({after / before:.2f}x)")
+
+        car = Car('Car', 'N', 1, 60)
+        with TelemetryRecorder(path) as recorder:
+            tick = recorder.tick
+            start = perf_counter()
+            for i in range(args.ticks):
+                tick(car, i * 0.01)
+            elapsed = perf_counter() - start
+        print(f"Tick records:      {args.ticks / elapsed:>12,.0f} records/s  "
+              f"({os.path.getsize(path) / 2 ** 20:,.1f} MiB, {RECORD_SIZE} bytes per record)")
+
+        start = perf_counter()
+        records = read_telemetry(path)
+        mean = records['velocity'].mean()
+        elapsed = perf_counter() - start
+        print(f"Read back:         {len(records):>12,} records mapped and averaged (mean velocity {mean:.1f}) "
+              f"in {elapsed * 1e3:.1f} ms")
+        del records
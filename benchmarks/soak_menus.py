@@ -0,0 +1,86 @@
+"""Soak check of the menu state machine: drives the menus through millions of navigations (information menu, main
+menu, interaction menu, change user, ...) with scripted input and checks that neither the call stack nor the memory
+in use grows.
+
+Run from the repository root:
+
+    python -m benchmarks.soak_menus [--navigations 1000000]
+"""
+
+import argparse
+import builtins
+import contextlib
+import io
+import sys
+import tracemalloc
+from itertools import cycle
+from time import perf_counter
+
+import driverless_car
+from carlog import CarLog
+from driverless_car import MAIN, Session, run_menus
+
+# Main -> information -> main -> interaction -> main -> change user -> log in -> main
+ROUND = ('1', '8', '2', '12', '3', 'admin')
+
+
+class _Null(io.TextIOBase):
+    def write(self, text):
+        return len(text)
+
+
+def stack_depth():
+    depth, frame = 0, sys._getframe()
+    while frame is not None:
+        depth, frame = depth + 1, frame.f_back
+    return depth
+
+
+def soak(navigations, checkpoints=10):
+    """Runs the menus for a number of navigations. Returns the (navigations, stack depth, traced memory in KiB)
+    measured at each checkpoint."""
+    # A small log, so the log filling up to its capacity doesn't count as growth
+    session = Session(log=CarLog(capacity=1000))
+    answers = cycle(ROUND)
+    every = max(navigations // checkpoints // len(ROUND), 1) * len(ROUND)  # Always at the same prompt
+    samples, count = [], 0
+
+    def scripted_input(prompt=''):
+        nonlocal count
+        count += 1
+        if count > navigations:
+            return '4'  # Exit from the main menu
+        if count % every == 0:
+            samples.append((count, stack_depth(), tracemalloc.get_traced_memory()[0] / 1024))
+        return next(answers)
+
+    builtin_input, sleep = builtins.input, driverless_car.sleep
+    builtins.input, driverless_car.sleep = scripted_input, lambda seconds: None
+    tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(_Null()):
+            run_menus(session, MAIN)
+    finally:
+        tracemalloc.stop()
+        builtins.input, driverless_car.sleep = builtin_input, sleep
+    return samples
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--navigations', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    start = perf_counter()
+    samples = soak(args.navigations)
+    elapsed = perf_counter() - start
+    print(f"{'NAVIGATIONS':>12} {'STACK DEPTH':>12} {'MEMORY (KiB)':>13}")
+    for navigations, depth, memory in samples:
+        print(f"{navigations:>12,} {depth:>12} {memory:>13,.1f}")
+    depths = {depth for _, depth, _ in samples}
+    # The first checkpoint is taken once the log is full, so the memory in use should stay level after it
+    growth = samples[-1][2] - samples[0][2]
+    print(f"\n{args.navigations:,} navigations in {elapsed:.1f} s; stack depth "
+          f"{'constant' if len(depths) == 1 else 'GROWING'}, memory change {growth:+.1f} KiB")
+    if len(depths) > 1 or growth > 64:
+        sys.exit(1)
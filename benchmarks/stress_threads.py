@@ -0,0 +1,126 @@
+"""Stress test of a control unit shared by sensor threads: no update of the car, the log or the histories may be
+lost, and lane changes requested at the same instant must always be resolved the same way. Reports the events per
+second as threads are added.
+
+Each thread plays a sensor or the operator on its own engine: it accelerates the car and hands obstacles and
+vehicles over to the shared control unit. The interpreter is made to switch threads far more often than it does
+by default, so that unsynchronized updates would be lost within a few thousand events.
+
+Run from the repository root:
+
+    python -m benchmarks.stress_threads [--threads 1 2 4 8] [--events 20000] [--trials 200]
+"""
+
+import argparse
+import random
+import sys
+import threading
+from collections import Counter
+from time import perf_counter, sleep
+
+from carlog import CarLog
+from driverless_car import Obstacle, Session, SimulationEngine, Vehicle
+
+
+def stress(threads, events):
+    """Runs `events` events on each of `threads` threads. Returns the time taken and the failed checks."""
+    # A log that holds every entry, so that the entries it counts were not evicted to make room
+    session = Session(verbose=False, log=CarLog(capacity=1 + threads * events))
+    control_unit = session.control_unit
+    session.engine.start()
+    counts = Counter()
+    counts_lock = threading.Lock()
+    barrier = threading.Barrier(threads + 1)
+
+    def sensor(seed):
+        engine = SimulationEngine(control_unit, session.sign_db, comms=session.v2vcomms)
+        rng = random.Random(seed)
+        sent = Counter()
+        barrier.wait()
+        for _ in range(events):
+            kind = rng.choice(('accelerate', 'obstacle', 'vehicle'))
+            if kind == 'accelerate':
+                engine.accelerate()
+            elif kind == 'obstacle':
+                engine.send(Obstacle('Rock', rng.randint(1, 3), 0.0))
+            else:
+                engine.send(Vehicle('Car', rng.choice('NS'), rng.randint(1, 3), rng.randint(40, 160)))
+            sent[kind] += 1
+        with counts_lock:
+            counts.update(sent)
+
+    workers = [threading.Thread(target=sensor, args=(seed,)) for seed in range(threads)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    start = perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = perf_counter() - start
+
+    log, latency = control_unit.log, control_unit.latency
+    checks = {
+        'speed': (session.car.velocity, 60 + control_unit.speed_step * counts['accelerate']),
+        'log entries': (len(log), 1 + threads * events),
+        'speed entries': (log.count('speed'), 1 + counts['accelerate']),
+        'obstacles': (len(control_unit.obstacles), counts['obstacle']),
+        'vehicles': (len(session.v2vcomms.vehicles), counts['vehicle']),
+        'obstacle latencies': (latency.obstacle.count, counts['obstacle']),
+        'vehicle latencies': (latency.vehicle.count, counts['vehicle']),
+    }
+    failed = [f"{name}: {actual} instead of {expected}" for name, (actual, expected) in checks.items()
+              if actual != expected]
+    return elapsed, control_unit.arbiter.contended, failed
+
+
+def simultaneous_lane_changes(trials):
+    """Holds the car while the operator asks for lane 3 and the LiDAR reports an obstacle on the car's lane 2, in a
+    random order. Returns the count of each lane the car ends up on."""
+    lanes = Counter()
+    for _ in range(trials):
+        session = Session(verbose=False)
+        control_unit = session.control_unit
+        session.engine.start()
+        session.engine.change_lane(2)
+        requests = [lambda: control_unit.change_lane(3),
+                    lambda: control_unit.handoff('obstacle')(Obstacle('Rock', 2, 0.0))]
+        random.shuffle(requests)
+        with control_unit.exclusive():
+            threads = [threading.Thread(target=request) for request in requests]
+            for thread in threads:
+                thread.start()
+            while control_unit.arbiter.contended < len(requests):  # Both are waiting for the car
+                sleep(0.0001)
+        for thread in threads:
+            thread.join()
+        lanes[session.car.lane] += 1
+    return lanes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--events', type=int, default=20_000, help="events per thread")
+    parser.add_argument('--trials', type=int, default=200, help="simultaneous lane change trials")
+    parser.add_argument('--switch-interval', type=float, default=1e-5,
+                        help="seconds between thread switches (the interpreter's default is 0.005)")
+    args = parser.parse_args()
+
+    sys.setswitchinterval(args.switch_interval)
+    failures = 0
+    print("{:>8} {:>10} {:>12} {:>11}  {}".format('THREADS', 'EVENTS', 'EVENTS/S', 'CONTENDED', 'CHECKS'))
+    for threads in args.threads:
+        elapsed, contended, failed = stress(threads, args.events)
+        failures += bool(failed)
+        print("{:>8} {:>10,} {:>12,.0f} {:>11,}  {}".format(
+            threads, threads * args.events, threads * args.events / elapsed, contended,
+            '; '.join(failed) or 'no lost updates'))
+
+    lanes = simultaneous_lane_changes(args.trials)
+    print(f"\nObstacle on lane 2 and change_lane 3 at the same instant, {args.trials} trials: final lanes "
+          f"{dict(lanes)}")
+    if set(lanes) != {1}:  # The obstacle goes first and moves the car to lane 1; lane 3 is then out of reach
+        print("The lane changes were not resolved in priority order.")
+        failures += 1
+    if failures:
+        raise SystemExit(1)
@@ -0,0 +1,295 @@
+"""Benchmark suite for the hot paths of the control unit, with stored baselines.
+
+Every case times a batch of operations several times, on fresh state for each repeat, and reports the throughput
+of the best repeat (operations per second) and the latency of the median repeat (microseconds per operation).
+The results can be saved as the baseline (benchmarks/baseline.json), and later runs are compared with it: a case
+whose throughput drops by more than the tolerance, in the first run and in a second run of that case, is reported
+as a regression and the run exits with status 1.
+
+Run from the repository root:
+
+    python -m benchmarks.suite                  # Runs every case and compares it with the baseline
+    python -m benchmarks.suite --save           # Runs every case and stores the results as the baseline
+    python -m benchmarks.suite -k auth -k log   # Only the cases whose name contains one of the words
+
+Baselines are only comparable on the machine and Python version they were saved with; both are stored with them.
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import sys
+from datetime import datetime
+from statistics import median
+from time import perf_counter
+
+from carlog import CarLog, Event
+from driverless_car import Car, ControlUnit, Obstacle, TrafficSign, User, V2VComms, Vehicle
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+CASES = {}  # Name -> setup function. A setup returns (run, ops): run() does ops operations.
+
+
+def case(name):
+    """Registers a setup function as a benchmark case."""
+    def register(setup):
+        CASES[name] = setup
+        return setup
+    return register
+
+
+def _control_unit(users=0, **options):
+    control_unit = ControlUnit(User('John', 'Doe', 'admin'), Car('Car', 'N', 2, 80), verbose=False, **options)
+    control_unit.status = True
+    for i in range(users):
+        control_unit.register_user('Name', 'Surname', f'user{i}')
+    return control_unit
+
+
+class _Null(io.TextIOBase):
+    """Swallows what the listings print, so only building the lines is timed."""
+
+    def write(self, text):
+        return len(text)
+
+
+def _quiet(function):
+    def run():
+        with contextlib.redirect_stdout(_Null()):
+            function()
+    return run
+
+
+# Decisions
+
+@case('eval_obs')
+def _eval_obs(ops=50_000):
+    control_unit = _control_unit()
+    car = control_unit.car
+    obstacles = [Obstacle(kind, lane, 0.0) for kind in ('Rock', 'Pedestrian') for lane in (1, 2, 3)]
+    events = [obstacles[i % len(obstacles)] for i in range(ops)]
+
+    def run():
+        eval_obs = control_unit.eval_obs
+        for obstacle in events:
+            car.lane = 2  # Every obstacle meets the car in the same state
+            eval_obs(obstacle)
+    return run, ops
+
+
+@case('eval_veh')
+def _eval_veh(ops=50_000):
+    control_unit = _control_unit()
+    car = control_unit.car
+    vehicles = [Vehicle('Car', direction, lane, velocity) for direction in 'NS' for lane in (1, 2, 3)
+                for velocity in (40, 80, 120)]
+    events = [vehicles[i % len(vehicles)] for i in range(ops)]
+
+    def run():
+        eval_veh = control_unit.eval_veh
+        for vehicle in events:
+            car.lane, car.velocity = 2, 80
+            eval_veh(vehicle)
+    return run, ops
+
+
+@case('eval_sign')
+def _eval_sign(ops=50_000):
+    control_unit = _control_unit()
+    car = control_unit.car
+    signs = [TrafficSign(code, f'Sign {code}') for code in (1, 2, 3, 4, 5)]
+    events = [signs[i % len(signs)] for i in range(ops)]
+
+    def run():
+        eval_sign = control_unit.eval_sign
+        for sign in events:
+            car.velocity = 80
+            eval_sign(sign)
+    return run, ops
+
+
+# Car log
+
+@case('update_log')
+def _update_log(ops=100_000):
+    control_unit = _control_unit()
+
+    def run():
+        update_log = control_unit.update_log
+        for i in range(ops):
+            update_log(Event.OBSTACLE_LANE_CHANGED, 'Rock', 2, 2, 1)
+    return run, ops
+
+
+@case('read_log 10k')
+def _read_log(ops=10_000):
+    log = CarLog()
+    control_unit = _control_unit(log=log)
+    for i in range(ops):
+        control_unit.update_log(Event.VEHICLE_DIFFERENT_LANE, 2, 'S')
+
+    def run():  # Pages through the whole log, so an operation is an entry read as before the log was paged
+        cursor = control_unit.read_log()
+        while cursor is not None:
+            cursor = control_unit.read_log(cursor=cursor)
+    return _quiet(run), ops
+
+
+# Users, with 10k users in the database
+
+@case('auth 10k users')
+def _auth(ops=100_000, users=10_000):
+    control_unit = _control_unit(users)
+    logins = [f'user{i % (users * 2)}' for i in range(ops)]  # Half of the logins are unknown
+
+    def run():
+        auth = control_unit.auth
+        for login in logins:
+            auth(login)
+    return run, ops
+
+
+@case('add_user 10k users')
+def _add_user(ops=10_000, users=10_000):
+    control_unit = _control_unit(users)
+
+    def run():
+        register_user = control_unit.register_user
+        for i in range(users, users + ops):
+            register_user('Name', 'Surname', f'user{i}')
+    return run, ops
+
+
+@case('delete_user 10k users')
+def _delete_user(ops=10_000, users=10_000):
+    control_unit = _control_unit(users)
+
+    def run():
+        remove_user = control_unit.remove_user
+        for i in range(ops):
+            remove_user(f'user{i}')
+    return run, ops
+
+
+# Listings: pages of 50 rows, filtered, out of 100k detections in the history
+
+@case('list_obstacles page 100k')
+def _list_obstacles(ops=2_000, rows=100_000):
+    control_unit = _control_unit()
+    for i in range(rows):
+        control_unit.add_obstacles(Obstacle('Rock', i % 3 + 1, 1_700_000_000.0 + i))
+
+    def run():
+        for _ in range(ops):
+            control_unit.list_obstacles(lane=2, since=1_700_000_000.0 + rows / 2)
+    return _quiet(run), ops
+
+
+@case('list_vehicles page 100k')
+def _list_vehicles(ops=2_000, rows=100_000):
+    comms = V2VComms()
+    for i in range(rows):
+        comms.update_db(Vehicle(('Car', 'Truck/Lorry')[i % 2], 'NS'[i // 2 % 2], i % 3 + 1, 60 + i % 7 * 10))
+
+    def run():
+        for _ in range(ops):
+            comms.list_vehicles(type='Truck/Lorry', direction='S', faster_than=100)
+    return _quiet(run), ops
+
+
+def measure(setup, repeat=7):
+    """Runs a case `repeat` times. Returns the best operations per second and the median microseconds per
+    operation. The garbage collector is off while a repeat is timed, as in timeit."""
+    times = []
+    for _ in range(repeat):
+        run, ops = setup()
+        gc.collect()
+        gc.disable()
+        try:
+            start = perf_counter()
+            run()
+            times.append((perf_counter() - start) / ops)
+        finally:
+            gc.enable()
+    return {'ops_per_s': 1 / min(times), 'us_per_op': median(times) * 1e6}
+
+
+def environment():
+    return {'python': platform.python_version(), 'machine': platform.machine(), 'platform': platform.platform(),
+            'saved': datetime.now().isoformat(timespec='seconds')}
+
+
+def load_baseline(path=BASELINE_PATH):
+    """Returns the stored baseline, or None if there is none."""
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_baseline(results, path=BASELINE_PATH):
+    with open(path, 'w') as file:
+        json.dump({'environment': environment(), 'results': results}, file, indent=2)
+        file.write('\n')
+
+
+def compare(results, baseline, tolerance):
+    """Returns the (name, change) pairs of the cases whose throughput dropped by more than the tolerance."""
+    regressions = []
+    for name, result in results.items():
+        before = baseline['results'].get(name)
+        if before is not None:
+            change = result['ops_per_s'] / before['ops_per_s'] - 1
+            if change < -tolerance:
+                regressions.append((name, change))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-k', dest='filters', action='append', help="only run the cases whose name contains this")
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--save', action='store_true', help="store the results as the baseline")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed throughput drop (default 0.25 = 25%%)")
+    args = parser.parse_args()
+
+    baseline = None if args.save else load_baseline(args.baseline)
+    if baseline is not None and baseline['environment']['python'] != platform.python_version():
+        print(f"Note: the baseline was saved with Python {baseline['environment']['python']}.")
+    results = {}
+    print(f"{'CASE':<24} {'OPS/S':>14} {'US/OP':>10} {'BASELINE':>14} {'CHANGE':>8}")
+    for name, setup in CASES.items():
+        if args.filters and not any(word in name for word in args.filters):
+            continue
+        results[name] = result = measure(setup, args.repeat)
+        line = f"{name:<24} {result['ops_per_s']:>14,.0f} {result['us_per_op']:>10.3f}"
+        before = baseline and baseline['results'].get(name)
+        if before:
+            line += f" {before['ops_per_s']:>14,.0f} {result['ops_per_s'] / before['ops_per_s'] - 1:>+8.0%}"
+        print(line)
+
+    if args.save:
+        stored = load_baseline(args.baseline)
+        if stored is not None and args.filters:  # Keeps the baseline of the cases that were not run
+            results = {**stored['results'], **results}
+        save_baseline(results, args.baseline)
+        print(f"\nBaseline saved to {args.baseline}")
+    elif baseline is None:
+        print(f"\nNo baseline at {args.baseline}; run with --save to store one.")
+    else:
+        regressions = compare(results, baseline, args.tolerance)
+        for name, _ in regressions:  # Measured once more, so a noisy run alone doesn't count as a regression
+            again = measure(CASES[name], args.repeat)
+            if again['ops_per_s'] > results[name]['ops_per_s']:
+                results[name] = again
+        regressions = compare(results, baseline, args.tolerance)
+        for name, change in regressions:
+            print(f"REGRESSION: {name} is {-change:.0%} slower than the baseline")
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,364 @@
+"""The car log: a fixed-capacity ring buffer in memory, with optional spill-to-disk segments for older entries.
+
+Entries are stored as compact (monotonic time, event code, arguments) tuples. The English message and the date are
+only rendered when an entry is read, so logging costs little even when nobody reads the log.
+
+Entries are kept in time order and indexed by kind, so a page of entries filtered by kind and time range is found
+with binary searches instead of a scan of the whole log. Reading the log never removes entries from it.
+
+Appending and querying take a lock of the log's own, held only while an entry is stored or a page is read, so any
+number of threads can log at once without holding up the car's decisions for longer than that.
+"""
+
+import os
+import pickle
+import threading
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import datetime
+from enum import IntEnum
+from time import monotonic, time
+
+CHUNK_SIZE = 1024  # Entries read under the lock at a time by the entries() generator
+
+# The kinds of events the control unit logs
+KINDS = ('user', 'speed', 'lane', 'obstacle', 'vehicle', 'sign')
+
+TIME_FORMAT = "%d/%m/%Y %H:%M:%S"
+
+
+class Event(IntEnum):
+    """Codes of the events logged by the control unit."""
+    USER_EXISTS = 1
+    USER_ADDED = 2
+    DELETE_ACTIVE_USER = 3
+    DELETE_ADMIN = 4
+    USER_DELETED = 5
+    DELETE_UNKNOWN_USER = 6
+    USER_AUTHORIZED = 7
+    UNAUTHORIZED = 8
+    CAR_STARTED = 20
+    ACCELERATE_CAR_OFF = 21
+    ACCELERATED = 22
+    BRAKE_CAR_OFF = 23
+    BRAKE_CAR_STOPPED = 24
+    BRAKED = 25
+    STOP_CAR_OFF = 26
+    STOP_CAR_STOPPED = 27
+    STOPPED = 28
+    DIRECTION_CAR_OFF = 40
+    DIRECTION_CHANGED = 41
+    LANE_CAR_OFF = 42
+    LANE_CHANGED = 43
+    OBSTACLE_LANE_CHANGED = 60
+    OBSTACLE_DIFFERENT_LANE = 61
+    VEHICLE_LANE_CHANGED = 80
+    VEHICLE_DIFFERENT_LANE = 81
+    VEHICLE_TOO_SLOW = 82
+    VEHICLE_SLOWEST_LANE = 83
+    SIGN_BELOW_LIMIT = 100
+    SIGN_LIMIT_60 = 101
+    SIGN_SPEED_KEPT = 102
+    SIGN_LIMIT_100 = 103
+    SIGN_ALREADY_STOPPED = 104
+    SIGN_STOPPED = 105
+    SIGN_NOT_MOVING = 106
+    SIGN_SLIPPERY = 107
+    SIGN_ABOVE_MINIMUM = 108
+    SIGN_MINIMUM = 109
+
+
+# Event code -> (kind, message template). The arguments logged with the event fill in the template.
+MESSAGES = {
+    Event.USER_EXISTS: ('user', "Attempted to add a new user. The user already exists."),
+    Event.USER_ADDED: ('user', "The user '{}' has been added."),
+    Event.DELETE_ACTIVE_USER: ('user', "Attempted to delete the active user '{}'. Request rejected."),
+    Event.DELETE_ADMIN: ('user', "Attempted to delete the admin user. Request rejected."),
+    Event.USER_DELETED: ('user', "The user '{}' has been deleted."),
+    Event.DELETE_UNKNOWN_USER: ('user', "Attempted to delete a user. The user doesn't exist."),
+    Event.USER_AUTHORIZED: ('user', "The user '{}' has been authorized to use the system."),
+    Event.UNAUTHORIZED: ('user', "Unauthorized attempt to access the system."),
+    Event.CAR_STARTED: ('speed', "The car has been activated. The car's speed is set to 60 km/h."),
+    Event.ACCELERATE_CAR_OFF: ('speed', "Attempted to change the direction without starting the car. "
+                                        "No action is taken."),
+    Event.ACCELERATED: ('speed', "The car has been accelerated. The car's speed is set to {} km/h."),
+    Event.BRAKE_CAR_OFF: ('speed', "Attempted to slow down without starting the car. No action is taken."),
+    Event.BRAKE_CAR_STOPPED: ('speed', "Attempted to reduce the speed the car. The car is already stopped."),
+    Event.BRAKED: ('speed', "The car's speed has been reduced. The car's speed is set to {} km/h."),
+    Event.STOP_CAR_OFF: ('speed', "Attempted to stop the car. The car is not on."),
+    Event.STOP_CAR_STOPPED: ('speed', "Attempted to stop the car. The car is already stopped."),
+    Event.STOPPED: ('speed', "The car has stopped."),
+    Event.DIRECTION_CAR_OFF: ('lane', "Attempted to change the direction without starting the car. "
+                                      "No action is taken."),
+    Event.DIRECTION_CHANGED: ('lane', "The car's direction has been changed. New direction is: {}."),
+    Event.LANE_CAR_OFF: ('lane', "Attempted to change the lane without starting the car. No action is taken."),
+    Event.LANE_CHANGED: ('lane', "The car's lane has been changed. New lane is: {}."),
+    Event.OBSTACLE_LANE_CHANGED: ('obstacle', "{} on lane {} is detected. The car changed its lane from {} to {}."),
+    Event.OBSTACLE_DIFFERENT_LANE: ('obstacle', "{} on lane {} is detected. No action is taken (different lane)."),
+    Event.VEHICLE_LANE_CHANGED: ('vehicle', "A vehicle (Lane: {} Direction: {}) detected. "
+                                            "The car changed its lane from {} to {}."),
+    Event.VEHICLE_DIFFERENT_LANE: ('vehicle', "A vehicle (Lane: {} Direction: {}) detected. "
+                                              "No action is taken (different lane)."),
+    Event.VEHICLE_TOO_SLOW: ('vehicle', "A vehicle (Lane: {} Direction: {}) detected. "
+                                        "No action is taken (car too slow)."),
+    Event.VEHICLE_SLOWEST_LANE: ('vehicle', "A vehicle (Lane: {} Direction: {}) detected. "
+                                            "No action is taken (car on slowest lane)."),
+    Event.SIGN_BELOW_LIMIT: ('sign', "{} sign detected. Car's speed is below 50. No action taken."),
+    Event.SIGN_LIMIT_60: ('sign', "{} sign detected. Car's speed is set to 50 km/h."),
+    Event.SIGN_SPEED_KEPT: ('sign', "{} sign detected. Car's speed is {}. No action taken."),
+    Event.SIGN_LIMIT_100: ('sign', "{} sign detected. Car's speed is set to 90 km/h."),
+    Event.SIGN_ALREADY_STOPPED: ('sign', "{} sign detected. The car is already stopped."),
+    Event.SIGN_STOPPED: ('sign', "{} sign detected. Car has been stopped."),
+    Event.SIGN_NOT_MOVING: ('sign', "{} sign detected. Car is already stopped. No action is taken."),
+    Event.SIGN_SLIPPERY: ('sign', "{} sign detected. The speed is reduced 30% and set to {}."),
+    Event.SIGN_ABOVE_MINIMUM: ('sign', "{} sign detected. Car's speed is {}. No action is taken."),
+    Event.SIGN_MINIMUM: ('sign', "{} sign detected. Car's speed is set to {}."),
+}
+
+# Event code -> kind, as a plain dict for the logging hot path
+KIND_OF = {code: kind for code, (kind, _) in MESSAGES.items()}
+
+
+class LogEntry(namedtuple('LogEntry', 'seq time code args')):
+    """A car log entry. seq numbers the entries in the order they were logged, time is a Unix timestamp."""
+    __slots__ = ()
+
+    @property
+    def kind(self):
+        return KIND_OF[self.code]
+
+    @property
+    def text(self):
+        return MESSAGES[self.code][1].format(*self.args)
+
+    @property
+    def timestamp(self):
+        return datetime.fromtimestamp(self.time).strftime(TIME_FORMAT)
+
+
+Segment = namedtuple('Segment', 'path first_seq last_seq start_time end_time kinds')
+
+
+class _TimeView:
+    """A read-only sequence of the (monotonic) times of some log entries, so that they can be searched with bisect."""
+
+    def __init__(self, log, seqs=None, offset=0):
+        self._log = log
+        self._seqs = seqs  # Sequence numbers of the entries, or None for all entries in memory
+        self._offset = offset
+
+    def __len__(self):
+        if self._seqs is None:
+            return self._log._next - self._log._first
+        return len(self._seqs) - self._offset
+
+    def seq(self, index):
+        if self._seqs is None:
+            return self._log._first + index
+        return self._seqs[self._offset + index]
+
+    def count_before(self, seq):
+        """Returns the number of entries in the view numbered below seq."""
+        if self._seqs is None:
+            return min(max(seq - self._log._first, 0), len(self))
+        return bisect_left(self._seqs, seq, self._offset) - self._offset
+
+    def __getitem__(self, index):
+        return self._log._ring[self.seq(index) % self._log.capacity][0]
+
+
+class CarLog:
+    """Stores the latest `capacity` log entries in memory. When the ring buffer is full, the oldest
+    `segment_size` entries (an eighth of the capacity, up to 8192, by default) are written to a segment file in
+    spill_dir, or dropped if there is no spill_dir."""
+
+    def __init__(self, capacity=100_000, spill_dir=None, segment_size=None):
+        if capacity < 1:
+            raise ValueError("The log capacity must be at least 1.")
+        self.capacity = capacity
+        # A small part of the ring at a time, so a log without spill_dir keeps most of its latest entries
+        self._segment_size = min(segment_size or min(8192, max(1, capacity // 8)), capacity)
+        self._spill_dir = spill_dir
+        self._ring = [None] * capacity  # (time, code, args) tuples, entry seq is stored at seq % capacity
+        self._epoch = time() - monotonic()  # Converts the monotonic entry times to Unix timestamps
+        self._first = 0  # Sequence number of the oldest entry in memory
+        self._next = 0  # Sequence number of the next entry
+        # Sequence numbers of the entries in memory for each kind. The first _kind_start[kind] of them are evicted.
+        self._kind_seqs = {kind: [] for kind in KINDS}
+        self._kind_start = dict.fromkeys(KINDS, 0)
+        self._code_seqs = {code: self._kind_seqs[kind] for code, kind in KIND_OF.items()}  # The index of each code
+        self._segments = []
+        self._cached_segment = (None, None)  # The last segment read back from disk and its entries
+        self._dropped = 0
+        self._lock = threading.Lock()
+        if spill_dir is not None:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def append(self, code, args=()):
+        """Adds an entry to the log. Nothing is formatted until the entry is read."""
+        # The sequence number, the ring slot and the kind index are taken together. The lock is taken by hand
+        # rather than with `with`, which costs twice as much on this hot path.
+        lock = self._lock
+        lock.acquire()
+        try:
+            seq = self._next
+            if seq - self._first == self.capacity:
+                self._evict()
+            self._ring[seq % self.capacity] = (monotonic(), code, args)
+            self._code_seqs[code].append(seq)
+            self._next = seq + 1
+        finally:
+            lock.release()
+
+    def _evict(self):
+        """Moves the oldest segment of entries out of memory."""
+        first, last = self._first, self._first + self._segment_size
+        if self._spill_dir is not None:
+            self._spill(first, last)
+        else:
+            self._dropped += last - first
+        self._first = last
+        for kind, seqs in self._kind_seqs.items():
+            start = bisect_left(seqs, last, self._kind_start[kind])
+            if start > len(seqs) // 2:  # Compacts the index once half of it has been evicted
+                del seqs[:start]
+                start = 0
+            self._kind_start[kind] = start
+
+    def _spill(self, first, last):
+        path = os.path.join(self._spill_dir, f"segment-{first:012d}.pickle")
+        ring, capacity = self._ring, self.capacity
+        entries = [ring[seq % capacity] for seq in range(first, last)]
+        with open(path, 'wb') as file:
+            pickle.dump((first, entries), file, pickle.HIGHEST_PROTOCOL)
+        self._segments.append(Segment(path, first, last - 1, entries[0][0], entries[-1][0],
+                                      frozenset(KIND_OF[entry[1]] for entry in entries)))
+
+    def _entry(self, seq):
+        entry_time, code, args = self._ring[seq % self.capacity]
+        return LogEntry(seq, self._epoch + entry_time, code, args)
+
+    def _load(self, segment):
+        if self._cached_segment[0] != segment.path:
+            with open(segment.path, 'rb') as file:
+                self._cached_segment = (segment.path, pickle.load(file)[1])
+        return self._cached_segment[1]
+
+    def _memory_range(self, kind, start, end):
+        """Returns the time view of the entries in memory of the given kind and the [lo, hi) range of those
+        within the (monotonic) time range."""
+        if kind is None:
+            view = _TimeView(self)
+        else:
+            view = _TimeView(self, self._kind_seqs[kind], self._kind_start[kind])
+        lo = 0 if start is None else bisect_left(view, start)
+        hi = len(view) if end is None else bisect_right(view, end)
+        return view, lo, max(lo, hi)
+
+    def _segment_entries(self, kind, start, end, newest_first, segments=None, before=None):
+        """Yields the entries on disk (in the given segments, by default all of them) that match the filters and
+        are numbered below `before` (if given)."""
+        if segments is None:
+            segments = self._segments
+        if newest_first:
+            segments = reversed(segments)
+        for segment in segments:
+            if (kind is not None and kind not in segment.kinds) or \
+                    (start is not None and segment.end_time < start) or \
+                    (end is not None and segment.start_time > end) or \
+                    (before is not None and segment.first_seq >= before):
+                continue
+            entries = self._load(segment)
+            last = segment.last_seq if before is None else min(segment.last_seq, before - 1)
+            seqs = range(segment.first_seq, last + 1)
+            if newest_first:
+                seqs = reversed(seqs)
+            for seq in seqs:
+                entry_time, code, args = entries[seq - segment.first_seq]
+                if (kind is None or KIND_OF[code] == kind) and (start is None or entry_time >= start) and \
+                        (end is None or entry_time <= end):
+                    yield LogEntry(seq, self._epoch + entry_time, code, args)
+
+    def _filters(self, kind, start, end):
+        """Checks the kind and converts the Unix time range to the monotonic clock of the entries."""
+        if kind is not None and kind not in self._kind_seqs:
+            raise ValueError(f"Unknown log entry kind: {kind!r}")
+        return (kind, None if start is None else start - self._epoch,
+                None if end is None else end - self._epoch)
+
+    def query(self, kind=None, start=None, end=None, before=None, limit=50):
+        """Returns a page of entries, starting from the most recent one. The entries can be filtered by kind and
+        by a time range given as Unix timestamps (both ends included). `before` is a sequence number: only the
+        entries numbered below it are returned, so the seq of the last entry of a page is the cursor of the next
+        one, whatever is logged or evicted in between."""
+        if isinstance(limit, bool) or not isinstance(limit, int) or limit < 1:
+            raise ValueError(f"Invalid limit: {limit!r} (expected a positive integer)")
+        kind, start, end = self._filters(kind, start, end)
+        with self._lock:
+            view, lo, hi = self._memory_range(kind, start, end)
+            if before is not None:
+                hi = max(lo, min(hi, view.count_before(before)))
+            page = [self._entry(view.seq(index)) for index in range(hi - 1, max(lo, hi - limit) - 1, -1)]
+            if len(page) < limit and self._segments:
+                for entry in self._segment_entries(kind, start, end, True, before=before):
+                    page.append(entry)
+                    if len(page) == limit:
+                        break
+        return page
+
+    def count(self, kind=None, start=None, end=None):
+        """Returns the number of entries in memory that match the filters."""
+        filters = self._filters(kind, start, end)
+        with self._lock:
+            _, lo, hi = self._memory_range(*filters)
+        return hi - lo
+
+    def entries(self, kind=None, start=None, end=None):
+        """Generator which yields the matching entries from the oldest to the most recent, disk segments first.
+        Only the entries logged before the call are yielded. Those in memory are read CHUNK_SIZE at a time under
+        the lock, so other threads can go on logging; if the entries still to be read are evicted meanwhile, the
+        generator stops there rather than yield overwritten ones."""
+        kind, start, end = self._filters(kind, start, end)
+        with self._lock:  # The bounds are taken together, as they were when the generator was called
+            segments = list(self._segments)
+            view, lo, hi = self._memory_range(kind, start, end)
+            first, last = (view.seq(lo), view.seq(hi - 1)) if hi > lo else (0, -1)
+        yield from self._segment_entries(kind, start, end, False, segments)
+        seq = first
+        while seq <= last:
+            with self._lock:
+                if seq < self._first:  # Evicted (and maybe overwritten) while the entries before were yielded
+                    return
+                if kind is None:
+                    seqs = range(seq, min(seq + CHUNK_SIZE, last + 1))
+                else:  # The kind index is searched again each time, as evictions compact it
+                    kind_seqs = self._kind_seqs[kind]
+                    index = bisect_left(kind_seqs, seq, self._kind_start[kind])
+                    seqs = [seq for seq in kind_seqs[index:index + CHUNK_SIZE] if seq <= last]
+                chunk = [self._entry(seq) for seq in seqs]
+            if not chunk:
+                return
+            yield from chunk
+            seq = chunk[-1].seq + 1
+
+    def __len__(self):
+        """Number of entries kept, in memory and on disk."""
+        return self._next - self._dropped
+
+    def __iter__(self):
+        """Iterates over the entries in memory from the most recent to the oldest."""
+        for seq in range(self._next - 1, self._first - 1, -1):
+            yield self._entry(seq)
+
+    @property
+    def next_seq(self):
+        """Sequence number the next entry will get. Unlike len(), it never goes down when entries are evicted."""
+        return self._next
+
+    @property
+    def segments(self):
+        return list(self._segments)
+
+    @property
+    def dropped(self):
+        return self._dropped
@@ -0,0 +1,210 @@
+"""Command line interface: runs interaction-menu operations as a batch, without prompts or pauses, and prints one
+machine-readable result per command.
+
+    python cli.py run --user admin --commands cmds.txt
+    printf 'start\naccelerate\nobstacle Rock 1\n' | python cli.py run --user admin
+    python cli.py run --user admin -c start -c "vehicle Car S 2 90" --format csv
+
+Commands, one per line (blank lines and lines starting with # are skipped; quote names with spaces):
+
+    start | accelerate | brake | change_direction | stop | state
+    change_lane LANE
+    obstacle TYPE LANE [POSITION]                      TYPE is a name ("Traffic cone") or a LiDAR code (1-5)
+    sign CODE
+    vehicle TYPE DIRECTION LANE VELOCITY [POSITION]    TYPE is a name or a V2V code (1-5)
+    add_user NAME SURNAME USERNAME
+    delete_user USERNAME
+
+Each result holds the line number, the command, whether it succeeded, the car state after it and the car log
+messages it produced (or the error). The exit status is 0 when every command succeeded, 1 when one failed and 2 when
+the user can't log in.
+"""
+
+import argparse
+import csv
+import json
+import shlex
+import sys
+from time import time
+
+from driverless_car import (LANES, OBSTACLE_TYPES, USER_DB_PATH, VEHICLE_TYPES, Obstacle, Session,
+                            SimulationEngine, TrafficSign, User, Vehicle)
+from userstore import UserStore
+
+RESULT_FIELDS = ('line', 'command', 'ok', 'status', 'lane', 'direction', 'velocity', 'messages', 'error')
+
+
+class CommandError(ValueError):
+    """Raised for a command that can't be carried out as written."""
+
+
+def _type_name(text, table):
+    """Accepts a type name or its code in a sensor's code -> name table."""
+    if text.isdigit() and int(text) in table:
+        return table[int(text)]
+    if text in table.values():
+        return text
+    raise CommandError(f"unknown type {text!r} (one of {', '.join(table.values())})")
+
+
+def _lane(text):
+    lane = int(text)
+    if lane not in LANES:
+        raise CommandError(f"lane {lane} doesn't exist")
+    return lane
+
+
+def _position(args, index):
+    return float(args[index]) if len(args) > index else None
+
+
+def _obstacle(runner, type, lane, *position):
+    runner.engine.send(Obstacle(_type_name(type, OBSTACLE_TYPES), _lane(lane), time(), _position(position, 0)))
+
+
+def _vehicle(runner, type, direction, lane, velocity, *position):
+    direction = direction.upper()
+    if direction not in ('N', 'S'):
+        raise CommandError(f"direction {direction!r} must be N or S")
+    runner.engine.send(Vehicle(_type_name(type, VEHICLE_TYPES), direction, _lane(lane), int(velocity),
+                               _position(position, 0)))
+
+
+def _sign(runner, code):
+    runner.engine.send(TrafficSign(int(code)))
+
+
+def _change_lane(runner, lane):
+    car = runner.session.car
+    if runner.session.control_unit.status and abs(_lane(lane) - car.lane) != 1:
+        raise CommandError(f"the car can only move from lane {car.lane} to a neighbouring lane")
+    return runner.engine.change_lane(int(lane))  # False when the car is off
+
+
+def _add_user(runner, name, surname, username):
+    return runner.session.control_unit.register_user(name, surname, username)
+
+
+def _delete_user(runner, username):
+    return runner.session.control_unit.remove_user(username)
+
+
+# Command -> (function, number of arguments, number of optional arguments)
+COMMANDS = {
+    'start': (lambda runner: runner.engine.start(), 0, 0),
+    'accelerate': (lambda runner: runner.engine.accelerate(), 0, 0),
+    'brake': (lambda runner: runner.engine.brake(), 0, 0),
+    'change_direction': (lambda runner: runner.engine.change_direction(), 0, 0),
+    'stop': (lambda runner: runner.engine.stop(), 0, 0),
+    'state': (lambda runner: None, 0, 0),
+    'change_lane': (_change_lane, 1, 0),
+    'obstacle': (_obstacle, 2, 1),
+    'sign': (_sign, 1, 0),
+    'vehicle': (_vehicle, 4, 1),
+    'add_user': (_add_user, 3, 0),
+    'delete_user': (_delete_user, 1, 0),
+}
+
+
+class BatchRunner:
+    """Carries out commands on a headless session as the given user."""
+
+    def __init__(self, session):
+        self.session = session
+        # Vehicles go through the V2V module, as they do from the interaction menu
+        self.engine = SimulationEngine(session.control_unit, session.sign_db, comms=session.v2vcomms)
+        self._log = session.control_unit.log
+
+    def perform(self, action, **result):
+        """Calls action() and returns the result fields: ok (False if the action returned False or raised a
+        ValueError or TypeError), the car state after it and the car log messages it produced."""
+        first = self._log.next_seq  # Sequence number of the first message of the action
+        result.update(ok=True, error=None)
+        try:
+            result['ok'] = action() is not False
+        except (ValueError, TypeError) as error:  # CommandError, bad numbers and unsupported events
+            result.update(ok=False, error=str(error))
+        car = self.session.car
+        result.update(status=self.session.control_unit.status, lane=car.lane, direction=car.direction,
+                      velocity=car.velocity)
+        new = self._log.next_seq - first
+        result['messages'] = [entry.text for entry in reversed(self._log.query(limit=new))
+                              if entry.seq >= first] if new else []
+        return result
+
+    def command(self, text):
+        """Carries out one command line. Returns what the command's function returned."""
+        words = shlex.split(text)
+        function, required, optional = COMMANDS.get(words[0], (None, 0, 0))
+        if function is None:
+            raise CommandError(f"unknown command {words[0]!r}")
+        if not required <= len(words) - 1 <= required + optional:
+            raise CommandError(f"{words[0]} takes {required}{f'-{required + optional}' if optional else ''} "
+                               f"argument(s)")
+        return function(self, *words[1:])
+
+    def execute(self, line_no, text):
+        """Carries out one command line. Returns its result as a dict of RESULT_FIELDS."""
+        result = self.perform(lambda: self.command(text), line=line_no, command=text)
+        return {field: result[field] for field in RESULT_FIELDS}
+
+    def run(self, lines):
+        """Generator which carries out the command lines and yields their results."""
+        for line_no, line in enumerate(lines, start=1):
+            text = line.strip()
+            if text and not text.startswith('#'):
+                yield self.execute(line_no, text)
+
+
+def write_results(results, file, format='jsonl'):
+    """Writes the results as JSON lines or CSV (messages joined with ' | '). Returns the number of failed
+    commands."""
+    failed = 0
+    if format == 'csv':
+        writer = csv.writer(file)
+        writer.writerow(RESULT_FIELDS)
+    for result in results:
+        failed += not result['ok']
+        if format == 'csv':
+            writer.writerow([' | '.join(result[field]) if field == 'messages' else result[field]
+                             for field in RESULT_FIELDS])
+        else:
+            file.write(json.dumps(result) + '\n')
+    return failed
+
+
+def run(args):
+    session = Session(userdb=UserStore(args.userdb, User), verbose=False)
+    if not session.control_unit.auth(args.user):
+        print(f"The user {args.user!r} is not authorized to use the system.", file=sys.stderr)
+        return 2
+    if args.command:
+        lines = args.command
+    elif args.commands in (None, '-'):
+        lines = sys.stdin
+    else:
+        lines = open(args.commands)
+    try:
+        failed = write_results(BatchRunner(session).run(lines), sys.stdout, args.format)
+    finally:
+        if lines is not args.command and lines is not sys.stdin:
+            lines.close()
+        session.control_unit.users.close()
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='action', required=True)
+    run_parser = commands.add_parser('run', help="run a batch of commands")
+    run_parser.add_argument('--user', required=True, help="username to log in with")
+    run_parser.add_argument('--commands', help="file of commands, one per line (default: standard input)")
+    run_parser.add_argument('-c', '--command', action='append', help="a command to run (repeatable)")
+    run_parser.add_argument('--format', choices=('jsonl', 'csv'), default='jsonl')
+    run_parser.add_argument('--userdb', default=USER_DB_PATH, help="user database file")
+    args = parser.parse_args(argv)
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,25 @@
+import shlex
+import threading
 from abc import ABC, abstractmethod
+from functools import partial, wraps
+from itertools import chain
 from time import sleep
-from sys import exit
 from datetime import datetime
+from time import perf_counter_ns, time
+
+from arbiter import PRIORITIES, CarArbiter
+from carlog import TIME_FORMAT, CarLog, Event
+from export import export, log_rows, obstacle_rows, user_rows, vehicle_rows
+from history import ObstacleHistory, VehicleHistory, page_limit
+from latency import KINDS as LATENCY_KINDS, LatencyStats
+from roadindex import RoadIndex
+from rules import LANES, DecisionCache, default_rules
+from userstore import UserStore
+
+# Type code -> name tables of the LiDAR and the V2V module. The detection histories store the codes.
+OBSTACLE_TYPES = {1: 'Rock', 2: 'Pedestrian', 3: 'Animal', 4: 'Garbage', 5: 'Traffic cone'}
+VEHICLE_TYPES = {1: 'Car', 2: 'Van', 3: 'SUV', 4: 'Truck/Lorry', 5: 'Trailer'}
+PAGE_SIZE = 50  # Rows per page of the listings
 
 
 # Defining interfaces:
@@ -9,17 +27,21 @@ from datetime import datetime
 class MainControlUnit(ABC):
     """The control unit organizes and saves all the important data for the car"""
 
-    def __init__(self, admin, userdb=None, users=None, obstacles=None, status=False, log=None, active_user=None):
+    def __init__(self, admin, car, userdb=None, users=None, obstacles=None, status=False, log=None, active_user=None,
+                 verbose=True, rules=None, decision_cache=None, recorder=None, speed_step=10, latency=True):
         self._admin = admin
-        self._userdb = []
-        self._users = {admin.username}
-        self._userdb = []
+        self._car = car
+        self._userdb = userdb
         self._obstacles = []
         self._status = status
-        self._log = []
+        self._log = log
         self._active_user = None
-
-        self._userdb.append(admin)
+        self._verbose = verbose
+        self._rules = rules
+        self._cache = None
+        self._recorder = recorder
+        self.speed_step = speed_step
+        self._latency = None
 
     # Abstract methods
 
@@ -56,7 +78,7 @@ class MainControlUnit(ABC):
         raise NotImplementedError
 
     @abstractmethod
-    def change_lane(self):
+    def change_lane(self, new_lane):
         raise NotImplementedError
 
     @abstractmethod
@@ -122,7 +144,7 @@ class MainControlUnit(ABC):
         raise NotImplementedError
 
     @abstractmethod
-    def update_log(self):
+    def update_log(self, code, *args):
         raise NotImplementedError
 
     @abstractmethod
@@ -133,11 +155,14 @@ class MainControlUnit(ABC):
 class SmartVehicle(ABC):
     """The abstract class that serves as a system's vehicle and automobile interface."""
 
-    def __init__(self, type, direction, lane, velocity=0):
+    __slots__ = ('_type', '_velocity', '_direction', '_lane', '_position')  # No __dict__ for the many vehicles
+
+    def __init__(self, type, direction, lane, velocity=0, position=None):
         self._type = type
         self._velocity = velocity
         self._direction = direction
         self._lane = lane
+        self._position = position
 
     @property
     @abstractmethod
@@ -179,6 +204,16 @@ class SmartVehicle(ABC):
     def lane(self, value):
         raise NotImplementedError
 
+    @property
+    @abstractmethod
+    def position(self):
+        raise NotImplementedError
+
+    @position.setter
+    @abstractmethod
+    def position(self, value):
+        raise NotImplementedError
+
 
 class Sensor(ABC):
     """The abstract base class for LiDAR interface"""
@@ -228,10 +263,13 @@ class CommsModule(ABC):
 class Obstacles(ABC):
     """Abstract class for the obstacles"""
 
-    def __init__(self, type, lane, timestamp):
+    __slots__ = ('_type', '_lane', '_timestamp', '_position')  # No __dict__ for the many obstacles
+
+    def __init__(self, type, lane, timestamp, position=None):
         self._type = type  # Type of obstacle as evaluated by Lidar
         self._lane = lane  # Refers to the lane where the obstacle is located
         self._timestamp = timestamp  # Date and time of detection
+        self._position = position  # Position along the road in metres, if known
 
     @property
     @abstractmethod
@@ -248,6 +286,11 @@ class Obstacles(ABC):
     def timestamp(self):
         raise NotImplementedError
 
+    @property
+    @abstractmethod
+    def position(self):
+        raise NotImplementedError
+
 
 class SystemUser(ABC):
     """Abstract class for the user"""
@@ -258,7 +301,7 @@ class SystemUser(ABC):
         self._username = username
 
     @abstractmethod
-    def turn_on(self):
+    def turn_on(self, control_unit):
         # Turns on the car
         raise NotImplementedError
 
@@ -300,6 +343,8 @@ class SignRecognitionSystem(ABC):
 class TSign(ABC):
     """Abstract class for traffic sign"""
 
+    __slots__ = ('_type', '_desc')
+
     def __init__(self, type):
         self._type = type
 
@@ -337,13 +382,16 @@ class SignDB(ABC):
 
 class Vehicle(SmartVehicle):
     """A vehicle superclass which is initiated by vehicle objects and subclassed by the car class.
-    With four attributes and a getter/setter method"""
+    With five attributes and a getter/setter method. The position along the road (in metres) is optional."""
+
+    __slots__ = ()
 
-    def __init__(self, type, direction, lane, velocity=0):
+    def __init__(self, type, direction, lane, velocity=0, position=None):
         self._type = type
         self._velocity = velocity
         self._direction = direction
         self._lane = lane
+        self._position = position
 
     @property
     def type(self):
@@ -377,378 +425,280 @@ class Vehicle(SmartVehicle):
     def lane(self, value):
         self._lane = value
 
+    @property
+    def position(self):
+        return self._position
+
+    @position.setter
+    def position(self, value):
+        self._position = value
+
 
 class Car(Vehicle):
     """The vehicle superclass is subclassed, and a function is added
         that enables printing of the state of the vehicle"""
 
+    def __init__(self, type, direction, lane, velocity=0, position=0.0):
+        super().__init__(type, direction, lane, velocity, position)  # The car starts at the beginning of the road
+
     def print_state(self):
         print(f"Vehicle type: {self.type}")
         print(f"Velocity: {self.velocity}")
         print(f"Direction: {self.direction}")
         print(f"Lane: {self.lane}")
+        print(f"Position: {self.position} m")
+
+
+def car_update(method):
+    """Makes a driving command an update of the car state, applied under the car's lock (see arbiter.py)."""
+    priority = PRIORITIES['command']
+
+    @wraps(method)
+    def update(self, *args):
+        return self._arbiter.submit(priority, method, self, *args)
+    return update
 
 
 class ControlUnit(MainControlUnit):
     """This control unit controls the interaction between the user and the car"""
 
-    def __init__(self, admin, userdb=None, users=None, obstacles=None, status=False, log=None, active_user=None):
+    def __init__(self, admin, car, userdb=None, users=None, obstacles=None, status=False, log=None, active_user=None,
+                 verbose=True, rules=None, decision_cache=None, recorder=None, speed_step=10, latency=True):
         self._admin = admin  # Stores the admin user
-        self._userdb = []
-        self._users = {admin.username}  # Adds username of the admin to the users set.
-        self._userdb = []
-        self._obstacles = []
+        self._car = car  # The car driven by this control unit
+        # User database keyed by username. The admin is kept apart from it, so it is never persisted or deleted.
+        self._userdb = userdb if userdb is not None else UserStore(user_class=User)
+        self._obstacles = ObstacleHistory(OBSTACLE_TYPES, Obstacle)  # Every obstacle detected, stored by column
+        self._obstacle_index = RoadIndex()  # Obstacles with a known position, by lane and position
         self._status = status  # A boolean to show the status of the car (e.g. on/off)
-        self._log = []  # A list for the car log. It will be used as a stack i.e. the last message will be read first
+        self._log = log if log is not None else CarLog()  # Bounded car log, read starting from the latest message
         self._active_user = None
-
-        self._userdb.append(admin)  # Adds admin user to the user database where all User objects are stored
+        self._verbose = verbose  # When False, the control unit runs headless and prints nothing
+        self._rules = rules if rules is not None else default_rules()  # Compiled decision tables
+        # Optional LRU cache of recent decisions, holding up to decision_cache of them
+        self._cache = DecisionCache(self._rules, decision_cache) if decision_cache else None
+        self._decisions = self._cache if self._cache is not None else self._rules  # Where decisions are taken from
+        self._recorder = recorder  # Optional telemetry recorder (see telemetry.py) of every event evaluated
+        self.speed_step = speed_step  # km/h added or taken off by each accelerate or brake
+        # Latency histograms of the events handed over by the sensors and engines (see latency.py), on by default
+        self._latency = LatencyStats() if latency else None
+        self._arbiter = CarArbiter()  # Applies the decisions and commands one at a time, whatever thread sends them
+
+    def notify(self, text):
+        """Shows a message to the operator unless the control unit runs headless."""
+        if self._verbose:
+            print(text)
 
     def add_user(self):
         """Adds a user to the user list."""
         new_name = (input("\nPlease enter your name: "))
         new_surname = (input("Please enter your surname: "))
         new_username = (input("Please enter a valid username: "))
-
-        # Creating a new user object and adding it to the user database
-        self._userdb.append(User(new_name, new_surname, new_username))
-
-        # Adding username to the user list
-        if new_username in self._users:
-            print("\nSorry, the username already exists! Returning to the main menu.")
-            self.update_log("Attempted to add a new user. The user already exists.")
-        else:
-            self._users.add(new_username)  # Adding username to the user database
-            print("\nThe user has been added successfully! Returning to the main menu.")
-            self.update_log(f"The user '{new_username}' has been added.")
-
-    def list_users(self):
-        """Lists all the valid users of the system"""
+        self.register_user(new_name, new_surname, new_username)
+
+    def register_user(self, name, surname, username):
+        """Adds a new user to the user database. Returns False if the username already exists."""
+        if username == self._admin.username or not self._userdb.add(User(name, surname, username)):
+            self.notify("\nSorry, the username already exists! Returning to the main menu.")
+            self.update_log(Event.USER_EXISTS)
+            return False
+        self.notify("\nThe user has been added successfully! Returning to the main menu.")
+        self.update_log(Event.USER_ADDED, username)
+        return True
+
+    def list_users(self, prefix='', limit=PAGE_SIZE, cursor=None):
+        """Lists a page of the valid users of the system whose username starts with a prefix, in alphabetical order
+        (the admin first). Returns the cursor of the next page, or None on the last page."""
+        page = self._userdb.page(prefix, cursor, limit)
         print("\n", 30 * "*", "THE CURRENT AUTHORIZED USERS OF THE SYSTEM", 30 * "*", "\n")
         print("{:<40} {:<28} {:<40}".format('NAME', 'SURNAME', 'USERNAME'))
-        for user in self._userdb:
+        if cursor is None and self._admin.username.startswith(prefix):
+            page.items.insert(0, self._admin)
+        for user in page.items:
             print("{:<40} {:<28} {:<40}".format(user.name, user.surname, user.username))
         print("\n", 102 * "*", "\n")
-        sleep(1)
+        return page.next
 
     def delete_user(self):
         """Deletes a user from the system"""
         del_user = input("\nPlease enter the username of the user you wish to delete: ")
+        self.remove_user(del_user)
+
+    def remove_user(self, del_user):
+        """Deletes a user from the user database. Returns False if the user can't be deleted."""
         if del_user == self._active_user:
-            print(
+            self.notify(
                 "\nSorry, the user you are trying to delete is the active user! Change the user first to"
                 " delete this user.\n")
-            self.update_log(f"Attempted to delete the active user '{del_user}'. Request rejected.")
-            sleep(1)
+            self.update_log(Event.DELETE_ACTIVE_USER, del_user)
         elif del_user == self._admin.username:
-            print("\nYou are trying to delete the admin user! Sorry, you cannot delete the system admin.\n")
-            self.update_log(f"Attempted to delete the admin user. Request rejected.")
-            sleep(1)
+            self.notify("\nYou are trying to delete the admin user! Sorry, you cannot delete the system admin.\n")
+            self.update_log(Event.DELETE_ADMIN)
+        elif self._userdb.delete(del_user):
+            self.notify("\nThe username has been deleted from the system! Returning to the main menu.\n")
+            self.update_log(Event.USER_DELETED, del_user)
+            return True
         else:
-            if del_user in self._users:
-                self._users.remove(del_user)  # Removes the username from the list of users
-                for user in self._userdb:  # Removes the User object from user database
-                    if del_user == user.username:
-                        self._userdb.remove(user)
-                print("\nThe username has been deleted from the system! Returning to the main menu.\n")
-                self.update_log(f"The user '{del_user}' has been deleted.")
-                sleep(1)
-            else:
-                print("\nSorry this user doesn't exist! Returning to the main menu.")
-                self.update_log("Attempted to delete a user. The user doesn't exist.")
-                sleep(1)
+            self.notify("\nSorry this user doesn't exist! Returning to the main menu.")
+            self.update_log(Event.DELETE_UNKNOWN_USER)
+        return False
+
+    def is_user(self, username):
+        """Checks if the username belongs to the admin or to a user in the user database."""
+        return username == self._admin.username or username in self._userdb
 
     def auth(self, login):
         """ This authenticates the user, and checks if the username entered by the user is in the system.
-        Users set is used for authorization even though there is a user database that contains all User objects
-        in the system since membership testing with sets is simpler (e.g. rejecting duplicate usernames, etc.)"""
-        if login in control_unit.users:
+        The user database is keyed by username, so the check takes the same time however many users there are.
+        Returns True if the user has logged in."""
+        if self.is_user(login):
             self.successfully_ = "You have logged in successfully!\n"
-            print(self.successfully_)
-            self.update_log(f"The user '{login}' has been authorized to use the system.")
+            self.notify(self.successfully_)
+            self.update_log(Event.USER_AUTHORIZED, login)
             self.active_user = login
-            sleep(1)
-            main_menu()
-        else:
-            print("You are not authorized to use the system!\n")
-            self.update_log("Unauthorized attempt to access the system.")
-            sleep(1)
-            exit()
+            return True
+        self.notify("You are not authorized to use the system!\n")
+        self.update_log(Event.UNAUTHORIZED)
+        return False
 
+    @car_update
     def start_car(self, vehicle):
         """Activates the car by setting boolean to True."""
         if self.status:
-            print("\nSorry, the car has already been started. It is not possible to start it again.\n")
-            sleep(1)
+            self.notify("\nSorry, the car has already been started. It is not possible to start it again.\n")
         else:
             self.status = True
             vehicle.velocity = 60
-            print("\nThe car has started and the speed has been set to 60 km/h.\n")
-            self.update_log("The car has been activated. The car's speed is set to 60 km/h.")
-            sleep(1)
-        interact_menu()
+            self.notify("\nThe car has started and the speed has been set to 60 km/h.\n")
+            self.update_log(Event.CAR_STARTED)
 
+    @car_update
     def accelerate(self, vehicle):
-        """Accelerates the car by 10 km/h at a time."""
+        """Accelerates the car by speed_step (10 km/h by default) at a time."""
         if not self.status:  # Checks if the car has started.
-            print("\nSorry, the car is not on. Please start the car and try again.\n")
-            self.update_log("Attempted to change the direction without starting the car. No action is taken.")
+            self.notify("\nSorry, the car is not on. Please start the car and try again.\n")
+            self.update_log(Event.ACCELERATE_CAR_OFF)
         else:
-            vehicle.velocity += 10
-            print(f"\nThe car has accelerated. The car's speed is set to {vehicle.velocity} km/h.\n")
-            self.update_log(f"The car has been accelerated. The car's speed is set to {vehicle.velocity} km/h.")
+            vehicle.velocity += self.speed_step
+            self.notify(f"\nThe car has accelerated. The car's speed is set to {vehicle.velocity} km/h.\n")
+            self.update_log(Event.ACCELERATED, vehicle.velocity)
 
+    @car_update
     def brake(self, vehicle):
-        """Reduces the car speed by 10 km/h at a time."""
+        """Reduces the car speed by speed_step (10 km/h by default) at a time."""
         if not self.status:  # Checks if the car has started.
-            print("\nSorry, the car is not on. Please start the car and try again.\n")
-            self.update_log("Attempted to slow down without starting the car. No action is taken.")
+            self.notify("\nSorry, the car is not on. Please start the car and try again.\n")
+            self.update_log(Event.BRAKE_CAR_OFF)
         else:
             if vehicle.velocity == 0:
-                print("\nSorry, the car has stopped already. It is not possible to reduce the speed.\n")
-                self.update_log("Attempted to reduce the speed the car. The car is already stopped.")
+                self.notify("\nSorry, the car has stopped already. It is not possible to reduce the speed.\n")
+                self.update_log(Event.BRAKE_CAR_STOPPED)
             else:
-                vehicle.velocity -= 10
-                print(f"\nThe car's speed has been reduced. The car's speed is set to {vehicle.velocity} km/h.\n")
-                self.update_log(f"The car's speed has been reduced. The car's speed is set to {vehicle.velocity} km/h.")
+                vehicle.velocity -= self.speed_step
+                self.notify(f"\nThe car's speed has been reduced. The car's speed is set to {vehicle.velocity} km/h.\n")
+                self.update_log(Event.BRAKED, vehicle.velocity)
 
+    @car_update
     def change_direction(self):
         """Changes the driection of the car (N = North to S = South or S = South to N = North).
         REMEMBER: Only valid directions are North (N) and South (S)."""
         if not self.status:  # Checks if the car is on.
-            print("\nSorry, the car is not on. Please activate the car first.\n")
-            self.update_log("Attempted to change the direction without starting the car. No action is taken.")
+            self.notify("\nSorry, the car is not on. Please activate the car first.\n")
+            self.update_log(Event.DIRECTION_CAR_OFF)
         else:
-            if car.direction == "N":
-                car.direction = "S"
-                print(f"\nThe car's direction has been changed. Now travelling: {car.direction}\n")
-                self.update_log(f"The car's direction has been changed. New direction is: {car.direction}.")
-                sleep(1)
+            if self._car.direction == "N":
+                self._car.direction = "S"
+                self.notify(f"\nThe car's direction has been changed. Now travelling: {self._car.direction}\n")
+                self.update_log(Event.DIRECTION_CHANGED, self._car.direction)
             else:
-                car.direction = "N"
-                print(f"\nThe car's direction has been changed. Now travelling: {car.direction}\n")
-                self.update_log(f"The car's direction has been changed. New direction is: {car.direction}.")
-                sleep(1)
+                self._car.direction = "N"
+                self.notify(f"\nThe car's direction has been changed. Now travelling: {self._car.direction}\n")
+                self.update_log(Event.DIRECTION_CHANGED, self._car.direction)
 
-    def change_lane(self):
+    @car_update
+    def change_lane(self, new_lane):
         """Changes the car's lane. REMEMBER: There are three lanes and the car's initial lane is 1. Lane 1 is
-        the slowest lane and the Lane 3 is the fastest one."""
+        the slowest lane and the Lane 3 is the fastest one. The car can only move to a neighbouring lane.
+        Returns True if the lane has been changed."""
         if not self.status:  # Checks if the car is on.
-            print("\nSorry, the car is not on. Please start the car and try again.\n")
-            self.update_log("Attempted to change the lane without starting the car. No action is taken.")
-        else:
-            if car.lane == 1:
-                try:
-                    new_lane = int(input("""\nPlease enter 2 if you want to change lane to Lane 2 or enter 0 to go back 
-                    to the main menu. Your choice [0 or 2]: """))
-                    if new_lane == 2:
-                        car.lane = 2
-                        print(f"\nThe car changed its lane to Lane {car.lane}.\n")
-                        self.update_log(f"The car's lane has been changed. New lane is: {car.lane}.")
-                        sleep(1)
-                    elif new_lane == 0:
-                        interact_menu()
-                    else:
-                        print("\nPlease enter a valid value [1 or 3]")
-                        self.change_lane()
-                except ValueError:
-                    print("\nPlease provide a valid input.")
-            elif car.lane == 2:
-                try:
-                    new_lane = int(input(f"""\nThe car is on lane {car.lane}. Please enter the lane that you'd like the 
-                    car to switch to [1 or 3] or enter 0 to go back to the interaction menu. Your choice [1 or 3]: """))
-                    if new_lane == 1:
-                        car.lane = 1
-                        print(f"\nThe car changed its lane to Lane {car.lane}.\n")
-                        self.update_log(f"The car's lane has been changed. New lane is: {car.lane}.")
-                        sleep(1)
-                    elif new_lane == 3:
-                        car.lane = 3
-                        print(f"\nThe car changed its lane to Lane {car.lane}.\n")
-                        self.update_log(f"The car's lane has been changed. New lane is: {car.lane}.")
-                        sleep(1)
-                    elif new_lane == 0:
-                        interact_menu()
-                    else:
-                        print("\nPlease enter a valid value [1 or 3]")
-                        self.change_lane()
-                except ValueError:
-                    print("\nPlease provide a valid input.")
-            elif car.lane == 3:
-                try:
-                    new_lane = int(input("""\nPlease enter 2 if you want to change lane to Lane 2 or enter 0 to go back 
-                    to the main menu. Your choice [0 or 2]: """))
-                    if new_lane == 2:
-                        car.lane = 2
-                        print(f"\nThe car changed its lane to Lane {car.lane}.\n")
-                        self.update_log(f"The car's lane has been changed. New lane is: {car.lane}.")
-                        sleep(1)
-                    elif new_lane == 0:
-                        interact_menu()
-                    else:
-                        print("\nPlease enter a valid value [1 or 3]")
-                        self.change_lane()
-                except ValueError:
-                    print("\nPlease provide a valid input.")
-
+            self.notify("\nSorry, the car is not on. Please start the car and try again.\n")
+            self.update_log(Event.LANE_CAR_OFF)
+            return False
+        if new_lane not in (1, 2, 3) or abs(new_lane - self._car.lane) != 1:
+            if self._car.lane == 2:
+                self.notify("\nPlease enter a valid value [1 or 3]")
+            else:
+                self.notify("\nPlease enter a valid value [2]")
+            return False
+        self._car.lane = new_lane
+        self.notify(f"\nThe car changed its lane to Lane {self._car.lane}.\n")
+        self.update_log(Event.LANE_CHANGED, self._car.lane)
+        return True
+
+    @car_update
     def stop(self, vehicle):
         """Stops the car by setting the boolean to False."""
         if not self._status:  # Checks if the car is on.
-            print("\nSorry, the car is not on. It is not possible to stop the car.\n")
-            self.update_log("Attempted to stop the car. The car is not on.")
+            self.notify("\nSorry, the car is not on. It is not possible to stop the car.\n")
+            self.update_log(Event.STOP_CAR_OFF)
         else:
             if vehicle.velocity == 0:
-                print("\nThe car has already been stopped. You can't stop it again.\n")
-                self.update_log("Attempted to stop the car. The car is already stopped.")
-                sleep(1)
+                self.notify("\nThe car has already been stopped. You can't stop it again.\n")
+                self.update_log(Event.STOP_CAR_STOPPED)
             else:
                 vehicle.velocity = 0
-                print("\nThe car has stopped.\n")
-                self.update_log("The car has stopped.")
-                sleep(1)
+                self.notify("\nThe car has stopped.\n")
+                self.update_log(Event.STOPPED)
 
     def eval_sign(self, sign):
         """Evaluates the sign received from the TSRS and takes necessary actions."""
-        # Unpacking the object attributes to variables for easier processing
-        code = sign.type
-        desc = sign.desc
-
-        if code == 1:
-            if car.velocity <= 60:
-                print(f"\nCar's speed is {car.velocity}. No action is taken.\n")
-                self.update_log(f"{desc} sign detected. Car's speed is below 50. No action taken.")
-            else:
-                car.velocity = 60
-                print("\nCar's speed is set to 60 km/h.\n")
-                self.update_log(f"{desc} sign detected. Car's speed is set to 50 km/h.")
-        elif code == 2:
-            if car.velocity <= 100:
-                print(f"\nCar's speed is {car.velocity}. No action is taken.\n")
-                self.update_log(f"{desc} sign detected. Car's speed is {car.velocity}. No action taken.")
+        speed = self._car.velocity
+        decision = self._decisions.sign(sign.type, speed)
+        if decision is not None:  # Sign codes the rules don't know are ignored
+            if decision.set_speed is not None:
+                speed = self._car.velocity = decision.set_speed
+            elif decision.scale_speed is not None:
+                speed = self._car.velocity = speed * decision.scale_speed
+            if self._verbose:
+                print(decision.say.format(velocity=speed))
+            if decision.log_args == 1:  # Some messages don't show the speed
+                self.update_log(decision.log, sign.desc)
             else:
-                car.velocity = 100
-                print("\nCar's speed is set to 100 km/h.\n")
-                self.update_log(f"{desc} sign detected. Car's speed is set to 90 km/h.")
-        elif code == 3:
-            if car.velocity == 0:
-                print("\nThe car has already been stopped. No action taken.\n")
-                self.update_log(f"{desc} sign detected. The car is already stopped.")
-            else:
-                car.velocity = 0
-                print("\nThe car has been stopped.\n")
-                self.update_log(f"{desc} sign detected. Car has been stopped.")
-        elif code == 4:
-            if car.velocity == 0:
-                print("\nThe car is not moving. No action is taken.\n")
-                self.update_log(f"{desc} sign detected. Car is already stopped. No action is taken.")
-            else:
-                car.velocity = car.velocity * 0.7
-                print(
-                    f"\nDue to slippery road, the speed of the car is reduced 30%. The current speed of the car is {car.velocity}.\n")
-                self.update_log(f"{desc} sign detected. The speed is reduced 30% and set to {car.velocity}.")
-        elif code == 5:
-            if car.velocity >= 50:
-                print(f"\nCar's speed is {car.velocity}. No action is taken.\n")
-                self.update_log(f"{desc} sign detected. Car's speed is {car.velocity}. No action is taken.")
-            else:
-                car.velocity = 50
-                print("\nCar's speed is set to 60 km/h.\n")
-                self.update_log(f"{desc} sign detected. Car's speed is set to {car.velocity}.")
-
-        # No corner cases are included here, as the input is already checked for validity via try/except statements.
+                self.update_log(decision.log, sign.desc, speed)
+        if self._recorder is not None:
+            self._recorder.sign(self._car, sign)
 
     def eval_veh(self, veh):
         """Evaluates the vehicle detected by V2V Communications module and takes the necessary action."""
-        # Compares the car's information against the vehicle detected
-        if veh.direction != car.direction:  # If the vehicle and the car detected travel in opposite directions
-            if veh.lane == car.lane:  # If they are approaching each other on the same lane
-                if car.lane == 1:
-                    car.lane = 2
-                    print("\nThe car changed its lane from 1 to 2.\n")
-                    self.update_log(
-                        f"A vehicle (Lane: {veh.lane} Direction: {veh.direction}) was detected. The car changed its lane from 1 to 2.")
-                elif car.lane == 2:
-                    if car.velocity < 80:  # If the velocity is less than 80, car changes its lane to the slowest one.
-                        car.lane = 1
-                        print("\nThe car changed its lane from 2 to 1.\n")
-                        self.update_log(
-                            f"A vehicle (Lane: {veh.lane} Direction: {veh.direction}) detected. The car changed its lane from 2 to 1.")
-                    else:
-                        car.lane = 3
-                        print("\nThe car changed its lane from 2 to 3.\n")
-                        self.update_log(
-                            f"A vehicle (Lane: {veh.lane} Direction: {veh.direction}) detected. The car changed its lane from 2 to 3.")
-                else:
-                    car.lane = 2
-                    print("\nThe car changed its lane from 3 to 2.\n")
-                    self.update_log(
-                        f"A vehicle (Lane: {veh.lane} Direction: {veh.direction}) detected. The car changed its lane from 3 to 2.")
-            else:
-                print("\nThe cars are on different lanes, no action has been taken.\n")
-                self.update_log(
-                    f"A vehicle (Lane: {veh.lane} Direction: {veh.direction}) detected. No action is taken (different lane).")
+        car = self._car
+        lane, speed, veh_lane, veh_direction = car.lane, car.velocity, veh.lane, veh.direction
+        decision = self._decisions.vehicle(lane, veh_lane, veh_direction != car.direction, speed, veh.velocity > speed)
+        if decision.lane is not None:
+            car.lane = decision.lane
+        if self._verbose:
+            print(decision.say.format(lane=lane, new_lane=decision.lane))
+        if decision.lane is None:
+            self.update_log(decision.log, veh_lane, veh_direction)
         else:
-            if veh.lane == car.lane:
-                if veh.velocity <= car.velocity:
-                    print(
-                        "\nThe car is so slow to pose a threat.\n")  # It is on the same lane, but slower than our car.
-                    self.update_log(
-                        f"A vehicle (Lane: {veh.lane} Direction: {veh.direction}) detected. No action is taken (car too slow).")
-                else:
-                    if car.lane == 1:
-                        print(
-                            "\nThe car is already on the slowest lane and other car should change the lane. "
-                            "No actions are taken.\n")
-                        self.update_log(
-                            f"A vehicle (Lane: {veh.lane} Direction: {veh.direction}) detected. "
-                            f"No action is taken (car on slowest lane).")
-                    elif car.lane == 2:
-                        car.lane = 1
-                        print("\nThe car changed its lane from 2 to 1.\n")
-                        self.update_log(
-                            f"A vehicle (Lane: {veh.lane} Direction: {veh.direction}) detected. "
-                            f"The car changed its lane from 2 to 1.")
-                    else:
-                        car.lane = 2
-                        print("\nThe car changed its lane from 3 to 2.\n")
-                        self.update_log(
-                            f"A vehicle (Lane: {veh.lane} Direction: {veh.direction}) detected. "
-                            f"The car changed its lane from 3 to 2.")
-            else:
-                print("\nThe cars are on different lanes, no action has been taken.\n")
-                self.update_log(
-                    f"A vehicle (Lane: {veh.lane} Direction: {veh.direction}) detected. "
-                    f"No action is taken (different lane).")
+            self.update_log(decision.log, veh_lane, veh_direction, lane, decision.lane)
+        if self._recorder is not None:
+            self._recorder.vehicle(car, veh)
 
     def eval_obs(self, obstacle):
         """Evaluates the obstacle detected by the LiDAR and takes the necessary action."""
         self.add_obstacles(obstacle)  # Adds the obstacle to the obstacle list
-        if car.lane == obstacle.lane:
-            if car.lane == 1:
-                car.lane = 2
-                print("\nThe car changed its lane from 1 to 2.\n")
-                self.update_log(
-                    f"{obstacle.type} on lane {obstacle.lane} is detected. The car changed its lane from 1 to 2.")
-            elif car.lane == 2:
-                if car.velocity < 80:  # If the velocity is less than 80, car changes its lane to the slowest one.
-                    car.lane = 1
-                    print("\nThe car changed its lane from 2 to 1.\n")
-                    self.update_log(
-                        f"{obstacle.type} on lane {obstacle.lane} is detected. The car changed its lane from 2 to 1.")
-                else:
-                    car.lane = 3
-                    print("\nThe car changed its lane from 2 to 3.\n")
-                    self.update_log(
-                        f"{obstacle.type} on lane {obstacle.lane} is detected. The car changed its lane from 2 to 3.")
-            else:
-                car.lane = 2
-                print("\nThe car changed its lane from 3 to 2.\n")
-                self.update_log(
-                    f"{obstacle.type} on lane {obstacle.lane} is detected. The car changed its lane from 3 to 2.")
+        lane, obstacle_lane = self._car.lane, obstacle.lane
+        decision = self._decisions.obstacle(lane, obstacle_lane, self._car.velocity)
+        if decision.lane is not None:
+            self._car.lane = decision.lane
+        if self._verbose:
+            print(decision.say.format(lane=lane, new_lane=decision.lane, other_lane=obstacle_lane))
+        if decision.lane is None:
+            self.update_log(decision.log, obstacle.type, obstacle_lane)
         else:
-            print(f"\nThe car is on lane {car.lane} and obstacle is on lane {obstacle.lane}. No action is taken.\n")
-            self.update_log(
-                f"{obstacle.type} on lane {obstacle.lane} is detected. No action is taken (different lane).")
+            self.update_log(decision.log, obstacle.type, obstacle_lane, lane, decision.lane)
+        if self._recorder is not None:
+            self._recorder.obstacle(self._car, obstacle)
 
     @property
     def status(self):
@@ -760,12 +710,96 @@ class ControlUnit(MainControlUnit):
 
     @property
     def users(self):
-        return self._users
+        return self._userdb
 
     @property
     def obstacles(self):
         return self._obstacles
 
+    @property
+    def car(self):
+        return self._car
+
+    @property
+    def log(self):
+        return self._log
+
+    @property
+    def rules(self):
+        return self._rules
+
+    @rules.setter
+    def rules(self, value):
+        self._rules = value
+        if self._cache is not None:
+            self._cache.rules = value  # Drops the decisions of the old rules
+        else:
+            self._decisions = value
+
+    @property
+    def recorder(self):
+        return self._recorder
+
+    @recorder.setter
+    def recorder(self, value):
+        self._recorder = value
+
+    @property
+    def decision_cache(self):
+        return self._cache
+
+    @property
+    def latency(self):
+        return self._latency
+
+    @property
+    def arbiter(self):
+        return self._arbiter
+
+    def handoff(self, kind):
+        """Returns the decision method for 'obstacle', 'vehicle' or 'sign' events, timed into the latency histogram
+        of that kind unless latency is off. Sensors and engines hand their events over through it, so that sensors
+        on threads of their own can share the control unit: the decisions are applied one at a time, and events
+        that arrive together are decided in priority order (see arbiter.py). The time waited for the car counts in
+        the latency."""
+        evaluate = {'obstacle': self.eval_obs, 'vehicle': self.eval_veh, 'sign': self.eval_sign}[kind]
+        submit = partial(self._arbiter.submit, PRIORITIES[kind])
+        if self._latency is None:
+            return partial(submit, evaluate)
+        record = self._latency[kind].record
+
+        def handoff(event):
+            start = perf_counter_ns()
+
+            def decide(event):  # Recorded under the car's lock, which the histogram relies on
+                evaluate(event)
+                record(perf_counter_ns() - start)
+            submit(decide, event)
+        return handoff
+
+    def exclusive(self):
+        """Context manager which holds the car state still, e.g. to read several attributes of it at once."""
+        return self._arbiter.exclusive()
+
+    def list_latency(self):
+        """Lists the decision latency percentiles of each event type."""
+        print("\n", 35 * "*", "DECISION LATENCY (microseconds)", 35 * "*", "\n")
+        if self._latency is None:
+            print("Latency measurement is off.")
+        else:
+            print("{:<12} {:>10} {:>10} {:>10} {:>10} {:>10} {:>10}".format(
+                'EVENT', 'COUNT', 'MEAN', 'P50', 'P99', 'P99.9', 'MAX'))
+            for kind in LATENCY_KINDS:
+                summary = self._latency[kind].summary()
+                print("{:<12} {:>10} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f}".format(
+                    kind, summary['count'], summary['mean_us'], summary['p50_us'], summary['p99_us'],
+                    summary['p99.9_us'], summary['max_us']))
+        print("\n", 70 * "*", "\n")
+
+    def cache_stats(self):
+        """Returns the hit, miss and eviction counts of the decision cache, or None without a cache."""
+        return self._cache.stats() if self._cache is not None else None
+
     @property
     def active_user(self):
         return self._active_user
@@ -776,31 +810,68 @@ class ControlUnit(MainControlUnit):
 
     def add_obstacles(self, obstacle):
         self._obstacles.append(obstacle)
-
-    def list_obstacles(self):
-        """Lists the list of obstacles detected so far by LiDAR."""
+        if obstacle.position is not None:
+            self._obstacle_index.add(obstacle, obstacle.lane, obstacle.position)
+
+    def expire_passed(self):
+        """Removes the obstacles the car has passed from the position index. Returns the number removed."""
+        return len(self._obstacle_index.drop_behind(self._car.position, self._car.direction))
+
+    def obstacles_ahead(self, distance, lane=None):
+        """Returns the obstacles within `distance` metres ahead of the car on a lane (the car's lane by default),
+        nearest first."""
+        car = self._car
+        return [obstacle for _, obstacle in self._obstacle_index.ahead(
+            car.lane if lane is None else lane, car.position, distance, car.direction)]
+
+    def list_obstacles(self, type=None, lane=None, since=None, until=None, limit=PAGE_SIZE, cursor=None):
+        """Lists a page of the obstacles detected so far by LiDAR, the most recent first, filtered by type, lane and
+        a range of Unix times. Returns the cursor of the next page, or None on the last page."""
+        page = self._obstacles.query(type, lane, since, until, limit, cursor)
         print("\n", 35 * "*", "DETECTED OBSTACLES", 35 * "*", "\n")
         print("{:<30} {:<18} {:<30}".format('DETECTED OBSTACLE', 'LANE', 'DATE AND TIME'))
-        for obstacle in self._obstacles:
-            print("{:<30} {:<18} {:<30}".format(obstacle.type, obstacle.lane, obstacle.timestamp))
+        for obstacle in page.items:
+            timestamp = obstacle.timestamp
+            if not isinstance(timestamp, str):  # Unix timestamps are formatted here, when they are shown
+                timestamp = datetime.fromtimestamp(timestamp).strftime(TIME_FORMAT)
+            print("{:<30} {:<18} {:<30}".format(obstacle.type, obstacle.lane, timestamp))
         print("\n", 70 * "*", "\n")
-
-    def update_log(self, text):
-        """Updates the car log."""
-        # Calculating timestamp
-        time_now = datetime.now()
-        timestamp = time_now.strftime("%d/%m/%Y %H:%M:%S")
-        self._log.append([text, timestamp])  # Adds the message with a timestamp
-
-    def read_log(self):
-        """Reads the car log.
-        REMEMBER: It works as a stack: The latest message will be read first and will be deleted from the log."""
+        return page.next
+
+    def export_log(self, path, kind=None, start=None, end=None):
+        """Streams the car log entries, oldest first, to a CSV, Parquet or Arrow file (see export.py). The entries
+        can be filtered as in CarLog.query. Returns the number of entries written."""
+        return export(path, 'log', log_rows(self._log, kind, start, end))
+
+    def export_obstacles(self, path):
+        """Streams the detected obstacles to a CSV, Parquet or Arrow file. Returns the number written."""
+        return export(path, 'obstacles', obstacle_rows(self._obstacles))
+
+    def export_users(self, path):
+        """Streams the users, the admin first, to a CSV, Parquet or Arrow file. Returns the number written."""
+        return export(path, 'users', user_rows(chain((self._admin,), self._userdb)))
+
+    def update_log(self, code, *args):
+        """Updates the car log with an event code and its arguments. The message is only formatted when the log is
+        read."""
+        self._log.append(code, args)  # The log adds the timestamp
+
+    def read_log(self, kind=None, since=None, until=None, limit=PAGE_SIZE, cursor=None):
+        """Reads a page of the car log, filtered by kind (e.g. 'obstacle') and a range of Unix times.
+        REMEMBER: The latest message will be read first. Reading the log doesn't delete the messages.
+        Returns the cursor of the next page (the sequence number of the last entry shown), or None on the last
+        page."""
+        limit = page_limit(limit)
+        entries = self._log.query(kind, since, until, cursor, limit + 1)  # One more tells if there is a next page
         print("\n", 35 * "*", "CAR LOG (starting from the most recent incident):", 35 * "*", "\n")
         print("{:<84} {:<25}".format('INCIDENT', 'DATE AND TIME'))
-        while len(self._log) > 0:
-            temp = self._log.pop()
-            print("{:<84} {:<25}".format(temp[0], temp[1]))
+        for entry in entries[:limit]:
+            print("{:<84} {:<25}".format(entry.text, entry.timestamp))
+        if len(entries) > limit:
+            print("\n", 70 * "*", "\n")
+            return entries[limit - 1].seq
         print("\n", 40 * "*", "----- THE END OF CAR LOG -----", 40 * "*", "\n")
+        return None
 
 
 class User(SystemUser):
@@ -811,8 +882,8 @@ class User(SystemUser):
         self._surname = surname
         self._username = username
 
-    def turn_on(self):
-        control_unit.start_car(car)
+    def turn_on(self, control_unit):
+        control_unit.start_car(control_unit.car)
 
     # Only a getters are added, because the user object attributes were not explicitly set
     @property
@@ -831,10 +902,10 @@ class User(SystemUser):
 class Lidar(Sensor):
     """This component detects the obstacles and sends the information to the control unit"""
 
-    def __init__(self, types=None, obstacle=None):
-        self._types = {1: 'Rock', 2: 'Pedestrian', 3: 'Animal', 4: 'Garbage',
-                       5: 'Traffic cone'}  # Obstacle type database
+    def __init__(self, types=None, obstacle=None, control_unit=None):
+        self._types = OBSTACLE_TYPES  # Obstacle type database
         self._obstacle = []
+        self._control_unit = control_unit  # Receives the obstacles detected
 
     def detect(self):
         """Detects the traffic sign."""
@@ -846,26 +917,35 @@ class Lidar(Sensor):
     5. Traffic cone
     Your selection [1-5]: """))
 
-        lane = int(input("""\nPlease select a lane to place the obstacle.
+        while True:
+            try:
+                lane = int(input("""\nPlease select a lane to place the obstacle.
     Your selection [1-3]: """))
+                if lane not in LANES:
+                    print("\nPlease make a valid choice [1-3]\n")
+                    sleep(1)
+                    continue
+            except ValueError:
+                print("\nInvalid input. Please make a valid choice [1-3]\n")
+                sleep(1)
+                continue
+            else:
+                break
 
         # The LiDAR interprets the sign detected (e.g. the code entered by the user) by using obstacle type database.
         for x in self._types.keys():
             if type_code == x:
                 type = self._types.get(x)
 
-        # Calculating the timestamp
-        time_now = datetime.now()
-        timestamp = time_now.strftime("%d/%m/%Y %H:%M:%S")
-
-        # Updating the obstacle data according to the outcome of the detection
-        obs = Obstacle(type, lane, timestamp)
+        # Updating the obstacle data according to the outcome of the detection. The detection time is kept as a
+        # Unix timestamp and only formatted when the obstacles are listed.
+        obs = Obstacle(type, lane, time())
         self._obstacle = (obs)
         self.send_data(obs)  # Sends the data to the control unit for processing.
 
     def send_data(self, obs):
         """Sends the data to the control unit"""
-        control_unit.eval_obs(obs)
+        self._control_unit.handoff('obstacle')(obs)
 
     # Only obstacle getter method is written, because the values are set by the detect() method.
     @property
@@ -876,10 +956,13 @@ class Lidar(Sensor):
 class Obstacle(Obstacles):
     """A class which stores the information of each obstacle."""
 
-    def __init__(self, type, lane, timestamp):
+    __slots__ = ()
+
+    def __init__(self, type, lane, timestamp, position=None):
         self._type = type
         self._lane = lane
         self._timestamp = timestamp
+        self._position = position
 
     @property
     def type(self):
@@ -893,13 +976,20 @@ class Obstacle(Obstacles):
     def timestamp(self):
         return self._timestamp
 
+    @property
+    def position(self):
+        return self._position
+
 
 class V2VComms(CommsModule):
     """The component which detects other vehicles in the environment. It sends vehicle data to the Control Unit"""
 
-    def __init__(self, veh_types=None, vehicles=None):
-        self._veh_types = {1: 'Car', 2: 'Van', 3: 'SUV', 4: 'Truck/Lorry', 5: 'Trailer'}
-        self._vehicles = []
+    def __init__(self, veh_types=None, vehicles=None, control_unit=None):
+        self._control_unit = control_unit  # Receives the vehicles detected
+        self._veh_types = VEHICLE_TYPES
+        self._vehicles = VehicleHistory(self._veh_types, Vehicle)  # Every vehicle reported, stored by column
+        self._index = RoadIndex()  # Vehicles with a known position, by lane, direction and position
+        self._lock = threading.Lock()  # The V2V module and the engines may record vehicles from different threads
 
     def get_data(self):
         """Intercepts incoming communication from nearby vehicles."""
@@ -988,25 +1078,53 @@ Your selection [1-3]: """))
 
     def update_db(self, veh):
         """Updates the vehicle DB."""
-        self._vehicles.append(veh)
-
-    def list_vehicles(self):
-        """Lists the list of detected vehicles so far by the V2V Comms module."""
+        with self._lock:
+            self._vehicles.append(veh)
+            if veh.position is not None:
+                self._index.add(veh, veh.lane, veh.position, veh.direction)
+
+    def expire_passed(self, car):
+        """Removes the vehicles whose reported position the car has passed from the position index. Returns the
+        number removed."""
+        return len(self._index.drop_behind(car.position, car.direction))
+
+    def vehicles_ahead(self, car, distance, lane=None, direction=None):
+        """Returns the vehicles within `distance` metres ahead of the car on a lane (the car's lane by default),
+        nearest first. If a direction is given, only the vehicles travelling that way are returned."""
+        return [veh for _, veh in self._index.ahead(
+            car.lane if lane is None else lane, car.position, distance, car.direction, direction)]
+
+    def list_vehicles(self, type=None, direction=None, lane=None, faster_than=None, slower_than=None,
+                      limit=PAGE_SIZE, cursor=None):
+        """Lists a page of the vehicles detected so far by the V2V Comms module, the most recent first, filtered by
+        type, direction, lane and speed. Returns the cursor of the next page, or None on the last page."""
+        page = self._vehicles.query(type, direction, lane, faster_than, slower_than, limit, cursor)
         print("\n", 30 * "*", "DETECTED VEHICLES", 30 * "*", "\n")
         print("{:<33} {:<15} {:<15} {:<15}".format('DETECTED VEHICLE', 'DIRECTION', 'LANE', 'VELOCITY'))
-        for vehicle in self._vehicles:
+        for vehicle in page.items:
             print("{:<33} {:<15} {:<15} {:<15}".format(vehicle.type, vehicle.direction, vehicle.lane, vehicle.velocity))
         print("\n", 70 * "*", "\n")
+        return page.next
+
+    def export_vehicles(self, path):
+        """Streams the detected vehicles to a CSV, Parquet or Arrow file. Returns the number written."""
+        return export(path, 'vehicles', vehicle_rows(self._vehicles))
+
+    @property
+    def vehicles(self):
+        return self._vehicles
 
     def send_data(self, veh):
-        control_unit.eval_veh(veh)
+        self._control_unit.handoff('vehicle')(veh)
 
 
 class TSRS(SignRecognitionSystem):
     """The component which detects traffic signs and sends traffic sign data to the Control Unit"""
 
-    def __init__(self, sign_code=None):
+    def __init__(self, sign_code=None, sign_db=None, control_unit=None):
         self._sign_code = sign_code
+        self._sign_db = sign_db if sign_db is not None else TMADB()  # Where sign descriptions are looked up
+        self._control_unit = control_unit  # Receives the signs detected
 
     def detect_sign(self):
         while True:
@@ -1029,12 +1147,12 @@ Your selection [1-5]: """))
 
     def check_db(self, code):
         """Checks the traffic sign database. Sends the code and retrieves the description of the sign from the database."""
-        return sign_db.check_sign(code)
+        return self._sign_db.check_sign(code)
 
     def send_data(self, sign_code, sign_desc):
         """Sends the traffic sign data to the control unit for evaluation."""
         traffic_sign = TrafficSign(sign_code, sign_desc)
-        control_unit.eval_sign(traffic_sign)
+        self._control_unit.handoff('sign')(traffic_sign)
 
     @property
     def sign_code(self):
@@ -1044,6 +1162,8 @@ Your selection [1-5]: """))
 class TrafficSign(TSign):
     """The class that is instantiated for each traffic sign and which stores the information for each traffic sign detected"""
 
+    __slots__ = ()
+
     def __init__(self, type=None, desc=None):
         self._type = type
         self._desc = desc
@@ -1077,19 +1197,274 @@ class TMADB(SignDB):
         return self._signs.get(code)
 
 
-# Creating permanent objects
-admin = User('John', 'Doe', 'admin')
-control_unit = ControlUnit(admin)  # Passes admin as the admin user
-car = Car('Car', 'N', 1)
-v2vcomms = V2VComms()
-lidar = Lidar()
-sign_db = TMADB()
-sign_recog = TSRS()
+class Command:
+    """A driving command sent through the engine like a detection, so that scenarios can drive the car too."""
+
+    __slots__ = ('name', 'lane')
+
+    NAMES = ('start', 'accelerate', 'brake', 'change_direction', 'change_lane', 'stop')
+
+    def __init__(self, name, lane=None):
+        if name not in self.NAMES:
+            raise ValueError(f"Unknown command: {name!r}")
+        self.name = name
+        self.lane = lane  # The new lane of change_lane
+
+
+class SimulationEngine:
+    """Drives a control unit with event objects instead of menu input. Nothing is prompted and nothing sleeps,
+    so a headless engine runs the decision logic as fast as the logic itself allows."""
+
+    def __init__(self, control_unit=None, sign_db=None, comms=None, tracker=None):
+        if control_unit is None:  # A headless control unit with a car of its own
+            control_unit = ControlUnit(User('John', 'Doe', 'admin'), Car('Car', 'N', 1), verbose=False)
+        self._control_unit = control_unit
+        self._sign_db = sign_db if sign_db is not None else TMADB()
+        self._comms = comms  # If given, the V2V module records every vehicle event, as get_data does
+        # The decision methods of the control unit, timed as the sensors' hand-offs are
+        self._decide_obs = control_unit.handoff('obstacle')
+        self._decide_veh = control_unit.handoff('vehicle')
+        self._decide_sign = control_unit.handoff('sign')
+        # Event type -> decision method of the control unit
+        self._handlers = {Obstacle: self._decide_obs,
+                          Vehicle: self._decide_veh if comms is None else self._eval_veh,
+                          TrafficSign: self._eval_sign}
+        # If given, the tracker (see fusion.py) only lets new or changed detections through to the control unit
+        self._tracker = tracker
+        if tracker is not None:
+            self._handlers = {kind: self._tracked(handler) for kind, handler in self._handlers.items()}
+        self._handlers[Command] = self._command
+
+    def _tracked(self, handler):
+        update, car = self._tracker.update, self._control_unit.car
+
+        def handle(event):
+            track = update(event, (car.lane, car.direction, car.velocity))  # What the decisions depend on in the car
+            if track is not None:
+                handler(event)
+                track.car_state = (car.lane, car.direction, car.velocity)
+        return handle
+
+    def _eval_veh(self, veh):
+        self._comms.update_db(veh)
+        self._decide_veh(veh)
+
+    def _eval_sign(self, sign):
+        if sign.desc is None:  # Looks up the description the same way the TSRS does
+            sign.desc = self._sign_db.check_sign(sign.type)
+        self._decide_sign(sign)
+
+    def _command(self, command):
+        if command.name == 'change_lane':
+            self.change_lane(command.lane)
+        else:
+            getattr(self, command.name)()
+
+    def send(self, event):
+        """Hands an Obstacle, Vehicle or TrafficSign event to the matching decision method of the control unit, or
+        carries out a Command."""
+        try:
+            handler = self._handlers[type(event)]
+        except KeyError:
+            raise TypeError(f"Unsupported event type: {type(event).__name__}") from None
+        handler(event)
+
+    def run(self, events):
+        """Sends every event of an iterable in order and returns the number of events processed."""
+        send = self.send
+        count = 0
+        for event in events:
+            send(event)
+            count += 1
+        return count
+
+    # Shortcuts that build the event objects, as the sensors do after reading the operator's input
+
+    def obstacle(self, type, lane, timestamp=None, position=None):
+        if timestamp is None:
+            timestamp = time()
+        self.send(Obstacle(type, lane, timestamp, position))
+
+    def vehicle(self, type, direction, lane, velocity=0, position=None):
+        self.send(Vehicle(type, direction, lane, velocity, position))
+
+    def sign(self, code):
+        self.send(TrafficSign(code))
+
+    # Driving commands
+
+    def start(self):
+        self._control_unit.start_car(self._control_unit.car)
+
+    def accelerate(self):
+        self._control_unit.accelerate(self._control_unit.car)
+
+    def brake(self):
+        self._control_unit.brake(self._control_unit.car)
+
+    def change_direction(self):
+        self._control_unit.change_direction()
+
+    def change_lane(self, new_lane):
+        return self._control_unit.change_lane(new_lane)
+
+    def stop(self):
+        self._control_unit.stop(self._control_unit.car)
+
+    def state(self):
+        """Returns the car state as a (status, lane, direction, velocity) tuple."""
+        car = self._control_unit.car
+        with self._control_unit.exclusive():
+            return self._control_unit.status, car.lane, car.direction, car.velocity
+
+    @property
+    def control_unit(self):
+        return self._control_unit
+
+    @property
+    def comms(self):
+        return self._comms
+
+    @property
+    def tracker(self):
+        return self._tracker
+
+
+class Session:
+    """Wires a car together with its control unit, sensors, traffic sign database and engine. Sessions share no
+    state, so any number of them can run side by side in one process. Options such as rules, log or recorder are
+    passed on to the control unit."""
+
+    def __init__(self, admin=None, car=None, userdb=None, verbose=True, **options):
+        self.admin = admin if admin is not None else User('John', 'Doe', 'admin')
+        self.car = car if car is not None else Car('Car', 'N', 1)
+        self.control_unit = ControlUnit(self.admin, self.car, userdb=userdb, verbose=verbose, **options)
+        self.sign_db = TMADB()
+        self.lidar = Lidar(control_unit=self.control_unit)
+        self.v2vcomms = V2VComms(control_unit=self.control_unit)
+        self.sign_recog = TSRS(sign_db=self.sign_db, control_unit=self.control_unit)
+        self.engine = SimulationEngine(self.control_unit, self.sign_db)  # The menus are a front end over this engine
+
+
+USER_DB_PATH = 'users.jsonl'  # The users added by the admin are kept in this file between sessions
+
+
+# Filter name -> (keyword of the listing methods, converter of the typed value). Times are either a duration back from
+# now (30s, 5m, 2h) or a date and time in the log's format.
+FILTERS = {'kind=': ('kind', str.lower), 'prefix=': ('prefix', str), 'type=': ('type', str),
+           'lane=': ('lane', int), 'direction=': ('direction', str.upper), 'velocity>': ('faster_than', float),
+           'velocity<': ('slower_than', float), 'since=': ('since', None), 'until=': ('until', None)}
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600}
+
+
+def parse_time(text):
+    """Converts a duration back from now (e.g. 5m) or a date and time (dd/mm/YYYY HH:MM:SS) to a Unix time."""
+    if text[-1:] in DURATIONS and text[:-1].replace('.', '', 1).isdigit():
+        return time() - float(text[:-1]) * DURATIONS[text[-1]]
+    return datetime.strptime(text, TIME_FORMAT).timestamp()
+
+
+def parse_filters(text):
+    """Converts typed filters such as 'lane=2 since=5m' to the keyword arguments of the listing methods. Values
+    with spaces are quoted, e.g. type="Traffic cone". Raises ValueError for an unknown filter or value."""
+    filters = {}
+    for word in shlex.split(text):
+        for prefix, (keyword, convert) in FILTERS.items():
+            if word.startswith(prefix):
+                value = word[len(prefix):]
+                filters[keyword] = parse_time(value) if convert is None else convert(value)
+                break
+        else:
+            raise ValueError(f"Unknown filter: {word}")
+    return filters
+
+
+def browse(listing, example):
+    """Asks for filters and shows a listing one page at a time."""
+    try:
+        filters = parse_filters(input(f"Filters (e.g. {example}), or press Enter to list everything: "))
+        cursor = listing(**filters)
+    except (ValueError, TypeError) as error:  # TypeError: a filter the listing doesn't have
+        print(f"Sorry, these filters can't be used here: {error}")
+        sleep(1)
+        return
+    while cursor is not None:
+        if input("Press Enter for the next page, or type q to stop: ").strip().lower() == 'q':
+            break
+        cursor = listing(cursor=cursor, **filters)
+
+
+def export_menu(session):
+    """Asks which data to export and the file to export it to."""
+    exports = {'log': session.control_unit.export_log, 'obstacles': session.control_unit.export_obstacles,
+               'vehicles': session.v2vcomms.export_vehicles, 'users': session.control_unit.export_users}
+    table = input("Which data do you want to export (log, obstacles, vehicles or users)? ").strip().lower()
+    if table not in exports:
+        print("Sorry, there is no such data. Returning to the information menu.")
+        sleep(1)
+        return
+    path = input("Enter the file name (.csv, .parquet, .arrow or .feather): ").strip()
+    try:
+        count = exports[table](path)
+    except (ValueError, ImportError, OSError) as error:
+        print(f"Sorry, the data couldn't be exported: {error}")
+    else:
+        print(f"{count} rows have been exported to {path}.")
+    sleep(1)
+
+
+def lane_menu(session):
+    """Asks for the lane to switch to until a valid lane is entered or the user goes back with 0."""
+    car, engine = session.car, session.engine
+    if not session.control_unit.status:
+        engine.change_lane(None)  # The control unit rejects the request and logs it
+        return
+    while True:
+        try:
+            if car.lane == 2:
+                new_lane = int(input(f"""\nThe car is on lane {car.lane}. Please enter the lane that you'd like the 
+                    car to switch to [1 or 3] or enter 0 to go back to the interaction menu. Your choice [1 or 3]: """))
+            else:
+                new_lane = int(input("""\nPlease enter 2 if you want to change lane to Lane 2 or enter 0 to go back 
+                    to the main menu. Your choice [0 or 2]: """))
+        except ValueError:
+            print("\nPlease provide a valid input.")
+            return
+        if new_lane == 0 or engine.change_lane(new_lane):
+            return
+
+
+# Creating a menu for the User. The menus are the states of a state machine: each menu shows its screen, carries
+# out one choice and returns the next state, and run_menus() loops over the states. No menu calls another, so the
+# call stack stays the same however long an operator keeps navigating.
+
+LOGIN, MAIN, INFORMATION, INTERACTION, EXIT = 'login', 'main', 'information', 'interaction', 'exit'
+
+
+def choose(session, state, choices, last):
+    """Reads a menu choice and carries out its action. Returns the state the action leads to, or the same state if
+    the action returns None or the choice is invalid."""
+    try:
+        action = choices.get(int(input(f"Please make your choice [1-{last}] : ")))
+        if action is None:
+            print("\nYou have entered an invalid choice. Please try again.")
+            sleep(1)
+            return state
+        next_state = action(session)
+    except ValueError:
+        print(f"\nInvalid input. Please provide a valid input [1-{last}]")
+        sleep(1)
+        return state
+    return state if next_state is None else next_state
 
 
-# Creating a menu for the User
+def goodbye(session):
+    print("\nThank you for using AVID Driverless Cars!")
+    sleep(1)
+    return EXIT
 
-def user_login():
+
+def user_login(session):
     """User login menu. Prompts for username only."""
     print(30 * "*", "WELCOME TO AVID Driverless Cars", 30 * "*")
     print("""
@@ -1098,44 +1473,62 @@ def user_login():
     print("")
     print(100 * "*")
     username = input("Username : ")
-    control_unit.auth(username)  # Control unit authenticates the user
+    # Control unit authenticates the user
+    return MAIN if session.control_unit.auth(username) else EXIT
+
 
+MAIN_CHOICES = {1: lambda session: INFORMATION,
+                2: lambda session: INTERACTION,
+                3: lambda session: LOGIN,  # Change user
+                4: goodbye}
 
-def main_menu():
+
+def main_menu(session):
     """Main menu that prompts when the user logs in successfully."""
-    while True:
-        print(30 * "*", "AVID Driverless Cars", 30 * "*")
-        print("""
+    print(30 * "*", "AVID Driverless Cars", 30 * "*")
+    print("""
         1. Get information about the car
         2. Interact with the car
         3. Change user
         4. Exit
         """)
-        print(100 * "*")
-        try:
-            choice = int(input("Please make your choice [1-3] : "))
-            if choice == 1:
-                inf_menu()
-            elif choice == 2:
-                interact_menu()
-            elif choice == 3:
-                user_login()
-            elif choice == 4:
-                print("Thank you for using AVID Driverless Cars!")
-                sleep(1)
-                exit()
-            else:
-                print("Sorry, you have entered an invalid choice. Please try again.")
-                sleep(1)
-        except ValueError:
-            print("Invalid input. Please provide a valid input [1-3]")
+    print(100 * "*")
+    return choose(session, MAIN, MAIN_CHOICES, len(MAIN_CHOICES))
+
+
+def show_status(session):
+    print("")
+    session.car.print_state()
+    print("")
+    sleep(2)
+
+
+def show_latency(session):
+    session.control_unit.list_latency()
+    path = input("Enter a file name to export the histograms as JSON (or press Enter to skip): ")
+    if path and session.control_unit.latency is not None:
+        session.control_unit.latency.export(path)
+        print(f"The latency histograms have been exported to {path}.")
+    sleep(1)
+
 
+INFORMATION_CHOICES = {
+    1: show_status,
+    2: lambda session: browse(session.control_unit.read_log, "kind=obstacle since=5m"),
+    3: lambda session: browse(session.control_unit.list_users, "prefix=ad"),
+    4: lambda session: browse(session.control_unit.list_obstacles, "lane=2 since=5m"),
+    5: lambda session: browse(session.v2vcomms.list_vehicles, "type=Truck/Lorry direction=S velocity>100"),
+    6: show_latency,
+    7: export_menu,
+    8: lambda session: MAIN,
+    9: goodbye,
+}
 
-def inf_menu():
+
+def inf_menu(session):
     """The Information Menu is where the user can access information about the car."""
-    while True:
-        print(30 * "*", "AVID Driverless Cars", 30 * "*")
-        print("""
+    print(30 * "*", "AVID Driverless Cars", 30 * "*")
+    print("""
         INFORMATION MENU
 
         1. Check the current status of the car
@@ -1143,45 +1536,50 @@ def inf_menu():
         3. Check the list of users
         4. Check out the list of obstacles detected
         5. Check out the list of vehicles detected
-        6. Return to main menu
-        7. Exit
+        6. Check the decision latencies
+        7. Export the car data to a file
+        8. Return to main menu
+        9. Exit
             """)
-        print(100 * "*")
-        try:
-            choice = int(input("Please make your choice [1-7] : "))
-            if choice == 1:
-                print("")
-                car.print_state()
-                print("")
-                sleep(2)
-            elif choice == 2:
-                control_unit.read_log()
-                sleep(2)
-            elif choice == 3:
-                control_unit.list_users()
-            elif choice == 4:
-                control_unit.list_obstacles()
-            elif choice == 5:
-                v2vcomms.list_vehicles()
-            elif choice == 6:
-                main_menu()
-            elif choice == 7:
-                print("Thank you for using AVID Driverless Cars!")
-                sleep(2)
-                exit()
-            else:
-                print("You have entered an invalid choice. Please try again.")
-                sleep(1)
-        except ValueError:
-            print("Invalid input. Please provide a valid input [1-5]")
-            sleep(1)
+    print(100 * "*")
+    return choose(session, INFORMATION, INFORMATION_CHOICES, len(INFORMATION_CHOICES))
+
 
+def place_sign(session):
+    code = session.sign_recog.detect_sign()
+    description = session.sign_recog.check_db(code)
+    session.sign_recog.send_data(code, description)
 
-def interact_menu():
+
+def then_wait(action):
+    """Returns an interaction that carries out an action and pauses for a second, so its output can be read."""
+    def interaction(session):
+        action(session)
+        sleep(1)
+    return interaction
+
+
+INTERACTION_CHOICES = {
+    1: then_wait(lambda session: session.engine.start()),
+    2: then_wait(lambda session: session.engine.accelerate()),
+    3: then_wait(lambda session: session.engine.brake()),
+    4: then_wait(lambda session: session.engine.change_direction()),  # U-turn
+    5: then_wait(lambda session: session.lidar.detect()),
+    6: then_wait(place_sign),
+    7: then_wait(lambda session: session.v2vcomms.get_data()),
+    8: then_wait(lane_menu),
+    9: then_wait(lambda session: session.engine.stop()),
+    10: then_wait(lambda session: session.control_unit.add_user()),
+    11: then_wait(lambda session: session.control_unit.delete_user()),
+    12: lambda session: MAIN,
+    13: goodbye,
+}
+
+
+def interact_menu(session):
     """Interaction Menu is where user interacts with the car."""
-    while True:
-        print(40 * "*", "AVID Driverless Cars", 40 * "*")
-        print("""
+    print(40 * "*", "AVID Driverless Cars", 40 * "*")
+    print("""
         INTERACTION MENU
 
         1. Start the car
@@ -1198,57 +1596,18 @@ def interact_menu():
         12. Return to main menu
         13. Exit the system
             """)
-        print(100 * "*")
+    print(100 * "*")
+    return choose(session, INTERACTION, INTERACTION_CHOICES, len(INTERACTION_CHOICES))
+
+
+MENUS = {LOGIN: user_login, MAIN: main_menu, INFORMATION: inf_menu, INTERACTION: interact_menu}
+
+
+def run_menus(session, state=LOGIN):
+    """Runs the menus from a state until the user exits: the single dispatch loop of the front end."""
+    while state != EXIT:
+        state = MENUS[state](session)
 
-        try:
-            choice = int(input("Please make your choice [1-12] : "))
-            if choice == 1:
-                admin.turn_on()
-                sleep(1)
-            elif choice == 2:
-                control_unit.accelerate(car)
-                sleep(1)
-            elif choice == 3:
-                control_unit.brake(car)
-                sleep(1)
-            elif choice == 4:  # U-turn
-                control_unit.change_direction()
-                sleep(1)
-            elif choice == 5:
-                lidar.detect()
-                sleep(1)
-            elif choice == 6:
-                code = sign_recog.detect_sign()
-                description = sign_recog.check_db(code)
-                sign_recog.send_data(code, description)
-                sleep(1)
-            elif choice == 7:
-                v2vcomms.get_data()
-                sleep(1)
-            elif choice == 8:
-                control_unit.change_lane()
-                sleep(1)
-            elif choice == 9:
-                control_unit.stop(car)
-                sleep(1)
-            elif choice == 10:
-                control_unit.add_user()
-                sleep(1)
-            elif choice == 11:
-                control_unit.delete_user()
-                sleep(1)
-            elif choice == 12:
-                main_menu()
-                sleep(1)
-            elif choice == 13:
-                print("\nThank you for using AVID Driverless Cars!")
-                sleep(1)
-                exit()
-            else:
-                print("\nYou have entered an invalid choice. Please try again.")
-                sleep(1)
-        except ValueError:
-            print("\nInvalid input. Please provide a valid input [1-12]")
-            sleep(1)
 
-user_login()
+if __name__ == "__main__":
+    run_menus(Session(userdb=UserStore(USER_DB_PATH, User)))
@@ -0,0 +1,98 @@
+"""Streams the car log, the detected obstacles and vehicles and the users to files for analysis.
+
+Each table is written row by row (CSV) or a chunk of rows at a time (Parquet and Arrow IPC, which need pyarrow), so
+memory use doesn't grow with the size of the store. Reading the stores doesn't change them. The format is chosen by
+the file extension: .csv, .parquet, or .arrow/.feather.
+
+    log        seq, time, kind, event, message    (oldest entry first, spilled segments included)
+    obstacles  type, lane, timestamp, position     (in detection order)
+    vehicles   type, direction, lane, velocity, position
+    users      name, surname, username
+
+Times are Unix timestamps. Unknown positions are empty (CSV) or null.
+"""
+
+import csv
+from itertools import islice
+
+from carlog import MESSAGES, Event
+
+CHUNK_SIZE = 65536  # Rows per Parquet row group / Arrow record batch
+
+# Table -> (column, Arrow type) pairs
+TABLES = {
+    'log': (('seq', 'int64'), ('time', 'float64'), ('kind', 'string'), ('event', 'string'), ('message', 'string')),
+    'obstacles': (('type', 'string'), ('lane', 'int8'), ('timestamp', 'float64'), ('position', 'float64')),
+    'vehicles': (('type', 'string'), ('direction', 'string'), ('lane', 'int8'), ('velocity', 'float64'),
+                 ('position', 'float64')),
+    'users': (('name', 'string'), ('surname', 'string'), ('username', 'string')),
+}
+
+_EVENT_NAMES = {code: Event(code).name for code in MESSAGES}
+
+
+def log_rows(log, kind=None, start=None, end=None):
+    """Yields the rows of the car log entries that match the filters (see CarLog.entries)."""
+    for entry in log.entries(kind, start, end):
+        yield entry.seq, entry.time, entry.kind, _EVENT_NAMES[entry.code], entry.text
+
+
+def obstacle_rows(history):
+    for obstacle in history:
+        yield obstacle.type, obstacle.lane, obstacle.timestamp, obstacle.position
+
+
+def vehicle_rows(history):
+    for vehicle in history:
+        yield vehicle.type, vehicle.direction, vehicle.lane, vehicle.velocity, vehicle.position
+
+
+def user_rows(users):
+    for user in users:
+        yield user.name, user.surname, user.username
+
+
+def write_csv(path, table, rows):
+    """Writes the rows of a table to a CSV file with a header. Returns the number of rows written."""
+    count = 0
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(column for column, _ in TABLES[table])
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def write_arrow(path, table, rows, chunk_size=CHUNK_SIZE):
+    """Writes the rows of a table to a Parquet file (.parquet) or an Arrow IPC file (anything else), a chunk of rows
+    at a time. Returns the number of rows written."""
+    import pyarrow as pa  # Optional: only needed for Parquet and Arrow files
+    schema = pa.schema([(column, getattr(pa, arrow_type)()) for column, arrow_type in TABLES[table]])
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(path, schema)
+    else:
+        writer = pa.ipc.new_file(path, schema)
+    count = 0
+    rows = iter(rows)
+    with writer:
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            columns = [pa.array(values, type=field.type) for values, field in zip(zip(*chunk), schema)]
+            writer.write_batch(pa.record_batch(columns, schema=schema))
+            count += len(chunk)
+    return count
+
+
+def export(path, table, rows, chunk_size=CHUNK_SIZE):
+    """Writes the rows of a table in the format of the file extension. Returns the number of rows written."""
+    if table not in TABLES:
+        raise ValueError(f"Unknown table: {table!r}")
+    if path.endswith('.csv'):
+        return write_csv(path, table, rows)
+    if path.endswith(('.parquet', '.arrow', '.feather')):
+        return write_arrow(path, table, rows, chunk_size)
+    raise ValueError(f"Unknown export format: {path!r} (use .csv, .parquet, .arrow or .feather)")
@@ -0,0 +1,180 @@
+"""Fleet mode: many cars held as NumPy arrays and driven by the control unit rules in vectorized steps.
+
+The fleet decides with the same compiled rules as ControlUnit (a RuleTable, rules.json by default): the decisions
+of the table are laid out once as NumPy lookup arrays indexed by our lane, the other lane, the relative direction,
+the speed band and whether the other car is faster, or by sign code and speed band. So a fleet built with the rules
+of a control unit, tuned ones included (see sweep.py), gives the same lanes and speeds as running that control unit
+once per car. Directions are stored as codes (N = 0, S = 1).
+"""
+
+import numpy as np
+
+from driverless_car import Car
+from rules import LANES, OFF_ROAD, default_rules
+
+DIRECTIONS = ('N', 'S')
+DIRECTION_CODES = {'N': 0, 'S': 1}
+
+# Event kinds of a fleet tick
+NO_EVENT, OBSTACLE, VEHICLE, SIGN = 0, 1, 2, 3
+
+_KEEP = 0  # Lane table value of a decision that keeps the lane
+
+
+def _lane_tables(rules):
+    """Returns the new lane (or _KEEP) of every obstacle and vehicle decision of a RuleTable, as arrays indexed by
+    [our lane, other lane, band] and [our lane, other lane, oncoming, band, other faster]. Bands are shifted by
+    one, so that the band below the lowest threshold is 0."""
+    size = max(LANES) + 1
+    obstacle_bands, vehicle_bands = rules.bands['obstacle'].samples(), rules.bands['vehicle'].samples()
+    obstacles = np.zeros((size, size, len(obstacle_bands)), dtype=np.int8)
+    vehicles = np.zeros((size, size, 2, len(vehicle_bands), 2), dtype=np.int8)
+    for lane in LANES:
+        for other_lane in (OFF_ROAD, *LANES):
+            for band, speed in obstacle_bands:
+                new_lane = rules.obstacle(lane, other_lane, speed).lane
+                obstacles[lane, other_lane, band + 1] = _KEEP if new_lane is None else new_lane
+            for oncoming in (0, 1):
+                for band, speed in vehicle_bands:
+                    for faster in (0, 1):
+                        new_lane = rules.vehicle(lane, other_lane, bool(oncoming), speed, bool(faster)).lane
+                        vehicles[lane, other_lane, oncoming, band + 1, faster] = _KEEP if new_lane is None else new_lane
+    return obstacles, vehicles
+
+
+def _sign_tables(rules):
+    """Returns the speed set (NaN for none) and the speed factor (1 for none) of every sign decision of a
+    RuleTable, as arrays indexed by [sign code, band + 1]. The last row stands for the codes the rules don't know."""
+    bands = rules.bands['sign'].samples()
+    rows = max(rules.sign_codes, default=-1) + 2
+    set_speed = np.full((rows, len(bands)), np.nan)
+    scale_speed = np.ones((rows, len(bands)))
+    for code in rules.sign_codes:
+        for band, speed in bands:
+            decision = rules.sign(code, speed)
+            if decision is None:
+                continue
+            if decision.set_speed is not None:
+                set_speed[code, band + 1] = decision.set_speed
+            elif decision.scale_speed is not None:
+                scale_speed[code, band + 1] = decision.scale_speed
+    return set_speed, scale_speed
+
+
+def _cars(mask):
+    """Returns the index of the cars selected by a mask (None for all of them)."""
+    return slice(None) if mask is None else np.flatnonzero(mask)
+
+
+def _select(value, cars):
+    """Returns the values of the selected cars of a per-car array, or a single value as it is."""
+    value = np.asarray(value)
+    return value[cars] if value.ndim else value
+
+
+def _other_lane(lane):
+    """Returns the lane of an obstacle or a vehicle as a lane table index: a lane that isn't on the road is OFF_ROAD."""
+    lane = np.asarray(lane)
+    return np.where((lane >= min(LANES)) & (lane <= max(LANES)), lane, OFF_ROAD)
+
+
+class Fleet:
+    """Stores the lane, direction and velocity of every car of the fleet in NumPy arrays. rules is the RuleTable
+    the cars decide with (rules.json by default)."""
+
+    def __init__(self, size, lane=1, direction='N', velocity=60, rules=None):
+        self._lane = np.full(size, lane, dtype=np.int8)
+        self._direction = np.full(size, DIRECTION_CODES[direction], dtype=np.int8)
+        # Velocities are floats because the slippery road sign reduces them by 30%
+        self._velocity = np.full(size, velocity, dtype=np.float64)
+        self.rules = rules if rules is not None else default_rules()
+
+    @property
+    def rules(self):
+        return self._rules
+
+    @rules.setter
+    def rules(self, value):
+        self._rules = value
+        self._thresholds = {kind: bands.thresholds for kind, bands in value.bands.items()}
+        self._obstacle_lanes, self._vehicle_lanes = _lane_tables(value)
+        self._set_speed, self._scale_speed = _sign_tables(value)
+
+    @classmethod
+    def from_cars(cls, cars, rules=None):
+        """Creates a fleet holding the state of the given Car objects."""
+        cars = list(cars)
+        fleet = cls(len(cars), rules=rules)
+        fleet._lane[:] = [car.lane for car in cars]
+        fleet._direction[:] = [DIRECTION_CODES[car.direction] for car in cars]
+        fleet._velocity[:] = [car.velocity for car in cars]
+        return fleet
+
+    def car(self, index):
+        """Returns the state of one car of the fleet as a Car object."""
+        return Car('Car', DIRECTIONS[self._direction[index]], int(self._lane[index]),
+                   self._velocity[index].item())
+
+    def __len__(self):
+        return len(self._lane)
+
+    def _band(self, kind, velocity):
+        """Returns the speed band of each velocity for the rules of a kind of event, shifted by one (see
+        _lane_tables)."""
+        band = np.zeros(len(velocity), dtype=np.int8)
+        for threshold in self._thresholds[kind]:  # A few thresholds: two comparisons each beat a binary search
+            band += velocity >= threshold
+            band += velocity > threshold
+        return band
+
+    def eval_obs(self, obs_lane, mask=None):
+        """Applies an obstacle on obs_lane (a lane or an array with one lane per car) to the fleet."""
+        cars = _cars(mask)
+        lane = self._lane[cars]
+        new_lane = self._obstacle_lanes[lane, _other_lane(_select(obs_lane, cars)),
+                                        self._band('obstacle', self._velocity[cars])]
+        self._lane[cars] = np.where(new_lane != _KEEP, new_lane, lane)
+
+    def eval_veh(self, veh_lane, veh_direction, veh_velocity, mask=None):
+        """Applies a detected vehicle to the fleet. Every argument is a value or an array with one value per car;
+        directions are given as codes."""
+        cars = _cars(mask)
+        lane, velocity = self._lane[cars], self._velocity[cars]
+        oncoming = (self._direction[cars] != _select(veh_direction, cars)).view(np.int8)
+        faster = (_select(veh_velocity, cars) > velocity).view(np.int8)
+        new_lane = self._vehicle_lanes[lane, _other_lane(_select(veh_lane, cars)), oncoming,
+                                       self._band('vehicle', velocity), faster]
+        self._lane[cars] = np.where(new_lane != _KEEP, new_lane, lane)
+
+    def eval_sign(self, code, mask=None):
+        """Applies a traffic sign (a code or an array with one code per car) to the fleet."""
+        cars = _cars(mask)
+        velocity = self._velocity[cars]
+        unknown = len(self._set_speed) - 1
+        code = _select(code, cars)
+        row = np.where((code >= 0) & (code < unknown), code, unknown)
+        band = self._band('sign', velocity)
+        set_speed = self._set_speed[row, band]
+        new = velocity * self._scale_speed[row, band]
+        np.copyto(new, set_speed, where=~np.isnan(set_speed))
+        self._velocity[cars] = new
+
+    def step(self, kind, lane, direction, velocity, code):
+        """Runs one tick in which every car handles its own event. kind holds the event kind of each car
+        (NO_EVENT, OBSTACLE, VEHICLE or SIGN); lane, direction and velocity describe its obstacle or vehicle and
+        code its traffic sign."""
+        self.eval_obs(lane, kind == OBSTACLE)
+        self.eval_veh(lane, direction, velocity, kind == VEHICLE)
+        self.eval_sign(code, kind == SIGN)
+
+    @property
+    def lane(self):
+        return self._lane
+
+    @property
+    def direction(self):
+        return self._direction
+
+    @property
+    def velocity(self):
+        return self._velocity
@@ -0,0 +1,125 @@
+"""Sensor fusion: associates repeated detections of the same road object with a persistent track.
+
+A sensor that scans many times a second reports the same rock or the same truck over and over. The tracker
+matches each detection against the live tracks (same kind, type and lane, and for vehicles the same direction;
+with positions, the nearest track within `gate` metres) and updates the matching track in place. Only detections
+that could change what the control unit decides are passed on: those that start a new track, those whose velocity
+changed, and those that arrive when the car's lane, direction or speed is no longer what it was after the control
+unit last dealt with the track (a rock the car avoided matters again once the car is back in its lane). Tracks
+not seen for `max_age` frames (see next_frame) or for `max_idle` detections are dropped, so an object seen again
+after that is passed on as new even when nobody marks the frames.
+"""
+
+from itertools import count
+
+from driverless_car import Obstacle, TrafficSign, Vehicle
+
+
+class Track:
+    """A road object followed across detections."""
+
+    __slots__ = ('id', 'key', 'event', 'hits', 'first_seen', 'last_seen', 'last_detection', 'car_state')
+
+    def __init__(self, track_id, key, event, frame, detection, car_state):
+        self.id = track_id
+        self.key = key
+        self.event = event  # The latest detection
+        self.hits = 1
+        self.first_seen = frame
+        self.last_seen = frame
+        self.last_detection = detection  # Number of the detection that last matched the track
+        self.car_state = car_state  # The car state once the track was last dealt with (set by the caller)
+
+
+def _key(event):
+    """Returns the association key of a detection and the part of it that matters to the control unit."""
+    kind = type(event)
+    if kind is Obstacle:
+        return ('obstacle', event.type, event.lane), None
+    if kind is Vehicle:
+        return ('vehicle', event.type, event.lane, event.direction), event.velocity
+    if kind is TrafficSign:
+        return ('sign', event.type), None
+    raise TypeError(f"Unsupported event type: {kind.__name__}")
+
+
+class Tracker:
+    """Keeps the live tracks and decides which detections reach the control unit."""
+
+    def __init__(self, gate=5.0, max_age=10, max_idle=1000):
+        self.gate = gate  # Largest distance in metres between a detection and the track it belongs to
+        self.max_age = max_age  # Frames a track survives without being detected
+        self.max_idle = max_idle  # Detections (of any object) a track survives without being detected
+        self._tracks = {}  # Association key -> live tracks with that key
+        self._ids = count(1)
+        self.frame = 0
+        self.detections = 0
+        self.forwarded = 0
+
+    def _match(self, tracks, event):
+        position = getattr(event, 'position', None)
+        if position is None:
+            return tracks[0] if tracks else None
+        best, best_distance = None, self.gate
+        for track in tracks:
+            track_position = track.event.position
+            if track_position is not None and abs(track_position - position) <= best_distance:
+                best, best_distance = track, abs(track_position - position)
+        return best
+
+    def update(self, event, car_state=None):
+        """Associates a detection with a track. car_state is what the decisions depend on in the car, e.g. its
+        (lane, direction, velocity). If the detection is new or changed, or the car state isn't the track's
+        car_state, returns the track: the detection should be sent to the control unit, and the caller then sets
+        track.car_state to the car state after the decision. Otherwise returns None."""
+        self.detections += 1
+        if self.detections % self.max_idle == 0:
+            self._expire()
+        key, state = _key(event)
+        tracks = self._tracks.setdefault(key, [])
+        track = self._match(tracks, event)
+        if track is not None and self.detections - track.last_detection > self.max_idle:
+            tracks.remove(track)  # Not seen for too long: a new object
+            track = None
+        if track is None:
+            track = Track(next(self._ids), key, event, self.frame, self.detections, car_state)
+            tracks.append(track)
+            self.forwarded += 1
+            return track
+        changed = (state is not None and state != _key(track.event)[1]) or car_state != track.car_state
+        track.event = event
+        track.hits += 1
+        track.last_seen = self.frame
+        track.last_detection = self.detections
+        if not changed:
+            return None
+        self.forwarded += 1
+        return track
+
+    def _expire(self):
+        """Drops the tracks not seen for max_age frames or max_idle detections. Returns the number dropped."""
+        oldest_frame, oldest_detection = self.frame - self.max_age, self.detections - self.max_idle
+        dropped = 0
+        for key in list(self._tracks):
+            tracks = self._tracks[key]
+            live = [track for track in tracks
+                    if track.last_seen >= oldest_frame and track.last_detection >= oldest_detection]
+            dropped += len(tracks) - len(live)
+            if live:
+                self._tracks[key] = live
+            else:
+                del self._tracks[key]
+        return dropped
+
+    def next_frame(self):
+        """Starts a new frame (sensor scan) and drops the tracks that have not been seen for max_age frames (or
+        max_idle detections). Returns the number of dropped tracks."""
+        self.frame += 1
+        return self._expire()
+
+    def tracks(self):
+        """Returns the live tracks."""
+        return [track for tracks in self._tracks.values() for track in tracks]
+
+    def __len__(self):
+        return sum(len(tracks) for tracks in self._tracks.values())
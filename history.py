@@ -0,0 +1,281 @@
+"""Compact, columnar history of the obstacles and vehicles detected during a drive.
+
+A list of detection objects costs well over a hundred bytes per detection. Here every field is kept in its own
+typed array instead, so a record takes a few bytes per field:
+
+    type       small integer code from the sensor's type table (Lidar._types, V2VComms._veh_types)
+    direction  0 for N, 1 for S (vehicles)
+    lane       signed byte
+    velocity   double (vehicles)
+    timestamp  double, Unix time (obstacles)
+    position   double, NaN when unknown
+
+Records are read back as objects of the given record class (e.g. Obstacle), one at a time, and the columns can be
+viewed as NumPy arrays without copying when NumPy is installed.
+
+The type, lane and direction columns are indexed: for each value, the record numbers that have it are kept in
+ascending order. A query reads the index of its most selective filter newest first, checks the other filters on each
+record, and stops when the page is full. Pages carry on from the record number of the last page (a cursor), so a
+page costs the same however long the history is. Obstacle timestamps that only grow are searched by bisection.
+
+Every field of a record is checked and converted before any column is appended to, so a record that can't be
+stored raises ValueError and leaves the history as it was.
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import datetime
+from math import isnan, nan
+
+from carlog import TIME_FORMAT
+
+ObstacleRecord = namedtuple('ObstacleRecord', 'type lane timestamp position')
+VehicleRecord = namedtuple('VehicleRecord', 'type direction lane velocity position')
+
+DIRECTIONS = ('N', 'S')
+DIRECTION_CODES = {'N': 0, 'S': 1}
+LANE_RANGE = range(-128, 128)  # The lanes a signed byte column can hold
+
+# A page of query results: the records, newest first, and the cursor of the next page (None on the last page)
+Page = namedtuple('Page', 'items next')
+
+
+class TypeCodes:
+    """Translates type names to the codes of a sensor's code -> name table. A name missing from the table gets
+    the next free code, without changing the sensor's table."""
+
+    def __init__(self, table):
+        self.names = dict(table)  # Code -> name
+        self._codes = {name: code for code, name in table.items()}
+
+    def code(self, name):
+        code = self._codes.get(name)
+        if code is None:
+            code = max(self.names, default=0) + 1
+            self.names[code] = name
+            self._codes[name] = code
+        return code
+
+    def find(self, name):
+        """Returns the code of a name, or None if the name has no code."""
+        return self._codes.get(name)
+
+
+def lane_code(lane):
+    """Returns the lane as stored in a lane column. Raises ValueError for a lane the column can't hold."""
+    if isinstance(lane, bool) or not isinstance(lane, int) or lane not in LANE_RANGE:
+        raise ValueError(f"Invalid lane: {lane!r} (expected an integer from {LANE_RANGE[0]} to {LANE_RANGE[-1]})")
+    return lane
+
+
+def direction_code(direction):
+    """Returns the code of a direction. Raises ValueError for anything but N or S."""
+    code = DIRECTION_CODES.get(direction)
+    if code is None:
+        raise ValueError(f"Invalid direction: {direction!r} (expected N or S)")
+    return code
+
+
+def page_limit(limit):
+    """Returns the size of a page. Raises ValueError for anything but a positive integer."""
+    if isinstance(limit, bool) or not isinstance(limit, int) or limit < 1:
+        raise ValueError(f"Invalid limit: {limit!r} (expected a positive integer)")
+    return limit
+
+
+def _float(value, name):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid {name}: {value!r}") from None
+
+
+def _numpy_views(columns):
+    import numpy as np  # Optional: only needed for the NumPy views
+    return {name: np.frombuffer(column, dtype=column.typecode) for name, column in columns.items()}
+
+
+class _History:
+    """Common part of the histories: the typed columns, their indexes and their sizes."""
+
+    INDEXED = ()  # Columns with an index
+
+    def _init_indexes(self):
+        self._indexes = {name: {} for name in self.INDEXED}  # Column -> value -> ascending record numbers
+
+    def _index(self, row, codes):
+        for name, code in zip(self.INDEXED, codes):
+            rows = self._indexes[name].get(code)
+            if rows is None:
+                rows = self._indexes[name][code] = array('I')
+            rows.append(row)
+
+    def _query(self, equal, lo, hi, check, limit, before):
+        """Returns a page of the records numbered [lo, hi) whose indexed columns have the `equal` codes and for which
+        check(row) is true (check may be None), newest first, starting before the cursor."""
+        if before is not None:
+            hi = min(hi, before)
+        # The shortest index is read and the other indexed columns are checked on each record
+        names = sorted(equal, key=lambda name: len(self._indexes[name].get(equal[name], ())))
+        if names:
+            candidates = self._indexes[names[0]].get(equal[names[0]], ())
+        else:
+            candidates = range(len(self))
+        checks = [(self._columns[name], equal[name]) for name in names[1:]]
+        items, last = [], None
+        index, stop = bisect_left(candidates, hi), bisect_left(candidates, lo)
+        while index > stop:
+            index -= 1
+            row = candidates[index]
+            if all(column[row] == code for column, code in checks) and (check is None or check(row)):
+                if len(items) == limit:
+                    return Page(items, last)
+                items.append(self[row])
+                last = row
+        return Page(items, None)
+
+    def __len__(self):
+        return len(self._columns['type'])
+
+    def columns(self):
+        """Returns the columns as a dict of arrays."""
+        return dict(self._columns)
+
+    def to_numpy(self):
+        """Returns the columns as a dict of NumPy arrays that share memory with the history. The arrays must not be
+        kept while records are appended."""
+        return _numpy_views(self._columns)
+
+    @property
+    def nbytes(self):
+        """Bytes used by the records in the columns and in the indexes."""
+        return (sum(column.itemsize * len(column) for column in self._columns.values())
+                + sum(rows.itemsize * len(rows) for index in self._indexes.values() for rows in index.values()))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+class ObstacleHistory(_History):
+    """The detected obstacles, in detection order."""
+
+    def __init__(self, types, record_class=ObstacleRecord):
+        self.types = TypeCodes(types)
+        self._record_class = record_class
+        self._columns = {'type': array('H'), 'lane': array('b'), 'timestamp': array('d'), 'position': array('d')}
+        self._init_indexes()
+        self._time_sorted = True  # While the timestamps only grow, time ranges are found by bisection
+
+    INDEXED = ('type', 'lane')
+
+    def append(self, obstacle):
+        """Adds an obstacle. Raises ValueError, and adds nothing, if a field can't be stored."""
+        columns = self._columns
+        row = len(self)
+        lane = lane_code(obstacle.lane)
+        timestamp = obstacle.timestamp
+        if isinstance(timestamp, str):  # Timestamps typed in the menus' date format
+            timestamp = datetime.strptime(timestamp, TIME_FORMAT).timestamp()
+        timestamp = _float(timestamp, 'timestamp')
+        position = nan if obstacle.position is None else _float(obstacle.position, 'position')
+        code = self.types.code(obstacle.type)
+        if row and timestamp < columns['timestamp'][-1]:
+            self._time_sorted = False
+        columns['type'].append(code)
+        columns['lane'].append(lane)
+        columns['timestamp'].append(timestamp)
+        columns['position'].append(position)
+        self._index(row, (code, lane))
+
+    def query(self, type=None, lane=None, since=None, until=None, limit=50, before=None):
+        """Returns a Page of the obstacles of a type, on a lane and detected between two Unix times (all optional,
+        both times included), newest first. `before` is the cursor of the previous page. Raises ValueError for a limit
+        below 1."""
+        limit = page_limit(limit)
+        equal = {}
+        if type is not None:
+            equal['type'] = self.types.find(type)
+            if equal['type'] is None:
+                return Page([], None)
+        if lane is not None:
+            equal['lane'] = lane
+        timestamps = self._columns['timestamp']
+        lo, hi, check = 0, len(self), None
+        if self._time_sorted:
+            if since is not None:
+                lo = bisect_left(timestamps, since)
+            if until is not None:
+                hi = bisect_right(timestamps, until)
+        elif since is not None or until is not None:
+            def check(row):
+                return (since is None or timestamps[row] >= since) and (until is None or timestamps[row] <= until)
+        return self._query(equal, lo, hi, check, limit, before)
+
+    def __getitem__(self, index):
+        columns = self._columns
+        position = columns['position'][index]
+        return self._record_class(self.types.names[columns['type'][index]], columns['lane'][index],
+                                  columns['timestamp'][index], None if isnan(position) else position)
+
+
+class VehicleHistory(_History):
+    """The vehicles reported by the V2V module, in the order they were received."""
+
+    def __init__(self, types, record_class=VehicleRecord):
+        self.types = TypeCodes(types)
+        self._record_class = record_class
+        self._columns = {'type': array('H'), 'direction': array('b'), 'lane': array('b'), 'velocity': array('d'),
+                         'position': array('d')}
+        self._init_indexes()
+
+    INDEXED = ('type', 'direction', 'lane')
+
+    def append(self, vehicle):
+        """Adds a vehicle. Raises ValueError, and adds nothing, if a field can't be stored."""
+        columns = self._columns
+        row = len(self)
+        direction, lane = direction_code(vehicle.direction), lane_code(vehicle.lane)
+        velocity = _float(vehicle.velocity, 'velocity')
+        position = nan if vehicle.position is None else _float(vehicle.position, 'position')
+        code = self.types.code(vehicle.type)
+        columns['type'].append(code)
+        columns['direction'].append(direction)
+        columns['lane'].append(lane)
+        columns['velocity'].append(velocity)
+        columns['position'].append(position)
+        self._index(row, (code, direction, lane))
+
+    def query(self, type=None, direction=None, lane=None, faster_than=None, slower_than=None, limit=50,
+              before=None):
+        """Returns a Page of the vehicles of a type, heading N or S, on a lane and faster or slower than a speed (all
+        optional), newest first. `before` is the cursor of the previous page. Raises ValueError for a direction
+        other than N or S or a limit below 1."""
+        limit = page_limit(limit)
+        equal = {}
+        if type is not None:
+            equal['type'] = self.types.find(type)
+            if equal['type'] is None:
+                return Page([], None)
+        if direction is not None:
+            equal['direction'] = direction_code(direction)  # ValueError for anything but N or S
+        if lane is not None:
+            equal['lane'] = lane
+        check = None
+        if faster_than is not None or slower_than is not None:
+            velocities = self._columns['velocity']
+
+            def check(row):
+                return ((faster_than is None or velocities[row] > faster_than)
+                        and (slower_than is None or velocities[row] < slower_than))
+        return self._query(equal, 0, len(self), check, limit, before)
+
+    def __getitem__(self, index):
+        columns = self._columns
+        velocity = columns['velocity'][index]
+        position = columns['position'][index]
+        return self._record_class(self.types.names[columns['type'][index]], DIRECTIONS[columns['direction'][index]],
+                                  columns['lane'][index],
+                                  int(velocity) if velocity.is_integer() else velocity,  # Whole speeds stay ints
+                                  None if isnan(position) else position)
@@ -0,0 +1,111 @@
+"""Decision latency histograms: how long the control unit takes from being handed an event by a sensor (or the
+engine) to finishing its action on it, per event type.
+
+The histograms are laid out as in HdrHistogram: values (nanoseconds) below 128 each have a bucket of their own, and
+every power of two above that is split into SUB_BUCKETS equal buckets, so any recorded value is known to within
+1/SUB_BUCKETS (1.6%) while the histogram stays a fixed list of about two thousand counters. Recording a value is a
+bit_length, a shift and an increment, cheap enough to leave on.
+"""
+
+import json
+
+SUB_BITS = 6
+SUB_BUCKETS = 1 << SUB_BITS  # Buckets per power of two
+MAX_BITS = 40  # Values of 2**40 ns (about 18 minutes) and above are counted in the last bucket
+BUCKETS = (MAX_BITS - SUB_BITS + 1) * SUB_BUCKETS
+KINDS = ('obstacle', 'vehicle', 'sign')
+PERCENTILES = (50, 99, 99.9)
+
+
+def bucket_range(index):
+    """Returns the lowest and highest value (ns) counted in a bucket."""
+    shift = max(index // SUB_BUCKETS - 1, 0)
+    low = (index - shift * SUB_BUCKETS) << shift
+    return low, low + (1 << shift) - 1
+
+
+class LatencyHistogram:
+    """Counts latencies in nanoseconds in log-linear buckets."""
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.total = 0  # Sum of the values, for the mean
+        self.max = 0  # Kept exactly, as the worst case matters most in a safety review
+
+    def record(self, value):
+        shift = value.bit_length() - SUB_BITS - 1
+        if shift <= 0:
+            self.counts[value] += 1
+        else:
+            index = shift * SUB_BUCKETS + (value >> shift)
+            self.counts[index if index < BUCKETS else BUCKETS - 1] += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def mean(self):
+        """Returns the mean latency (ns)."""
+        count = self.count
+        return self.total / count if count else 0.0
+
+    def percentile(self, percent):
+        """Returns the latency (ns) that `percent` % of the recorded values don't exceed, as the highest value of
+        its bucket (never more than the maximum)."""
+        count = self.count
+        if count == 0:
+            return 0
+        rank = max(1, -(-count * percent // 100))  # Rounded up
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(bucket_range(index)[1], self.max)
+
+    def reset(self):
+        self.counts = [0] * BUCKETS
+        self.total = self.max = 0
+
+    def summary(self):
+        """Returns the count, mean, percentiles and maximum, in microseconds."""
+        summary = {'count': self.count, 'mean_us': round(self.mean() / 1000, 3)}
+        for percent in PERCENTILES:
+            summary[f'p{percent:g}_us'] = round(self.percentile(percent) / 1000, 3)
+        summary['max_us'] = round(self.max / 1000, 3)
+        return summary
+
+    def to_dict(self):
+        """Returns the summary and the non-empty buckets as [lowest ns, highest ns, count] triples, so histograms
+        from different runs can be added up."""
+        return dict(self.summary(), buckets=[[*bucket_range(index), count]
+                                             for index, count in enumerate(self.counts) if count])
+
+
+class LatencyStats:
+    """One latency histogram per event type, e.g. stats['obstacle'] or stats.obstacle."""
+
+    def __init__(self):
+        self.obstacle = LatencyHistogram()
+        self.vehicle = LatencyHistogram()
+        self.sign = LatencyHistogram()
+
+    def __getitem__(self, kind):
+        if kind not in KINDS:
+            raise KeyError(kind)
+        return getattr(self, kind)
+
+    def reset(self):
+        for kind in KINDS:
+            self[kind].reset()
+
+    def to_dict(self):
+        return {kind: self[kind].to_dict() for kind in KINDS}
+
+    def export(self, path):
+        """Writes the histograms to a JSON file."""
+        with open(path, 'w') as file:
+            json.dump(self.to_dict(), file, indent=2)
+
@@ -0,0 +1,72 @@
+"""A spatial index of road objects (obstacles and vehicles) by lane, direction and position along the road.
+
+Positions are in metres along the road and grow towards the North, so a car travelling N has the larger positions
+ahead of it and a car travelling S the smaller ones. Each (lane, direction) pair keeps its objects in a sorted list,
+so range queries are binary searches. Obstacles have no direction and are indexed with direction None.
+"""
+
+from bisect import bisect_left, bisect_right
+
+
+class RoadIndex:
+    """Keeps road objects sorted by position in one list per (lane, direction)."""
+
+    def __init__(self):
+        self._positions = {}  # (lane, direction) -> sorted positions
+        self._items = {}  # (lane, direction) -> objects, in the same order as the positions
+        self._count = 0
+
+    def add(self, item, lane, position, direction=None):
+        """Adds an object at a position of a lane."""
+        key = (lane, direction)
+        positions = self._positions.get(key)
+        if positions is None:
+            positions = self._positions[key] = []
+            self._items[key] = []
+        index = bisect_right(positions, position)
+        positions.insert(index, position)
+        self._items[key].insert(index, item)
+        self._count += 1
+
+    def _keys(self, lane, direction):
+        if direction is not None:
+            return [(lane, direction)]
+        return [key for key in self._positions if key[0] == lane]
+
+    def within(self, lane, start, end, direction=None):
+        """Returns the (position, object) pairs of a lane between two positions (both included), sorted by
+        position. Without a direction, objects going both ways and obstacles are included."""
+        found = []
+        for key in self._keys(lane, direction):
+            positions = self._positions[key]
+            lo, hi = bisect_left(positions, start), bisect_right(positions, end)
+            found.extend(zip(positions[lo:hi], self._items[key][lo:hi]))
+        if direction is None:
+            found.sort(key=lambda pair: pair[0])
+        return found
+
+    def ahead(self, lane, position, distance, heading='N', direction=None):
+        """Returns the (position, object) pairs within `distance` metres ahead of `position` for a car heading
+        N or S, nearest first."""
+        if heading == 'N':
+            return self.within(lane, position, position + distance, direction)
+        return self.within(lane, position - distance, position, direction)[::-1]
+
+    def drop_behind(self, position, heading='N'):
+        """Removes every object a car at `position` heading N or S has already passed. Returns the removed objects."""
+        dropped = []
+        for key, positions in self._positions.items():
+            items = self._items[key]
+            if heading == 'N':
+                index = bisect_left(positions, position)
+                dropped.extend(items[:index])
+                del positions[:index], items[:index]
+            else:
+                index = bisect_right(positions, position)
+                dropped.extend(items[index:])
+                del positions[index:], items[index:]
+        self._count -= len(dropped)
+        return dropped
+
+    def __len__(self):
+        return self._count
@@ -0,0 +1,303 @@
+"""The decision rules of the control unit, loaded from a rules file and compiled into lookup tables.
+
+A rules file (JSON, or YAML when PyYAML is installed) has an ordered list of rules for each kind of event:
+obstacles, vehicles and traffic signs. The first rule whose conditions hold decides. The conditions are:
+
+    lane          the lane of our car
+    same_lane     whether the obstacle or vehicle is on our lane
+    oncoming      whether the vehicle travels in the opposite direction (vehicles)
+    other_faster  whether the vehicle is faster than our car (vehicles)
+    code          the traffic sign code (signs)
+    speed         [operator, value] compared against the speed of our car, e.g. ["<", 80]
+
+and the actions are `lane` (the new lane), `set_speed` or `scale_speed`, the car log event `log` and the
+message `say` shown to the operator.
+
+When the rules are loaded, they are evaluated once for every combination of our lane, the other lane, the
+relative direction and the speed band of our car. The speed bands are the ranges between the speeds the rules
+compare against, plus those speeds themselves, so every speed in a band gets the same decision. The band of every
+whole speed up to MAX_SPEED is worked out then too, so deciding on an event is two dict lookups; other speeds (a
+slippery road leaves fractions) take two binary searches. A DecisionCache can be put in front of the table to
+remember the decisions of recent events.
+"""
+
+import json
+import operator
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from os import path as os_path
+from string import Formatter
+
+from carlog import MESSAGES, Event
+
+DEFAULT_RULES_PATH = os_path.join(os_path.dirname(os_path.abspath(__file__)), 'rules.json')
+
+LANES = (1, 2, 3)  # The lanes of the road; the sensors reject detections on any other lane
+OFF_ROAD = 0  # Stands for any other lane an obstacle or a vehicle is reported on
+
+KINDS = ('obstacle', 'vehicle', 'sign')
+
+MAX_SPEED = 300  # km/h; the speed bands of the whole speeds up to this one are looked up rather than searched
+
+OPERATORS = {'<': operator.lt, '<=': operator.le, '==': operator.eq, '!=': operator.ne, '>=': operator.ge,
+             '>': operator.gt}
+
+CONDITIONS = {'obstacle': {'lane', 'same_lane', 'speed'},
+              'vehicle': {'lane', 'same_lane', 'oncoming', 'other_faster', 'speed'},
+              'sign': {'code', 'speed'}}
+
+ACTIONS = {'if', 'lane', 'set_speed', 'scale_speed', 'log', 'say'}
+
+
+class RulesError(ValueError):
+    """Raised for a rules file that can't be compiled."""
+
+
+class Decision:
+    """What the control unit does for an event: the new lane and speed of the car, and what it logs and shows."""
+
+    __slots__ = ('lane', 'set_speed', 'scale_speed', 'log', 'log_args', 'say')
+
+    def __init__(self, lane, set_speed, scale_speed, log, say):
+        self.lane = lane  # None keeps the lane
+        self.set_speed = set_speed
+        self.scale_speed = scale_speed
+        self.log = log
+        self.log_args = sum(1 for _, field, _, _ in Formatter().parse(MESSAGES[log][1]) if field is not None)
+        self.say = say
+
+
+class SpeedBands:
+    """Splits speeds into bands on the thresholds the rules compare against. Even bands are the thresholds
+    themselves and odd bands the ranges between them, so a comparison with a threshold has one result per band."""
+
+    def __init__(self, thresholds):
+        self.thresholds = sorted(set(thresholds))
+
+    def band(self, speed):
+        thresholds = self.thresholds
+        # One more than the number of thresholds below the speed, plus one if the speed is a threshold
+        return bisect_left(thresholds, speed) + bisect_right(thresholds, speed) - 1
+
+    def samples(self):
+        """Returns (band, speed) pairs with one speed of every band."""
+        thresholds = self.thresholds
+        if not thresholds:
+            return [(-1, 0)]
+        pairs = [(-1, thresholds[0] - 1)]
+        for index, threshold in enumerate(thresholds):
+            following = thresholds[index + 1] if index + 1 < len(thresholds) else threshold + 2
+            pairs.append((2 * index, threshold))
+            pairs.append((2 * index + 1, (threshold + following) / 2))
+        return pairs
+
+
+def _check(kind, number, rule):
+    conditions = rule.get('if', {})
+    unknown = set(conditions) - CONDITIONS[kind] or set(rule) - ACTIONS
+    if unknown:
+        raise RulesError(f"{kind} rule {number}: unknown keys {sorted(unknown)}")
+    if 'log' not in rule or rule['log'] not in Event.__members__:
+        raise RulesError(f"{kind} rule {number}: missing or unknown log event {rule.get('log')!r}")
+    if 'speed' in conditions:
+        op, _ = conditions['speed']
+        if op not in OPERATORS:
+            raise RulesError(f"{kind} rule {number}: unknown speed operator {op!r}")
+    if 'set_speed' in rule and 'scale_speed' in rule:
+        raise RulesError(f"{kind} rule {number}: set_speed and scale_speed can't be used together")
+
+
+def _matches(conditions, facts):
+    for name, wanted in conditions.items():
+        if name == 'speed':
+            op, value = wanted
+            if not OPERATORS[op](facts['speed'], value):
+                return False
+        elif facts[name] != wanted:
+            return False
+    return True
+
+
+class RuleTable:
+    """The compiled rules: one decision table per event kind."""
+
+    def __init__(self, rules, source=None):
+        self.source = source  # The file the rules were loaded from
+        for kind in KINDS:
+            for number, rule in enumerate(rules.get(kind, []), 1):
+                _check(kind, number, rule)
+        self._rules = rules
+        self.bands = {kind: SpeedBands(rule['if']['speed'][1] for rule in rules.get(kind, [])
+                                       if 'speed' in rule.get('if', {}))
+                      for kind in KINDS}
+        # {whole speed: band} of each kind, for the lookups. 42.0 finds the band of 42, as they hash alike.
+        self._obstacle_bands, self._vehicle_bands, self._sign_bands = (
+            {speed: self.bands[kind].band(speed) for speed in range(MAX_SPEED + 1)} for kind in KINDS)
+        self._obstacles = {}  # (our lane, other lane, speed band) -> Decision
+        self._vehicles = {}  # (our lane, other lane, oncoming, speed band, other faster) -> Decision
+        self._signs = {}  # (sign code, speed band) -> Decision
+        self._compile()
+
+    def _first(self, kind, facts):
+        for rule in self._rules.get(kind, []):
+            if _matches(rule.get('if', {}), facts):
+                return rule
+        return None
+
+    def _decision(self, kind, facts, decisions):
+        rule = self._first(kind, facts)
+        if rule is None:
+            return None
+        key = tuple(sorted((name, repr(value)) for name, value in rule.items()))
+        if key not in decisions:  # Rules are shared by many table cells
+            decisions[key] = Decision(rule.get('lane'), rule.get('set_speed'), rule.get('scale_speed'),
+                                      Event[rule['log']], rule.get('say', ''))
+        return decisions[key]
+
+    def _compile(self):
+        decisions = {}
+        for lane in LANES:
+            for other_lane in (OFF_ROAD, *LANES):
+                for band, speed in self.bands['obstacle'].samples():
+                    facts = {'lane': lane, 'same_lane': lane == other_lane, 'speed': speed}
+                    self._obstacles[lane, other_lane, band] = self._decision('obstacle', facts, decisions)
+                for oncoming in (False, True):
+                    for band, speed in self.bands['vehicle'].samples():
+                        for other_faster in (False, True):
+                            facts = {'lane': lane, 'same_lane': lane == other_lane, 'oncoming': oncoming,
+                                     'speed': speed, 'other_faster': other_faster}
+                            self._vehicles[lane, other_lane, oncoming, band, other_faster] = self._decision(
+                                'vehicle', facts, decisions)
+        codes = {rule['if']['code'] for rule in self._rules.get('sign', []) if 'code' in rule.get('if', {})}
+        self.sign_codes = sorted(codes)  # The traffic sign codes the rules know
+        for code in codes:
+            for band, speed in self.bands['sign'].samples():
+                self._signs[code, band] = self._decision('sign', {'code': code, 'speed': speed}, decisions)
+
+    def obstacle(self, lane, other_lane, speed):
+        """Returns the decision for an obstacle on other_lane."""
+        band = self._obstacle_bands.get(speed)
+        if band is None:
+            band = self.bands['obstacle'].band(speed)
+        decision = self._obstacles.get((lane, other_lane, band))
+        return decision if decision is not None else self._obstacles[lane, OFF_ROAD, band]
+
+    def vehicle(self, lane, other_lane, oncoming, speed, other_faster):
+        """Returns the decision for a vehicle on other_lane."""
+        band = self._vehicle_bands.get(speed)
+        if band is None:
+            band = self.bands['vehicle'].band(speed)
+        decision = self._vehicles.get((lane, other_lane, oncoming, band, other_faster))
+        return decision if decision is not None else self._vehicles[lane, OFF_ROAD, oncoming, band, other_faster]
+
+    def sign(self, code, speed):
+        """Returns the decision for a traffic sign, or None for a sign the rules don't know."""
+        band = self._sign_bands.get(speed)
+        if band is None:
+            band = self.bands['sign'].band(speed)
+        return self._signs.get((code, band))
+
+    def __len__(self):
+        return len(self._obstacles) + len(self._vehicles) + len(self._signs)
+
+
+_MISSING = object()
+
+
+class DecisionCache:
+    """A bounded LRU cache of decisions in front of a RuleTable, keyed by the event facts themselves (the exact
+    speed rather than its band). It has the same obstacle, vehicle and sign methods as the table."""
+
+    def __init__(self, rules, maxsize=1024):
+        if maxsize < 1:
+            raise ValueError("The cache size must be at least 1.")
+        self._rules = rules
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # Facts -> decision, least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def rules(self):
+        return self._rules
+
+    @rules.setter
+    def rules(self, value):
+        self._rules = value
+        self.clear()  # The cached decisions were taken by the old rules
+
+    def clear(self):
+        self._entries.clear()
+        self.invalidations += 1
+
+    def _store(self, key, decision):
+        self.misses += 1
+        entries = self._entries
+        entries[key] = decision
+        if len(entries) > self.maxsize:
+            entries.popitem(last=False)
+            self.evictions += 1
+        return decision
+
+    def obstacle(self, lane, other_lane, speed):
+        key = ('obstacle', lane, other_lane, speed)
+        decision = self._entries.get(key, _MISSING)
+        if decision is _MISSING:
+            return self._store(key, self._rules.obstacle(lane, other_lane, speed))
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return decision
+
+    def vehicle(self, lane, other_lane, oncoming, speed, other_faster):
+        key = ('vehicle', lane, other_lane, oncoming, speed, other_faster)
+        decision = self._entries.get(key, _MISSING)
+        if decision is _MISSING:
+            return self._store(key, self._rules.vehicle(lane, other_lane, oncoming, speed, other_faster))
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return decision
+
+    def sign(self, code, speed):
+        key = ('sign', code, speed)
+        decision = self._entries.get(key, _MISSING)
+        if decision is _MISSING:
+            return self._store(key, self._rules.sign(code, speed))
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return decision
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'invalidations': self.invalidations, 'size': len(self._entries), 'maxsize': self.maxsize,
+                'hit_rate': self.hits / lookups if lookups else 0.0}
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def read_rules(path=DEFAULT_RULES_PATH):
+    """Reads a rules file without compiling it. Returns the rule lists by event kind."""
+    with open(path, encoding='utf-8') as file:
+        if path.endswith(('.yaml', '.yml')):
+            import yaml  # Optional: only needed for YAML rules files
+            return yaml.safe_load(file)
+        return json.load(file)
+
+
+def load_rules(path=DEFAULT_RULES_PATH):
+    """Loads a rules file and compiles it into a RuleTable."""
+    return RuleTable(read_rules(path), source=path)
+
+
+_default = None
+
+
+def default_rules():
+    """Returns the compiled rules of rules.json, loading them on the first call."""
+    global _default
+    if _default is None:
+        _default = load_rules()
+    return _default
@@ -0,0 +1,134 @@
+"""Replays recorded drives through the control unit.
+
+A scenario file holds one timestamped event per line, either as JSON lines (.jsonl) or as CSV (.csv):
+
+    {"time": 0.0, "kind": "obstacle", "type": "Rock", "lane": 1, "position": 120.0}
+    {"time": 0.5, "kind": "vehicle", "type": "Car", "direction": "S", "lane": 2, "velocity": 90}
+    {"time": 1.0, "kind": "sign", "code": 1}
+    {"time": 1.5, "kind": "command", "command": "accelerate"}
+
+    time,kind,type,direction,lane,velocity,code,position,command
+    0.0,obstacle,Rock,,1,,,120.0,
+    0.5,vehicle,Car,S,2,90,,,
+    1.0,sign,,,,,1,,
+    1.5,command,,,,,,,accelerate
+
+The position (metres along the road) of obstacles and vehicles is optional; the velocity (km/h) of a vehicle is not.
+Commands are the driving commands of the engine (start, accelerate, brake, change_direction, change_lane with a
+lane, stop). Events must be in time order. The file is read lazily, one line at a time, so the size of the drive log
+does not affect memory use.
+"""
+
+import argparse
+import csv
+import json
+import math
+
+from driverless_car import LANES, Command, Obstacle, SimulationEngine, TrafficSign, Vehicle
+
+TRAJECTORY_FIELDS = ('time', 'kind', 'lane', 'direction', 'velocity')
+_KINDS = {Obstacle: 'obstacle', Vehicle: 'vehicle', TrafficSign: 'sign', Command: 'command'}
+
+
+class ScenarioError(ValueError):
+    """Raised when a scenario file holds an invalid or out of order event."""
+
+
+def _lane(record):
+    lane = int(record['lane'])
+    if lane not in LANES:
+        raise ValueError(f"lane {lane} doesn't exist")
+    return lane
+
+
+def _velocity(record):
+    """Returns the velocity of a vehicle record: an int when it is a whole number, as the histories keep it."""
+    value = record.get('velocity')
+    if value in (None, '') or isinstance(value, bool):
+        raise ValueError(f"velocity {value!r} is missing or not a number")
+    velocity = float(value)
+    if not math.isfinite(velocity) or velocity < 0:
+        raise ValueError(f"velocity {value!r} must be a non-negative number")
+    return int(velocity) if velocity.is_integer() else velocity
+
+
+def to_event(record, line_no):
+    """Builds the event object described by one scenario record (line_no is used in error messages)."""
+    kind = record.get('kind')
+    try:
+        position = record.get('position')
+        position = float(position) if position not in (None, '') else None
+        if kind == 'obstacle':
+            return Obstacle(record['type'], _lane(record), record['time'], position)
+        if kind == 'vehicle':
+            direction = record['direction'].upper()
+            if direction not in ('N', 'S'):
+                raise ValueError(f"direction {direction!r} must be N or S")
+            return Vehicle(record['type'], direction, _lane(record), _velocity(record), position)
+        if kind == 'sign':
+            return TrafficSign(int(record['code']))
+        if kind == 'command':
+            lane = record.get('lane')
+            return Command(record['command'], int(lane) if lane not in (None, '') else None)
+    except (KeyError, ValueError, TypeError, AttributeError) as error:
+        raise ScenarioError(f"Line {line_no}: invalid {kind} event ({error!r})") from None
+    raise ScenarioError(f"Line {line_no}: unknown event kind {kind!r}")
+
+
+def _records(path):
+    """Yields (line number, record) pairs from a JSONL or CSV scenario file."""
+    with open(path, newline='') as file:
+        if path.endswith('.csv'):
+            # The header is line 1, so the first record is on line 2
+            for line_no, row in enumerate(csv.DictReader(file), start=2):
+                yield line_no, row
+        else:
+            for line_no, line in enumerate(file, start=1):
+                if line.strip():
+                    try:
+                        yield line_no, json.loads(line)
+                    except json.JSONDecodeError as error:
+                        raise ScenarioError(f"Line {line_no}: {error}") from None
+
+
+def read_scenario(path):
+    """Generator which yields (time, event) pairs from a scenario file in file order."""
+    last_time = float('-inf')
+    for line_no, record in _records(path):
+        try:
+            time = float(record['time'])
+        except (KeyError, TypeError, ValueError):
+            raise ScenarioError(f"Line {line_no}: missing or invalid time") from None
+        if time < last_time:
+            raise ScenarioError(f"Line {line_no}: event at {time} is earlier than the previous event")
+        last_time = time
+        record['time'] = time
+        yield time, to_event(record, line_no)
+
+
+def replay(scenario_path, trajectory_path, engine=None, start=True):
+    """Sends every event of a scenario file through the control unit and writes the car state after each event
+    to a CSV trajectory file. Returns the number of events replayed."""
+    if engine is None:
+        engine = SimulationEngine()
+    if start:
+        engine.start()
+    send = engine.send
+    car = engine.control_unit.car
+    count = 0
+    with open(trajectory_path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(TRAJECTORY_FIELDS)
+        for time, event in read_scenario(scenario_path):
+            send(event)
+            writer.writerow((time, _KINDS[type(event)], car.lane, car.direction, car.velocity))
+            count += 1
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replays a scenario file through a headless control unit.")
+    parser.add_argument('scenario', help="scenario file (.jsonl or .csv)")
+    parser.add_argument('trajectory', help="CSV file the car state trajectory is written to")
+    args = parser.parse_args()
+    print(f"{replay(args.scenario, args.trajectory)} events replayed.")
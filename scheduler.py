@@ -0,0 +1,125 @@
+"""A priority scheduler in front of the decisions of the control unit, so that safety events are decided before
+routine ones however many of those are waiting.
+
+Events submitted by the sensors wait in a heap until they are dispatched to an engine. Each event is put in a class
+from the car state when it is submitted:
+
+    critical  an obstacle on the car's lane, a pedestrian or an animal on any lane, or an oncoming vehicle on the
+              car's lane
+    hazard    any other obstacle or vehicle
+    routine   traffic signs and driving commands
+
+and given a deadline: the time budget of its class (DEADLINES) after it was submitted, or its time to collision if
+that is sooner. The heap dispatches by class, then earliest deadline first, then in order of submission. So a
+pedestrian or a head-on vehicle is decided before a backlog of signs, and of two critical events the one closer to a
+collision goes first. No event is dropped: one decided after its deadline is counted as missed. The 'fifo' policy
+dispatches in order of submission instead, for comparison.
+
+    scheduler = EventScheduler(session.engine)
+    scheduler.submit(Obstacle('Pedestrian', 1, time(), position=40.0))
+    scheduler.dispatch()
+    scheduler.stats()  # Latency percentiles and missed deadlines of each class
+"""
+
+import threading
+from heapq import heappop, heappush
+from itertools import count
+from time import perf_counter_ns
+
+from driverless_car import Obstacle, Vehicle
+from latency import LatencyHistogram
+
+CLASSES = ('critical', 'hazard', 'routine')  # In the order they are dispatched
+DEADLINES = {'critical': 0.01, 'hazard': 0.05, 'routine': 0.5}  # Seconds from submission to decision
+VULNERABLE = ('Pedestrian', 'Animal')  # Obstacles that may move into the car's lane
+POLICIES = ('priority', 'fifo')
+
+_RANKS = {kind: rank for rank, kind in enumerate(CLASSES)}
+
+
+def classify(car, event):
+    """Returns the class of an event for a car in its current state."""
+    if isinstance(event, Obstacle):
+        return 'critical' if event.lane == car.lane or event.type in VULNERABLE else 'hazard'
+    if isinstance(event, Vehicle):
+        return 'critical' if event.lane == car.lane and event.direction != car.direction else 'hazard'
+    return 'routine'
+
+
+def time_to_collision(car, event):
+    """Returns the seconds until the car reaches an obstacle or a vehicle ahead on its lane at their current
+    speeds, or None if the position isn't known or they aren't closing in."""
+    if getattr(event, 'position', None) is None or event.lane != car.lane:
+        return None
+    gap = event.position - car.position if car.direction == 'N' else car.position - event.position
+    if gap < 0:  # Behind the car
+        return None
+    closing = car.velocity  # km/h
+    if isinstance(event, Vehicle):
+        closing += event.velocity if event.direction != car.direction else -event.velocity
+    return gap / (closing / 3.6) if closing > 0 else None
+
+
+class EventScheduler:
+    """Holds the submitted events in a heap and dispatches them to an engine in order of class and deadline (or of
+    submission with policy='fifo'). Sensors may submit from threads of their own."""
+
+    def __init__(self, engine, policy='priority', deadlines=None, clock=perf_counter_ns):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown scheduling policy: {policy!r}")
+        self._engine = engine
+        self._car = engine.control_unit.car
+        self.policy = policy
+        # Class -> time budget in nanoseconds
+        self._budgets = {kind: int(seconds * 1e9) for kind, seconds in dict(DEADLINES, **(deadlines or {})).items()}
+        self._clock = clock  # Nanoseconds
+        self._heap = []  # (key, class, submission time, deadline, event) entries
+        self._lock = threading.Lock()
+        self._arrivals = count()
+        self.latency = {kind: LatencyHistogram() for kind in CLASSES}  # Submission to end of decision, by class
+        self.missed = dict.fromkeys(CLASSES, 0)  # Events decided after their deadline, by class
+
+    def submit(self, event, now=None):
+        """Queues an event until it is dispatched. `now` is when the event arrived on the scheduler's clock (the
+        current time by default). Returns the class of the event."""
+        if now is None:
+            now = self._clock()
+        kind = classify(self._car, event)
+        deadline = now + self._budgets[kind]
+        ttc = time_to_collision(self._car, event)
+        if ttc is not None:
+            deadline = min(deadline, now + int(ttc * 1e9))
+        with self._lock:
+            seq = next(self._arrivals)
+            key = (_RANKS[kind], deadline, seq) if self.policy == 'priority' else (seq,)
+            heappush(self._heap, (key, kind, now, deadline, event))
+        return kind
+
+    def dispatch(self, max_events=None, max_time=None):
+        """Sends the waiting events to the engine in order until none is left, max_events have been sent or
+        max_time seconds have passed. Returns the number of events sent."""
+        send, clock, heap, lock = self._engine.send, self._clock, self._heap, self._lock
+        stop = None if max_time is None else clock() + int(max_time * 1e9)
+        sent = 0
+        while max_events is None or sent < max_events:
+            with lock:
+                if not heap:
+                    break
+                _, kind, submitted, deadline, event = heappop(heap)
+            send(event)
+            finished = clock()
+            self.latency[kind].record(finished - submitted)
+            if finished > deadline:
+                self.missed[kind] += 1
+            sent += 1
+            if stop is not None and finished >= stop:
+                break
+        return sent
+
+    def __len__(self):
+        """Number of events waiting."""
+        return len(self._heap)
+
+    def stats(self):
+        """Returns the latency summary (see latency.py) and the missed deadlines of each class."""
+        return {kind: dict(self.latency[kind].summary(), missed=self.missed[kind]) for kind in CLASSES}
@@ -0,0 +1,143 @@
+"""An asyncio pipeline where the sensors produce events concurrently and the control unit consumes them in time order.
+
+Each sensor writes (timestamp, event) pairs to its own bounded queue. A full queue either makes the sensor wait
+(backpressure) or drops events, depending on the overflow policy of the sensor, and every sensor counts what it
+produced and dropped. The consumer merges the queues by timestamp: it waits until every running sensor has an
+event ready, but never longer than max_delay, so a quiet sensor delays the others only briefly and a busy one
+cannot starve them.
+
+    pipeline = SensorPipeline(engine)
+    pipeline.add_sensor('lidar', periodic(lidar_events, rate=20))
+    pipeline.add_sensor('v2v', v2v_events, overflow='drop_oldest')
+    stats = asyncio.run(pipeline.run())
+"""
+
+import asyncio
+
+OVERFLOW_POLICIES = ('block', 'drop_newest', 'drop_oldest')
+
+_END = object()  # Put in a queue when its sensor has nothing more to send
+
+
+class SensorFeed:
+    """The bounded queue of one sensor and its counters."""
+
+    def __init__(self, name, source, maxsize, overflow):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow!r}")
+        self.name = name
+        self.source = source
+        self.overflow = overflow
+        self.queue = asyncio.Queue(maxsize)
+        self.produced = 0
+        self.dropped = 0  # Events lost because the queue was full
+        self.consumed = 0
+        self.high_water = 0  # Largest number of events waiting in the queue
+
+    async def produce(self):
+        """Copies the events of the source (a sync or async iterable) to the queue."""
+        if hasattr(self.source, '__aiter__'):
+            async for item in self.source:
+                await self._put(item)
+        else:
+            for item in self.source:
+                await self._put(item)
+                await asyncio.sleep(0)  # Lets the other sensors and the consumer run
+        await self.queue.put(_END)
+
+    async def _put(self, item):
+        self.produced += 1
+        queue = self.queue
+        if queue.full():
+            if self.overflow == 'block':
+                await queue.put(item)
+            elif self.overflow == 'drop_newest':
+                self.dropped += 1
+            else:
+                queue.get_nowait()
+                self.dropped += 1
+                queue.put_nowait(item)
+        else:
+            queue.put_nowait(item)
+        if queue.qsize() > self.high_water:
+            self.high_water = queue.qsize()
+
+    def stats(self):
+        return {'produced': self.produced, 'consumed': self.consumed, 'dropped': self.dropped,
+                'high_water': self.high_water}
+
+
+async def periodic(events, rate):
+    """Async generator which releases the events of an iterable at `rate` Hz, stamped with the loop time."""
+    loop = asyncio.get_running_loop()
+    interval = 1 / rate
+    deadline = loop.time()
+    for event in events:
+        delay = deadline - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        yield loop.time(), event
+        deadline += interval
+
+
+class SensorPipeline:
+    """Merges the event queues of several sensors and sends the events to an engine in timestamp order."""
+
+    def __init__(self, engine, maxsize=100, max_delay=0.05):
+        self._engine = engine
+        self._maxsize = maxsize
+        self.max_delay = max_delay  # Longest wait in seconds for a quiet sensor before events are sent without it
+        self._feeds = []
+        self.late = 0  # Events sent while a running sensor had nothing queued
+
+    def add_sensor(self, name, source, maxsize=None, overflow='block'):
+        """Adds a sensor whose source yields (timestamp, event) pairs. Returns its SensorFeed."""
+        feed = SensorFeed(name, source, maxsize or self._maxsize, overflow)
+        self._feeds.append(feed)
+        return feed
+
+    async def _fill(self, heads, feeds, timeout, return_when):
+        """Waits for the next items of the given sensors and adds them to the heads."""
+        getters = {asyncio.ensure_future(feed.queue.get()): feed for feed in feeds}
+        try:
+            done, _ = await asyncio.wait(getters, timeout=timeout, return_when=return_when)
+        finally:
+            for getter in getters:
+                if not getter.done():
+                    getter.cancel()  # The item stays in the queue
+        for getter in done:
+            heads[getters[getter]] = getter.result()
+
+    async def _consume(self):
+        send = self._engine.send
+        heads = {}  # Feed -> the next item of the feed
+        idle = set()  # Running sensors that had nothing to send within max_delay
+        running = list(self._feeds)
+        while running:
+            for feed in running:
+                if feed not in heads and not feed.queue.empty():
+                    heads[feed] = feed.queue.get_nowait()
+            idle.difference_update(heads)
+            waiting = [feed for feed in running if feed not in heads and feed not in idle]
+            if not heads:  # Nothing to send: waits for whichever sensor is first
+                await self._fill(heads, running, None, asyncio.FIRST_COMPLETED)
+            elif waiting:  # Gives the other sensors up to max_delay to catch up, so the order holds
+                await self._fill(heads, waiting, self.max_delay, asyncio.ALL_COMPLETED)
+                idle.update(feed for feed in waiting if feed not in heads)
+            for feed in [feed for feed, item in heads.items() if item is _END]:
+                del heads[feed]
+                running.remove(feed)
+                idle.discard(feed)
+            if not heads:
+                continue
+            if len(heads) < len(running):
+                self.late += 1
+            feed = min(heads, key=lambda head: heads[head][0])
+            _, event = heads.pop(feed)
+            send(event)
+            feed.consumed += 1
+
+    async def run(self):
+        """Runs the sensors and the consumer until every sensor is exhausted. Returns the counters of each sensor."""
+        await asyncio.gather(self._consume(), *(feed.produce() for feed in self._feeds))
+        return {feed.name: feed.stats() for feed in self._feeds}
@@ -0,0 +1,103 @@
+"""A fixed tick rate simulation loop that moves the car along the road.
+
+Every tick advances the simulated time by 1 / rate seconds, moves the car according to its velocity and
+direction, sends the events that are due to the control unit through the engine, and expires the obstacles
+and vehicles the car has passed. In real time mode the ticks are paced against an absolute schedule, so the
+rate stays steady; ticks whose work takes longer than the tick budget are counted as overruns. Otherwise the
+loop runs as fast as possible. With a telemetry recorder (see telemetry.py), the car state is recorded at every tick
+and the records of the events carry the simulated time.
+"""
+
+from time import perf_counter, sleep
+
+KMH_TO_MS = 1 / 3.6
+
+
+class LoopStats:
+    """Counters collected while the loop runs."""
+
+    def __init__(self, budget):
+        self.budget = budget  # Seconds available for each tick
+        self.ticks = 0
+        self.events = 0
+        self.expired = 0
+        self.overruns = 0  # Ticks whose work took longer than the budget
+        self.max_tick_time = 0.0
+        self.busy_time = 0.0  # Total time spent working on ticks
+        self.elapsed = 0.0  # Wall clock time of the run
+
+    def report(self):
+        mean = self.busy_time / self.ticks if self.ticks else 0.0
+        return (f"{self.ticks} ticks in {self.elapsed:.3f} s, {self.events} events, {self.expired} objects expired, "
+                f"tick time mean {mean * 1e6:.1f} us / max {self.max_tick_time * 1e6:.1f} us "
+                f"(budget {self.budget * 1e6:.0f} us), {self.overruns} overruns")
+
+
+class SimulationLoop:
+    """Runs an engine at a fixed tick rate. Events are (time, event) pairs in time order, such as the ones
+    scenario.read_scenario yields."""
+
+    def __init__(self, engine, rate=100.0, realtime=True, recorder=None):
+        if rate <= 0:
+            raise ValueError("The tick rate must be positive.")
+        self._engine = engine
+        self.rate = rate
+        self.realtime = realtime
+        self.time = 0.0  # Simulated time in seconds
+        self.recorder = recorder
+
+    def run(self, ticks, events=()):
+        """Runs the given number of ticks and returns the LoopStats of the run."""
+        engine = self._engine
+        control_unit = engine.control_unit
+        car = control_unit.car
+        comms = engine.comms
+        tracker = engine.tracker
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.clock = lambda: self.time  # Events are recorded with the time of their tick
+        dt = 1 / self.rate
+        stats = LoopStats(dt)
+        events = iter(events)
+        pending = next(events, None)
+
+        start = deadline = perf_counter()
+        for _ in range(ticks):
+            tick_start = perf_counter()
+            self.time += dt
+            if tracker is not None:  # Every tick is a new sensor frame
+                tracker.next_frame()
+
+            # Moves the car. Positions grow towards the North.
+            step = car.velocity * KMH_TO_MS * dt
+            car.position += step if car.direction == 'N' else -step
+
+            # Sends the events that are due
+            while pending is not None and pending[0] <= self.time:
+                engine.send(pending[1])
+                stats.events += 1
+                pending = next(events, None)
+
+            stats.expired += control_unit.expire_passed()
+            if comms is not None:
+                stats.expired += comms.expire_passed(car)
+            if recorder is not None:
+                recorder.tick(car, self.time)
+
+            tick_time = perf_counter() - tick_start
+            stats.ticks += 1
+            stats.busy_time += tick_time
+            if tick_time > stats.max_tick_time:
+                stats.max_tick_time = tick_time
+            if tick_time > dt:
+                stats.overruns += 1
+
+            if self.realtime:
+                deadline += dt
+                delay = deadline - perf_counter()
+                if delay > 0:
+                    sleep(delay)
+                elif delay < -dt:  # More than a tick behind: starts a new schedule instead of bursting to catch up
+                    deadline = perf_counter()
+        stats.elapsed = perf_counter() - start
+        return stats
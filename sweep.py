@@ -0,0 +1,192 @@
+"""Parameter sweeps: runs every scenario with every parameter set on a process pool and gathers the metrics of each
+run into one results table.
+
+The parameters are
+
+    lane_split   speed (km/h) under which a car on lane 2 avoids an obstacle or an oncoming vehicle by moving to
+                 lane 1 rather than lane 3 (80 in rules.json)
+    slippery     share of the speed taken off by the slippery road sign (0.3)
+    speed_step   km/h added or taken off by accelerate and brake (10)
+
+Each run drives a scenario (see scenario.py) through a SimulationLoop at a fixed tick rate, as fast as possible,
+and measures
+
+    events         events and commands sent
+    lane_changes   times the car changed lane
+    stops          times the car came to a standstill
+    min_gap        smallest distance in metres to an obstacle or vehicle ahead on the car's lane (NaN without
+                   positions)
+    time_at_speed  seconds driven at or above the cruise speed
+
+The (scenario, parameters) jobs are handed to the workers in chunks, so the cost of a job is mostly the run itself.
+
+    python sweep.py drives/*.jsonl --lane-split 70 80 90 --slippery 0.2 0.3 --speed-step 5 10 --out results.csv
+"""
+
+import argparse
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+from copy import deepcopy
+from itertools import product
+from math import ceil, inf, nan
+from time import perf_counter
+
+from driverless_car import Session, SimulationEngine
+from rules import RuleTable, read_rules
+from scenario import read_scenario
+from simloop import SimulationLoop
+
+DEFAULTS = {'lane_split': 80, 'slippery': 0.3, 'speed_step': 10}
+METRICS = ('events', 'lane_changes', 'stops', 'min_gap', 'time_at_speed')
+
+_tables = {}  # (lane_split, slippery) -> RuleTable, kept by each worker across its jobs
+
+
+def tuned_rules(lane_split=80, slippery=0.3):
+    """Returns the rules of rules.json with another lane split speed and slippery road reduction. The lane split is
+    the "<" speed condition of the obstacle and vehicle rules."""
+    key = (lane_split, slippery)
+    if key not in _tables:
+        rules = deepcopy(read_rules())
+        for kind in ('obstacle', 'vehicle'):
+            for rule in rules[kind]:
+                condition = rule.get('if', {}).get('speed')
+                if condition is not None and condition[0] == '<':
+                    rule['if']['speed'] = ['<', lane_split]
+        for rule in rules['sign']:
+            if 'scale_speed' in rule:
+                rule['scale_speed'] = 1 - slippery
+        _tables[key] = RuleTable(rules, source=f"rules.json (lane_split={lane_split}, slippery={slippery})")
+    return _tables[key]
+
+
+def grid(**values):
+    """Returns the parameter sets of every combination of the given values, e.g. grid(lane_split=[70, 80])."""
+    names = list(values)
+    return [dict(DEFAULTS, **dict(zip(names, combination))) for combination in product(*values.values())]
+
+
+class RunMetrics:
+    """Measures one run. It is the recorder of the control unit and of the loop, so it sees the car after every
+    event and at every tick."""
+
+    def __init__(self, control_unit, comms, dt, cruise, horizon):
+        self.clock = None  # Set by the loop
+        self._control_unit = control_unit
+        self._comms = comms
+        self._dt = dt
+        self._cruise = cruise
+        self._horizon = horizon  # Only objects this many metres ahead count for the gap
+        car = control_unit.car
+        self._lane = car.lane
+        self._moving = car.velocity > 0
+        self.lane_changes = 0
+        self.stops = 0
+        self.min_gap = inf
+        self.time_at_speed = 0.0
+
+    def _update(self, car):
+        if car.lane != self._lane:
+            self.lane_changes += 1
+            self._lane = car.lane
+        moving = car.velocity > 0
+        if self._moving and not moving:
+            self.stops += 1
+        self._moving = moving
+
+    def obstacle(self, car, event):
+        self._update(car)
+
+    vehicle = sign = obstacle
+
+    def tick(self, car, when):
+        self._update(car)  # Commands change the car without going through the recorder
+        if car.velocity >= self._cruise:
+            self.time_at_speed += self._dt
+        for ahead in (self._control_unit.obstacles_ahead(self._horizon),
+                      self._comms.vehicles_ahead(car, self._horizon)):
+            if ahead:
+                self.min_gap = min(self.min_gap, abs(ahead[0].position - car.position))
+
+
+def run_job(job):
+    """Runs one (scenario path, parameters, rate, cruise, tail) job. Returns a results row."""
+    path, params, rate, cruise, tail = job
+    events = list(read_scenario(path))
+    session = Session(verbose=False, rules=tuned_rules(params['lane_split'], params['slippery']),
+                      speed_step=params['speed_step'])
+    # The V2V module of the session keeps the vehicles by position, for the gaps
+    engine = SimulationEngine(session.control_unit, session.sign_db, comms=session.v2vcomms)
+    metrics = RunMetrics(session.control_unit, session.v2vcomms, 1 / rate, cruise, horizon=1000.0)
+    session.control_unit.recorder = metrics
+    engine.start()
+    duration = (events[-1][0] if events else 0.0) + tail
+    stats = SimulationLoop(engine, rate, realtime=False, recorder=metrics).run(ceil(duration * rate), events)
+    return dict(scenario=path, **params, events=stats.events, lane_changes=metrics.lane_changes,
+                stops=metrics.stops, min_gap=metrics.min_gap if metrics.min_gap != inf else nan,
+                time_at_speed=round(metrics.time_at_speed, 6))
+
+
+def run_sweep(scenarios, param_sets, workers=None, chunksize=None, rate=10.0, cruise=50, tail=5.0):
+    """Runs every scenario with every parameter set and returns the results rows, in job order. With workers=1
+    the jobs run in this process."""
+    jobs = [(path, params, rate, cruise, tail) for params in param_sets for path in scenarios]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        return [run_job(job) for job in jobs]
+    if chunksize is None:  # A few chunks per worker balance the load without much dispatch overhead
+        chunksize = max(1, len(jobs) // (4 * workers))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run_job, jobs, chunksize=chunksize))
+
+
+def write_table(rows, path):
+    """Writes the results rows to a CSV file."""
+    with open(path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=['scenario', *DEFAULTS, *METRICS])
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def summary(rows):
+    """Returns the mean of every metric over the scenarios, for each parameter set."""
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(row[name] for name in DEFAULTS), []).append(row)
+    table = []
+    for params, group in groups.items():
+        means = {}
+        for metric in METRICS:
+            values = [row[metric] for row in group if row[metric] == row[metric]]  # Leaves out NaN
+            means[metric] = sum(values) / len(values) if values else nan
+        table.append(dict(zip(DEFAULTS, params), runs=len(group), **means))
+    return table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs scenarios with every combination of the given parameters.")
+    parser.add_argument('scenarios', nargs='+', help="scenario files (.jsonl or .csv)")
+    parser.add_argument('--lane-split', type=float, nargs='+', default=[DEFAULTS['lane_split']])
+    parser.add_argument('--slippery', type=float, nargs='+', default=[DEFAULTS['slippery']])
+    parser.add_argument('--speed-step', type=float, nargs='+', default=[DEFAULTS['speed_step']])
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument('--chunksize', type=int, default=None)
+    parser.add_argument('--rate', type=float, default=10.0, help="ticks per simulated second")
+    parser.add_argument('--cruise', type=float, default=50, help="speed counted as time at speed (km/h)")
+    parser.add_argument('--out', help="CSV file for the results of every run")
+    args = parser.parse_args()
+
+    start = perf_counter()
+    rows = run_sweep(args.scenarios, grid(lane_split=args.lane_split, slippery=args.slippery,
+                                          speed_step=args.speed_step),
+                     workers=args.workers, chunksize=args.chunksize, rate=args.rate, cruise=args.cruise)
+    elapsed = perf_counter() - start
+    if args.out:
+        write_table(rows, args.out)
+    print("{:>10} {:>9} {:>10} {:>6} {:>8} {:>13} {:>6} {:>9} {:>14}".format(
+        'LANE SPLIT', 'SLIPPERY', 'SPEED STEP', 'RUNS', 'EVENTS', 'LANE CHANGES', 'STOPS', 'MIN GAP', 'TIME AT SPEED'))
+    for row in summary(rows):
+        print("{lane_split:>10g} {slippery:>9g} {speed_step:>10g} {runs:>6} {events:>8.1f} {lane_changes:>13.2f} "
+              "{stops:>6.2f} {min_gap:>9.1f} {time_at_speed:>14.1f}".format(**row))
+    print(f"\n{len(rows)} runs in {elapsed:.2f} s ({len(rows) / elapsed:,.0f} runs/s)")
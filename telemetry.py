@@ -0,0 +1,193 @@
+"""A binary telemetry recorder for whole drives: the car state at every tick and every event the control unit
+evaluates, as fixed size records written through a memory-mapped file.
+
+Each record is RECORD_SIZE (48) bytes, little endian:
+
+    time            float64  seconds (Unix time, or the simulated time while a SimulationLoop runs)
+    velocity        float64  our car, after the decision
+    position        float64  our car, metres along the road
+    other_velocity  float64  the vehicle's velocity (vehicles), else NaN
+    other_position  float64  the obstacle's or vehicle's position, NaN when unknown
+    code            uint16   obstacle or vehicle type code, or sign code
+    kind            uint8    TICK, OBSTACLE, VEHICLE or SIGN
+    lane            int8     our car, after the decision
+    direction       int8     our car, 0 = N, 1 = S
+    other_lane      int8     the obstacle's or vehicle's lane, else 0
+    other_direction int8     the vehicle's direction, else -1
+    (1 byte padding)
+
+The file starts with a 16 byte header (magic and record count). The type names behind the codes are written to a
+JSON file next to the recording when the recorder is closed. Writing a record is a single struct.pack_into into
+the map; the file grows by doubling. A record whose fields don't fit their types (a lane outside the int8 range,
+say) raises ValueError and isn't counted. read_telemetry returns the records as a NumPy structured array backed by
+the file itself (NumPy is only needed for reading this way), iter_telemetry as plain tuples.
+"""
+
+import json
+import mmap
+import struct
+from math import nan
+from time import time
+
+from history import TypeCodes, direction_code
+
+MAGIC = b'DCTEL1\0\0'
+HEADER = struct.Struct('<8sQ')  # Magic, number of records
+RECORD = struct.Struct('<dddddHBbbbbx')
+RECORD_SIZE = RECORD.size
+
+TICK, OBSTACLE, VEHICLE, SIGN = 0, 1, 2, 3
+
+FIELDS = ('time', 'velocity', 'position', 'other_velocity', 'other_position', 'code', 'kind', 'lane', 'direction',
+          'other_lane', 'other_direction')
+
+
+def record_dtype():
+    """Returns the NumPy dtype of a record."""
+    import numpy as np  # Optional: only needed to read recordings as arrays
+    return np.dtype({'names': list(FIELDS),
+                     'formats': ['<f8'] * 5 + ['<u2', 'u1', 'i1', 'i1', 'i1', 'i1'],
+                     'offsets': [0, 8, 16, 24, 32, 40, 42, 43, 44, 45, 46],
+                     'itemsize': RECORD_SIZE})
+
+
+class TelemetryRecorder:
+    """Appends telemetry records to a memory-mapped file. Use it as a context manager or call close()."""
+
+    def __init__(self, path, obstacle_types=None, vehicle_types=None, capacity=65536, clock=time):
+        self.path = path
+        self.clock = clock  # Returns the time of the event records
+        # Code -> name tables of the sensors (e.g. driverless_car.OBSTACLE_TYPES). Other names get new codes.
+        self.obstacle_types = TypeCodes(obstacle_types or {})
+        self.vehicle_types = TypeCodes(vehicle_types or {})
+        self._file = open(path, 'w+b')
+        self._file.truncate(HEADER.size + capacity * RECORD_SIZE)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        HEADER.pack_into(self._map, 0, MAGIC, 0)
+        self._offset = HEADER.size  # Where the next record goes
+        self._end = len(self._map)
+
+    @property
+    def count(self):
+        return (self._offset - HEADER.size) // RECORD_SIZE
+
+    def _grow(self):
+        """Doubles the size of the file and maps it again."""
+        self.flush()
+        self._map.close()
+        self._file.truncate(HEADER.size + 2 * (self._end - HEADER.size))
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self._end = len(self._map)
+
+    # The record methods are written out one by one, as they run for every tick and every event
+
+    def tick(self, car, when=None):
+        """Records the state of the car."""
+        offset = self._offset
+        if offset == self._end:
+            self._grow()
+        try:
+            RECORD.pack_into(self._map, offset, self.clock() if when is None else when, car.velocity, car.position, nan,
+                             nan, 0, TICK, car.lane, direction_code(car.direction), 0, -1)
+        except struct.error as error:  # The offset stays, so the slot is reused
+            raise ValueError(f"Invalid telemetry record: {error}") from None
+        self._offset = offset + RECORD_SIZE
+
+    def obstacle(self, car, obstacle):
+        """Records an obstacle and the state of the car after the decision on it."""
+        offset = self._offset
+        if offset == self._end:
+            self._grow()
+        position = obstacle.position
+        try:
+            RECORD.pack_into(self._map, offset, self.clock(), car.velocity, car.position, nan,
+                             nan if position is None else position, self.obstacle_types.code(obstacle.type), OBSTACLE,
+                             car.lane, direction_code(car.direction), obstacle.lane, -1)
+        except struct.error as error:  # The offset stays, so the slot is reused
+            raise ValueError(f"Invalid telemetry record: {error}") from None
+        self._offset = offset + RECORD_SIZE
+
+    def vehicle(self, car, vehicle):
+        """Records a vehicle and the state of the car after the decision on it."""
+        offset = self._offset
+        if offset == self._end:
+            self._grow()
+        position = vehicle.position
+        try:
+            RECORD.pack_into(self._map, offset, self.clock(), car.velocity, car.position, vehicle.velocity,
+                             nan if position is None else position, self.vehicle_types.code(vehicle.type), VEHICLE,
+                             car.lane, direction_code(car.direction), vehicle.lane, direction_code(vehicle.direction))
+        except struct.error as error:  # The offset stays, so the slot is reused
+            raise ValueError(f"Invalid telemetry record: {error}") from None
+        self._offset = offset + RECORD_SIZE
+
+    def sign(self, car, sign):
+        """Records a traffic sign and the state of the car after the decision on it."""
+        offset = self._offset
+        if offset == self._end:
+            self._grow()
+        try:
+            RECORD.pack_into(self._map, offset, self.clock(), car.velocity, car.position, nan, nan, sign.type, SIGN,
+                             car.lane, direction_code(car.direction), 0, -1)
+        except struct.error as error:  # The offset stays, so the slot is reused
+            raise ValueError(f"Invalid telemetry record: {error}") from None
+        self._offset = offset + RECORD_SIZE
+
+    def flush(self):
+        """Writes the record count to the header and flushes the map to the file."""
+        HEADER.pack_into(self._map, 0, MAGIC, self.count)
+        self._map.flush()
+
+    def close(self):
+        """Flushes the records, cuts the file to their size and writes the type names next to it."""
+        if self._map.closed:
+            return
+        self.flush()
+        self._map.close()
+        self._file.truncate(HEADER.size + self.count * RECORD_SIZE)
+        self._file.close()
+        with open(self.path + '.json', 'w', encoding='utf-8') as file:
+            json.dump({'obstacle_types': self.obstacle_types.names, 'vehicle_types': self.vehicle_types.names},
+                      file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _count(path):
+    with open(path, 'rb') as file:
+        magic, count = HEADER.unpack(file.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a telemetry recording")
+    return count
+
+
+def read_telemetry(path):
+    """Returns the records of a recording as a read-only NumPy structured array that maps the file."""
+    import numpy as np
+    count = _count(path)
+    if count == 0:
+        return np.empty(0, dtype=record_dtype())
+    return np.memmap(path, dtype=record_dtype(), mode='r', offset=HEADER.size, shape=(count,))
+
+
+def iter_telemetry(path):
+    """Yields the records of a recording as tuples in FIELDS order, without NumPy."""
+    count = _count(path)
+    with open(path, 'rb') as file:
+        if count == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for offset in range(HEADER.size, HEADER.size + count * RECORD_SIZE, RECORD_SIZE):
+                yield RECORD.unpack_from(data, offset)
+
+
+def read_types(path):
+    """Returns the obstacle and vehicle code -> name tables written next to a recording."""
+    with open(path + '.json', encoding='utf-8') as file:
+        tables = json.load(file)
+    return ({int(code): name for code, name in tables['obstacle_types'].items()},
+            {int(code): name for code, name in tables['vehicle_types'].items()})
@@ -0,0 +1,128 @@
+"""The user database: users keyed by username, optionally persisted to an append-only file.
+
+Every change is appended to the file as one JSON line, ["+", name, surname, username] for an added user and
+["-", username] for a deleted one. The file is only read the first time the store is used, and it is rewritten
+without the deleted users once they make up most of it. The paged listings read a sorted list of the usernames,
+built when a page is asked for and kept until the next change.
+"""
+
+import json
+import os
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+from history import Page, page_limit
+
+UserRecord = namedtuple('UserRecord', 'name surname username')
+
+
+class UserStore:
+    """Stores users in a dict keyed by username, so adding, finding and deleting a user takes constant time.
+    user_class is called with (name, surname, username) to rebuild the users read from the file."""
+
+    COMPACT_MIN_RECORDS = 1000  # The file is never compacted while it has fewer records than this
+
+    def __init__(self, path=None, user_class=UserRecord):
+        self._path = path
+        self._user_class = user_class
+        self._users = None  # Loaded on first use
+        self._usernames = None  # The usernames in alphabetical order, or None until a page is asked for
+        self._file = None
+        self._records = 0  # Number of records in the file
+
+    def _load(self):
+        self._users = {}
+        if self._path is None or not os.path.exists(self._path):
+            return
+        with open(self._path) as file:
+            for line in file:
+                record = json.loads(line)
+                if record[0] == "+":
+                    self._users[record[3]] = self._user_class(*record[1:])
+                else:
+                    self._users.pop(record[1], None)
+                self._records += 1
+
+    @property
+    def _db(self):
+        if self._users is None:
+            self._load()
+        return self._users
+
+    def _write(self, record):
+        if self._path is None:
+            return
+        if self._file is None:
+            self._file = open(self._path, 'a')
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        self._records += 1
+        if self._records >= self.COMPACT_MIN_RECORDS and self._records > 2 * len(self._users):
+            self.compact()
+
+    def add(self, user):
+        """Adds a user. Returns False if the username is already taken."""
+        users = self._db
+        if user.username in users:
+            return False
+        users[user.username] = user
+        self._usernames = None
+        self._write(["+", user.name, user.surname, user.username])
+        return True
+
+    def get(self, username):
+        """Returns the user with the given username, or None."""
+        return self._db.get(username)
+
+    def delete(self, username):
+        """Deletes a user. Returns False if there is no such user."""
+        if self._db.pop(username, None) is None:
+            return False
+        self._usernames = None
+        self._write(["-", username])
+        return True
+
+    def page(self, prefix='', after=None, limit=50):
+        """Returns a Page of the users whose username starts with a prefix, in alphabetical order of username.
+        `after` is the cursor of the previous page."""
+        limit = page_limit(limit)
+        users, usernames = self._db, self._usernames
+        if usernames is None:
+            usernames = self._usernames = sorted(users)
+        start = bisect_left(usernames, prefix) if after is None else bisect_right(usernames, after)
+        items = []
+        for index in range(start, min(start + limit + 1, len(usernames))):
+            if not usernames[index].startswith(prefix):
+                break
+            if len(items) == limit:
+                return Page(items, items[-1].username)
+            items.append(users[usernames[index]])
+        return Page(items, None)
+
+    def compact(self):
+        """Rewrites the file so that it only holds the current users."""
+        if self._path is None:
+            return
+        users = self._db
+        self.close()
+        temp_path = self._path + ".tmp"
+        with open(temp_path, 'w') as file:
+            for user in users.values():
+                file.write(json.dumps(["+", user.name, user.surname, user.username]) + "\n")
+        os.replace(temp_path, self._path)
+        self._records = len(users)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __contains__(self, username):
+        return username in self._db
+
+    def __len__(self):
+        return len(self._db)
+
+    def __iter__(self):
+        """Iterates over the users in the order they were added."""
+        return iter(self._db.values())